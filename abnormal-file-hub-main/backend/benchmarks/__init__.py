@@ -0,0 +1,7 @@
+"""Reproducible benchmarks for the ingest, dedup, list, search and stats paths.
+
+    python -m benchmarks run --rows 10000,100000 --output results.json
+    python -m benchmarks compare baseline.json results.json
+
+See the Benchmarks section of the README.
+"""
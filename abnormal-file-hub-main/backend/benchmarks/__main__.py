@@ -0,0 +1,179 @@
+"""Command line entry point: `python -m benchmarks run|compare`, from the backend directory."""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+
+def get_peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup_django(work_dir, cache):
+    os.environ['BENCHMARK_DIR'] = work_dir
+    os.environ['BENCHMARK_CACHE'] = 'True' if cache else 'False'
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command('migrate', verbosity=0)
+
+
+def run_scenario(scenario, rows, iterations):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from .report import summarize
+
+    scenario.setup()
+    for index in range(scenario.warmup):
+        scenario.run(scenario.prepare(index))
+
+    latencies = []
+    queries = 0
+    bytes_moved = 0
+    for index in range(scenario.warmup, scenario.warmup + (iterations or scenario.iterations)):
+        payload = scenario.prepare(index)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            bytes_moved += scenario.run(payload)
+            latencies.append(time.perf_counter() - started)
+        queries += len(captured.captured_queries)
+    return summarize(scenario.name, rows, latencies, queries, bytes_moved, get_peak_rss_mb())
+
+
+def run(options):
+    work_dir = options.work_dir or tempfile.mkdtemp(prefix='filehub-bench-')
+    if os.listdir(work_dir):
+        sys.exit(f"Work directory {work_dir} is not empty")
+    try:
+        setup_django(work_dir, options.cache)
+        import django
+        from django.db import connection
+        from .corpus import Corpus, CorpusLoader
+        from .report import compare, format_comparison, format_results
+        from .scenarios import SCENARIOS
+
+        corpus = Corpus(
+            seed=options.seed, duplicate_ratio=options.duplicate_ratio, size_median=options.size_median,
+            size_sigma=options.size_sigma, max_size=options.max_size, vocabulary=options.vocabulary,
+        )
+        loader = CorpusLoader(corpus, rows_per_day=options.rows_per_day)
+        selected = options.scenarios.split(',') if options.scenarios else None
+        # One instance per scenario for the whole run, so uploads stay new content across scales
+        scenarios = [cls(corpus) for cls in SCENARIOS if selected is None or cls.name in selected]
+
+        results = []
+        for rows in sorted(int(value) for value in options.rows.split(',')):
+            started = time.perf_counter()
+            loader.load(rows - loader.loaded)
+            loader.finish()
+            print(f"Loaded {rows} rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            for scenario in scenarios:
+                results.append(run_scenario(scenario, rows, options.iterations))
+                print(format_results(results[-1:]).splitlines()[-1], file=sys.stderr)
+
+        document = {
+            'meta': {
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'git_commit': get_git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': connection.Database.sqlite_version,
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'metadata_cache': options.cache,
+                'corpus': corpus.get_params(),
+            },
+            'results': results,
+        }
+    finally:
+        if not options.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(format_results(results), file=sys.stderr)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(document, f, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            rows, regressions = compare(json.load(f), document, options.threshold)
+        print(format_comparison(rows), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+def compare_files(options):
+    from .report import compare, format_comparison
+
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    with open(options.current) as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, options.threshold)
+    print(format_comparison(rows))
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {options.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=(
+        "In-process benchmarks of the ingest, dedup, list, search and stats paths "
+        "against a scratch SQLite vault."
+    ))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Seed a vault at each scale and run the scenarios')
+    run_parser.add_argument('--rows', default='10000,100000,1000000', help='Comma-separated row counts')
+    run_parser.add_argument('--scenarios', default='', help='Comma-separated scenario names (default: all)')
+    run_parser.add_argument('--iterations', type=int, default=0, help="Override each scenario's iteration count")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--duplicate-ratio', type=float, default=0.2)
+    run_parser.add_argument('--size-median', type=int, default=64 * 1024, help='Median file size in bytes')
+    run_parser.add_argument('--size-sigma', type=float, default=1.5, help='Log-normal spread of file sizes')
+    run_parser.add_argument('--max-size', type=int, default=16 * 1024 * 1024)
+    run_parser.add_argument('--vocabulary', type=int, default=1000, help='Distinct words used in filenames')
+    run_parser.add_argument('--rows-per-day', type=int, default=10000, help='Upload rate the seeded rows are dated at')
+    run_parser.add_argument('--cache', action='store_true', help='Leave the metadata cache enabled')
+    run_parser.add_argument('--work-dir', help='Empty directory for the vault (default: a temp dir)')
+    run_parser.add_argument('--keep', action='store_true', help='Keep the vault after the run')
+    run_parser.add_argument('--output', help='Write the JSON results here instead of stdout')
+    run_parser.add_argument('--baseline', help='Compare against this results file; exit 1 on regressions')
+    run_parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown as a fraction')
+
+    compare_parser = commands.add_parser('compare', help='Compare two results files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown as a fraction')
+
+    options = parser.parse_args()
+    if options.command == 'run':
+        run(options)
+    else:
+        compare_files(options)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import math
+import random
+import hashlib
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from files.cache import metadata_cache
+from files.hash_index import hash_index
+from files.models import File
+from files.repositories import StatsRepository
+from files.services import FileService
+
+CorpusEntry = namedtuple('CorpusEntry', ['filename', 'file_type', 'size', 'content_key', 'is_duplicate'])
+
+SYLLABLES = [
+    'ka', 'lo', 'mi', 'ren', 'ta', 'vo', 'shi', 'der', 'an', 'pol', 'qu', 'es', 'tor', 'ni', 'ba',
+    'zel', 'ro', 'fin', 'gu', 'at', 'mer', 'op', 'sa', 'lin', 've', 'cor', 'da', 'ix', 'pe', 'hun',
+]
+# Extension and relative frequency
+EXTENSIONS = [
+    ('pdf', 30), ('jpg', 25), ('png', 15), ('txt', 10), ('docx', 8), ('xlsx', 5), ('zip', 4), ('mp4', 3),
+]
+# Seeded rows are back-dated from a fixed day, so rollups and keyset
+# cursors look the same on every run regardless of the wall clock
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class Corpus:
+    """Deterministic stream of synthetic uploads.
+
+    Sizes follow a log-normal distribution around size_median, clamped to
+    max_size. A duplicate_ratio fraction of the entries reuse the content of
+    an earlier entry. Filenames combine two words of a generated vocabulary,
+    so a search for one word matches about 2 / vocabulary of the rows.
+    The same seed and parameters always produce the same entries.
+    """
+
+    def __init__(self, seed=0, duplicate_ratio=0.2, size_median=64 * 1024, size_sigma=1.5,
+                 max_size=16 * 1024 * 1024, vocabulary=1000):
+        self.seed = seed
+        self.duplicate_ratio = duplicate_ratio
+        self.size_median = size_median
+        self.size_sigma = size_sigma
+        self.max_size = max_size
+        self.rng = random.Random(seed)
+        self.words = self.make_vocabulary(vocabulary)
+        self.extensions = [extension for extension, _ in EXTENSIONS]
+        self.extension_weights = [weight for _, weight in EXTENSIONS]
+        self.sizes = array('q')  # size of each content_key
+        self.count = 0
+
+    def get_params(self):
+        return {
+            'seed': self.seed,
+            'duplicate_ratio': self.duplicate_ratio,
+            'size_median': self.size_median,
+            'size_sigma': self.size_sigma,
+            'max_size': self.max_size,
+            'vocabulary': len(self.words),
+        }
+
+    def make_vocabulary(self, count):
+        rng = random.Random(f'{self.seed}:vocabulary')
+        words = []
+        seen = set()
+        while len(words) < count:
+            word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        return words
+
+    def draw_size(self, rng):
+        size = int(rng.lognormvariate(math.log(self.size_median), self.size_sigma))
+        return max(1, min(size, self.max_size))
+
+    def make_filename(self, rng):
+        extension = rng.choices(self.extensions, weights=self.extension_weights)[0]
+        return f"{rng.choice(self.words)}-{rng.choice(self.words)}-{self.count:07d}.{extension}", extension
+
+    def generate(self, count):
+        """Yield the next count entries of the stream."""
+        rng = self.rng
+        for _ in range(count):
+            filename, file_type = self.make_filename(rng)
+            if self.sizes and rng.random() < self.duplicate_ratio:
+                content_key = rng.randrange(len(self.sizes))
+                entry = CorpusEntry(filename, file_type, self.sizes[content_key], content_key, True)
+            else:
+                content_key = len(self.sizes)
+                self.sizes.append(self.draw_size(rng))
+                entry = CorpusEntry(filename, file_type, self.sizes[content_key], content_key, False)
+            self.count += 1
+            yield entry
+
+    def upload(self, index):
+        """(filename, bytes) of the index-th upload, drawn apart from the seeded stream."""
+        rng = random.Random(f'{self.seed}:upload:{index}')
+        filename, _ = self.make_filename(rng)
+        return filename, rng.randbytes(self.draw_size(rng))
+
+    def file_hash(self, content_key):
+        """Stand-in hash for seeded rows, whose content is never written."""
+        return hashlib.sha256(f'{self.seed}:content:{content_key}'.encode()).hexdigest()
+
+    def search_terms(self, count):
+        rng = random.Random(f'{self.seed}:search')
+        return [rng.choice(self.words) for _ in range(count)]
+
+
+class CorpusLoader:
+    """Bulk-load corpus entries as File rows, without blobs on disk.
+
+    Rows are inserted in batches, back-dated at rows_per_day per day from
+    EPOCH, and loading can continue from where a previous load() stopped,
+    so one vault can be grown through several scales. finish() brings
+    reference counts, the stats counters and the hash index in line with
+    the loaded rows.
+    """
+
+    def __init__(self, corpus, batch_size=5000, rows_per_day=10000):
+        self.corpus = corpus
+        self.batch_size = batch_size
+        self.rows_per_day = rows_per_day
+        self.canonical_ids = {}  # content_key -> File id
+        self.file_service = FileService()
+        self.loaded = 0
+
+    def build_row(self, entry):
+        file_hash = self.corpus.file_hash(entry.content_key)
+        file_obj = File(
+            original_filename=entry.filename,
+            file_path=self.file_service.get_blob_path(file_hash, f'.{entry.file_type}'),
+            file_type=entry.file_type,
+            size=entry.size,
+            file_hash=file_hash,
+            is_duplicate=entry.is_duplicate,
+        )
+        if entry.is_duplicate:
+            file_obj.original_file_id = self.canonical_ids[entry.content_key]
+        else:
+            self.canonical_ids[entry.content_key] = file_obj.id
+        return file_obj
+
+    def load(self, count):
+        remaining = count
+        while remaining > 0:
+            batch = [self.build_row(entry) for entry in self.corpus.generate(min(self.batch_size, remaining))]
+            uploaded_at = EPOCH + timedelta(days=self.loaded / self.rows_per_day)
+            with transaction.atomic():
+                File.objects.bulk_create(batch)
+                # uploaded_at is auto_now_add, so it can only be back-dated afterwards
+                File.objects.filter(pk__in=[file_obj.pk for file_obj in batch]).update(uploaded_at=uploaded_at)
+            remaining -= len(batch)
+            self.loaded += len(batch)
+
+    def finish(self):
+        duplicates = (
+            File.objects.filter(original_file=OuterRef('pk'))
+            .order_by()
+            .values('original_file')
+            .annotate(count=Count('*'))
+            .values('count')
+        )
+        with transaction.atomic():
+            File.objects.filter(is_duplicate=False).update(
+                reference_count=Coalesce(Subquery(duplicates, output_field=IntegerField()), 0) + Value(1)
+            )
+        StatsRepository.reconcile(fix=True)
+        if hash_index.enabled:
+            hash_index.warm()
+        metadata_cache.clear()
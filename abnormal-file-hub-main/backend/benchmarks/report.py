@@ -0,0 +1,94 @@
+import math
+
+# Metric, direction that counts as worse, and the slack it is allowed
+# beyond the threshold (query counts are deterministic, so none)
+COMPARED_METRICS = [
+    ('throughput', 'lower', None),
+    ('p50_ms', 'higher', None),
+    ('p99_ms', 'higher', None),
+    ('queries_per_op', 'higher', 0),
+    ('peak_rss_mb', 'higher', None),
+]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(scenario, rows, latencies, queries, bytes_moved, peak_rss_mb):
+    """Result record for one scenario at one scale; latencies are in seconds."""
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {
+        'scenario': scenario,
+        'rows': rows,
+        'iterations': len(latencies),
+        'throughput': round(len(latencies) / total, 2) if total else 0.0,
+        'mb_per_second': round(bytes_moved / total / 2 ** 20, 2) if total else 0.0,
+        'mean_ms': round(total / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        'queries_per_op': round(queries / len(latencies), 2) if latencies else 0.0,
+        'peak_rss_mb': round(peak_rss_mb, 1),
+    }
+
+
+def compare(baseline, current, threshold):
+    """Compare two result documents.
+
+    Returns (rows, regressions): one row per metric of every scenario/scale
+    present in both, and the subset that got worse by more than threshold
+    (a fraction, e.g. 0.1 for 10%).
+    """
+    baseline_results = {(result['scenario'], result['rows']): result for result in baseline['results']}
+    rows = []
+    regressions = []
+    for result in current['results']:
+        before = baseline_results.get((result['scenario'], result['rows']))
+        if before is None:
+            continue
+        for metric, worse, slack in COMPARED_METRICS:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            allowed = threshold if slack is None else slack
+            if worse == 'higher':
+                regressed = new > old * (1 + allowed) if old else new > old
+            else:
+                regressed = new < old * (1 - allowed)
+            row = {
+                'scenario': result['scenario'], 'rows': result['rows'], 'metric': metric,
+                'baseline': old, 'current': new, 'change': round(change, 4), 'regressed': regressed,
+            }
+            rows.append(row)
+            if regressed:
+                regressions.append(row)
+    return rows, regressions
+
+
+def format_results(results):
+    header = f"{'scenario':<18} {'rows':>9} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'queries':>8} {'rss MB':>8}"
+    lines = [header, '-' * len(header)]
+    for result in results:
+        lines.append(
+            f"{result['scenario']:<18} {result['rows']:>9} {result['throughput']:>9} {result['p50_ms']:>9} "
+            f"{result['p99_ms']:>9} {result['queries_per_op']:>8} {result['peak_rss_mb']:>8}"
+        )
+    return '\n'.join(lines)
+
+
+def format_comparison(rows):
+    lines = []
+    for row in rows:
+        flag = 'REGRESSED' if row['regressed'] else ''
+        lines.append(
+            f"{row['scenario']:<18} {row['rows']:>9} {row['metric']:<15} {row['baseline']:>10} -> "
+            f"{row['current']:<10} {row['change']:+.1%} {flag}"
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,130 @@
+from urllib.parse import urlencode
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client
+from files.services import FileService
+
+
+class Scenario:
+    """One benchmarked operation.
+
+    prepare(index) builds the input of an iteration outside the timed
+    region; run(payload) is the timed part and returns the number of bytes
+    it moved (0 when that is not meaningful).
+    """
+    name = None
+    iterations = 100
+    warmup = 3
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def setup(self):
+        pass
+
+    def prepare(self, index):
+        return index
+
+    def run(self, payload):
+        raise NotImplementedError
+
+
+class UniqueUploadScenario(Scenario):
+    """FileService.save_file with content that is not stored yet."""
+    name = 'upload_unique'
+    iterations = 50
+
+    def __init__(self, corpus):
+        super().__init__(corpus)
+        self.file_service = FileService()
+        self.uploads = 0
+
+    def prepare(self, index):
+        # Numbered across scales so every upload of the run is new content
+        filename, content = self.corpus.upload(self.uploads)
+        self.uploads += 1
+        return SimpleUploadedFile(filename, content)
+
+    def run(self, payload):
+        self.file_service.save_file(payload, payload.name)
+        return payload.size
+
+
+class DuplicateUploadScenario(UniqueUploadScenario):
+    """FileService.save_file with content that is already stored (a reference)."""
+    name = 'upload_duplicate'
+
+    def setup(self):
+        self.filename, self.content = self.corpus.upload(f'duplicate-{self.uploads}')
+        self.uploads += 1
+        self.file_service.save_file(SimpleUploadedFile(self.filename, self.content), self.filename)
+
+    def prepare(self, index):
+        return SimpleUploadedFile(f'{index}-{self.filename}', self.content)
+
+
+class ApiScenario(Scenario):
+    """A GET through the full Django stack: routing, view, serializer, rendering."""
+
+    def __init__(self, corpus):
+        super().__init__(corpus)
+        self.client = Client()
+
+    def get(self, url):
+        response = self.client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        return response
+
+
+class ListScenario(ApiScenario):
+    """Walk GET /api/files/ page by page with the keyset cursor."""
+    name = 'list_page'
+    iterations = 50
+    first_page = '/api/files/?page_size=50'
+
+    def setup(self):
+        self.next_url = self.first_page
+
+    def run(self, payload):
+        response = self.get(self.next_url)
+        self.next_url = response.json()['next'] or self.first_page
+        return len(response.content)
+
+
+class SearchScenario(ApiScenario):
+    """GET /api/files/search/ for a filename word; terms are a fixed random draw."""
+    name = 'search_filename'
+    iterations = 50
+
+    def setup(self):
+        self.terms = self.corpus.search_terms(self.iterations + self.warmup)
+
+    def prepare(self, index):
+        return '/api/files/search/?' + urlencode({'filename': self.terms[index % len(self.terms)]})
+
+    def run(self, payload):
+        return len(self.get(payload).content)
+
+
+class StatsScenario(ApiScenario):
+    name = 'stats'
+    iterations = 200
+    url = '/api/files/stats/'
+
+    def run(self, payload):
+        return len(self.get(self.url).content)
+
+
+class StatsBreakdownScenario(StatsScenario):
+    name = 'stats_by_type'
+    url = '/api/files/stats/?group_by=file_type'
+
+
+SCENARIOS = [
+    UniqueUploadScenario,
+    DuplicateUploadScenario,
+    ListScenario,
+    SearchScenario,
+    StatsScenario,
+    StatsBreakdownScenario,
+]
@@ -0,0 +1,23 @@
+"""Settings for `python -m benchmarks`: the project settings on a scratch SQLite vault.
+
+The vault lives in BENCHMARK_DIR (set by benchmarks/__main__.py) so a run
+never touches the configured database or MEDIA_ROOT.
+"""
+import os
+
+_root = os.environ['BENCHMARK_DIR']
+os.environ['DB_ENGINE'] = 'sqlite'
+os.environ['SQLITE_PATH'] = os.path.join(_root, 'db.sqlite3')
+os.environ['INGEST_LOCK_DIR'] = os.path.join(_root, 'media', 'locks')
+
+from core.settings import *  # noqa: E402,F401,F403
+
+DEBUG = False
+MEDIA_ROOT = os.path.join(_root, 'media')
+STATIC_ROOT = os.path.join(_root, 'static')
+# Measure the database paths rather than cache hits unless asked to
+METADATA_CACHE_ENABLED = os.environ.get('BENCHMARK_CACHE', 'False') == 'True'
+
+os.makedirs(os.path.join(MEDIA_ROOT, 'uploads'), exist_ok=True)
+os.makedirs(os.path.join(MEDIA_ROOT, 'tmp'), exist_ok=True)
+os.makedirs(STATIC_ROOT, exist_ok=True)
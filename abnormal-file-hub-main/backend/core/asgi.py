@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setup: the app registry must be ready for the models
+from files.streaming import StreamingUploadApp  # noqa: E402
+
+application = StreamingUploadApp(django_application)
@@ -48,6 +48,7 @@ MIDDLEWARE = [
   "whitenoise.middleware.WhiteNoiseMiddleware",
   "django.contrib.sessions.middleware.SessionMiddleware",
   "corsheaders.middleware.CorsMiddleware",
+  "files.admission.AdmissionMiddleware",
   "django.middleware.common.CommonMiddleware",
   "django.middleware.csrf.CsrfViewMiddleware",
   "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -74,17 +75,63 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "core.wsgi.application"
+ASGI_APPLICATION = "core.asgi.application"
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-  "default": {
-    "ENGINE": "django.db.backends.sqlite3",
-    "NAME": os.path.join(BASE_DIR, 'data', 'db.sqlite3'),
-  }
-}
+# DB_ENGINE=sqlite (default) or postgres. SQLite runs in WAL mode so readers
+# never block the writer, and takes the write lock when a transaction starts
+# (core/sqlite3), so concurrent writers queue for up to SQLITE_BUSY_TIMEOUT_MS.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+      "default": {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get('DB_NAME', 'abnormal_file_hub'),
+        "USER": os.environ.get('DB_USER', ''),
+        "PASSWORD": os.environ.get('DB_PASSWORD', ''),
+        "HOST": os.environ.get('DB_HOST', 'localhost'),
+        "PORT": os.environ.get('DB_PORT', '5432'),
+        # Each worker thread keeps its connection open across requests and
+        # checks it before reuse, so a restarted server costs one failed check
+        "CONN_MAX_AGE": int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        "CONN_HEALTH_CHECKS": True,
+        # Behind PgBouncer in transaction pooling mode, named cursors do not
+        # survive between transactions
+        "DISABLE_SERVER_SIDE_CURSORS": os.environ.get('DB_PGBOUNCER', 'False') == 'True',
+        "OPTIONS": {
+          "connect_timeout": int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+        },
+      }
+    }
+elif DB_ENGINE == 'sqlite':
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))  # 256MB
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 65536))  # 64MB per connection
+    DATABASES = {
+      "default": {
+        "ENGINE": "core.sqlite3",
+        "NAME": os.environ.get('SQLITE_PATH', os.path.join(BASE_DIR, 'data', 'db.sqlite3')),
+        "OPTIONS": {
+          "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+          "transaction_mode": os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+          "init_command": (
+            "PRAGMA journal_mode=WAL;"
+            f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};"
+            f"PRAGMA synchronous={SQLITE_SYNCHRONOUS};"
+            f"PRAGMA mmap_size={SQLITE_MMAP_SIZE};"
+            f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB};"
+            "PRAGMA temp_store=MEMORY"
+          ),
+        },
+      }
+    }
+else:
+    raise ValueError(f"Unknown DB_ENGINE: {DB_ENGINE}")
 
 
 # Password validation
@@ -133,10 +180,180 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 FILE_UPLOAD_PERMISSIONS = 0o644
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
+FILE_UPLOAD_CHUNK_SIZE = int(os.environ.get('FILE_UPLOAD_CHUNK_SIZE', 1048576))  # 1MB read/hash/write unit
+
+# Fan-out of the blob directory tree: "2,2" stores blobs as uploads/ab/cd/<hash><ext>;
+# an empty value keeps the flat uploads/<hash><ext> layout
+FILE_STORE_FANOUT = os.environ.get('FILE_STORE_FANOUT', '2,2')
+
+# Content store: 'file' stores each unique file whole, 'chunked' splits files
+# with a content-defined chunker and stores each distinct chunk once. Chunking
+# runs in the upload's thread at roughly 40 MB/s per core with numpy, 5 MB/s without.
+FILE_STORE_MODE = os.environ.get('FILE_STORE_MODE', 'file')
+CHUNK_STORE_MIN_SIZE = int(os.environ.get('CHUNK_STORE_MIN_SIZE', 16384))  # 16KB
+CHUNK_STORE_AVG_SIZE = int(os.environ.get('CHUNK_STORE_AVG_SIZE', 65536))  # 64KB
+CHUNK_STORE_MAX_SIZE = int(os.environ.get('CHUNK_STORE_MAX_SIZE', 262144))  # 256KB
+
+# At-rest compression of whole-file blobs: zstd when the `zstandard` package is
+# installed, gzip (stdlib zlib) otherwise. Listed types are always compressed,
+# known compressed formats never are, others when a fast probe of the first
+# chunk shrinks below FILE_COMPRESSION_PROBE_RATIO
+FILE_COMPRESSION_ENABLED = os.environ.get('FILE_COMPRESSION_ENABLED', 'False') == 'True'
+FILE_COMPRESSION_CODEC = os.environ.get('FILE_COMPRESSION_CODEC', 'zstd')
+FILE_COMPRESSION_TYPES = os.environ.get(
+    'FILE_COMPRESSION_TYPES',
+    'txt,csv,tsv,json,jsonl,ndjson,log,xml,html,htm,css,js,md,yaml,yml,sql,svg,ini,conf',
+)
+FILE_COMPRESSION_PROBE_SIZE = int(os.environ.get('FILE_COMPRESSION_PROBE_SIZE', 65536))
+FILE_COMPRESSION_PROBE_RATIO = float(os.environ.get('FILE_COMPRESSION_PROBE_RATIO', 0.8))
+# Send stored bytes with Content-Encoding to clients that accept the codec
+FILE_COMPRESSION_PASSTHROUGH = os.environ.get('FILE_COMPRESSION_PASSTHROUGH', 'True') == 'True'
+
+# Download offload: '' streams from Django, 'x-accel' returns X-Accel-Redirect
+# (nginx), 'x-sendfile' returns X-Sendfile (Apache/lighttpd)
+FILE_DOWNLOAD_OFFLOAD = os.environ.get('FILE_DOWNLOAD_OFFLOAD', '')
+FILE_DOWNLOAD_ACCEL_PREFIX = os.environ.get('FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+
+# Maximum number of hashes accepted by POST /api/files/by-hash/
+HASH_LOOKUP_MAX_BATCH = int(os.environ.get('HASH_LOOKUP_MAX_BATCH', 10000))
+
+# Per-worker Bloom filter that lets hash lookups skip the DB on definite misses
+HASH_INDEX_ENABLED = os.environ.get('HASH_INDEX_ENABLED', 'True') == 'True'
+HASH_INDEX_CAPACITY = int(os.environ.get('HASH_INDEX_CAPACITY', 1000000))
+HASH_INDEX_ERROR_RATE = float(os.environ.get('HASH_INDEX_ERROR_RATE', 0.001))
+HASH_INDEX_REFRESH_SECONDS = float(os.environ.get('HASH_INDEX_REFRESH_SECONDS', 2))
+# Full rebuild period, which bounds how long a late-committing row can be missed
+HASH_INDEX_REBUILD_SECONDS = float(os.environ.get('HASH_INDEX_REBUILD_SECONDS', 600))
+
+# Resumable (chunked) upload sessions
+UPLOAD_SESSION_CHUNK_SIZE = int(os.environ.get('UPLOAD_SESSION_CHUNK_SIZE', 8388608))  # 8MB
+UPLOAD_SESSION_MAX_CHUNK_SIZE = int(os.environ.get('UPLOAD_SESSION_MAX_CHUNK_SIZE', 67108864))  # 64MB
+UPLOAD_SESSION_TTL_HOURS = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24))
+
+# Thread pools used by the ASGI streaming path: reads (downloads) and ingest
+# (hashing and writing upload bodies) are kept apart so reads never queue
+# behind uploads
+ASYNC_IO_THREADS = int(os.environ.get('ASYNC_IO_THREADS', 32))
+ASYNC_INGEST_THREADS = int(os.environ.get('ASYNC_INGEST_THREADS', 8))
+
+# Batch uploads (POST /api/files/batch/)
+BATCH_UPLOAD_WORKERS = int(os.environ.get('BATCH_UPLOAD_WORKERS', os.cpu_count() or 4))
+BATCH_UPLOAD_MAX_FILES = int(os.environ.get('BATCH_UPLOAD_MAX_FILES', 10000))
+DATA_UPLOAD_MAX_NUMBER_FILES = BATCH_UPLOAD_MAX_FILES
+
+# Most files one archive download (GET/POST /api/files/archive/) may contain
+ARCHIVE_MAX_FILES = int(os.environ.get('ARCHIVE_MAX_FILES', 10000))
+
+# Deleted content stays on disk at least this long before `sweep_blobs` removes it
+BLOB_SWEEP_GRACE_SECONDS = int(os.environ.get('BLOB_SWEEP_GRACE_SECONDS', 300))
+BLOB_SWEEP_INTERVAL_SECONDS = int(os.environ.get('BLOB_SWEEP_INTERVAL_SECONDS', 60))
+
+# Store scrubber (`manage.py scrub_store`): read budget and hashing threads
+SCRUB_MAX_BYTES_PER_SECOND = int(os.environ.get('SCRUB_MAX_BYTES_PER_SECOND', 20971520))  # 20MB/s, 0 = unlimited
+SCRUB_WORKERS = int(os.environ.get('SCRUB_WORKERS', 2))
+SCRUB_INTERVAL_SECONDS = int(os.environ.get('SCRUB_INTERVAL_SECONDS', 300))
+
+# Per-hash ingest locks (flock files); must be shared by all workers on the host
+INGEST_LOCK_DIR = os.environ.get('INGEST_LOCK_DIR', os.path.join(MEDIA_ROOT, 'locks'))
+
+# Upload admission control (files/admission.py), shared by the workers on a
+# host through slot files in INGEST_LOCK_DIR. Uploads over a client's own
+# limits get 429, over the global limits or disk watermarks 503, both with
+# Retry-After. Uploads stop when free disk space would drop below
+# ADMISSION_DISK_MIN_FREE and resume above ADMISSION_DISK_RESUME_FREE (0 = no check).
+# ADMISSION_CLIENT_HEADER identifies clients behind a proxy: use a header the
+# proxy overwrites (X-Real-IP with the bundled nginx.conf), since the first hop
+# of X-Forwarded-For is whatever the client sent.
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'True') == 'True'
+ADMISSION_MAX_UPLOADS = int(os.environ.get('ADMISSION_MAX_UPLOADS', 8))
+ADMISSION_MAX_UPLOADS_PER_CLIENT = int(os.environ.get('ADMISSION_MAX_UPLOADS_PER_CLIENT', 4))
+ADMISSION_MAX_BYTES_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_BYTES_IN_FLIGHT', 2147483648))  # 2GB
+ADMISSION_MAX_BYTES_PER_CLIENT = int(os.environ.get('ADMISSION_MAX_BYTES_PER_CLIENT', 1073741824))  # 1GB
+ADMISSION_DISK_MIN_FREE = int(os.environ.get('ADMISSION_DISK_MIN_FREE', 1073741824))  # 1GB
+ADMISSION_DISK_RESUME_FREE = int(os.environ.get('ADMISSION_DISK_RESUME_FREE', 2147483648))  # 2GB
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 5))
+ADMISSION_CLIENT_HEADER = os.environ.get('ADMISSION_CLIENT_HEADER', '')
+
+# Metrics (files/metrics.py), scraped per worker from /metrics. Timing headers
+# expose ingest stage timings to clients, so they are off by default.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_TIMING_HEADERS = os.environ.get('METRICS_TIMING_HEADERS', 'False') == 'True'
+# Fraction of requests logged as structured `request` events at INFO
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get('REQUEST_LOG_SAMPLE_RATE', 0.1))
+
+# Caches: a per-process default; set CACHE_REDIS_URL (e.g. redis://127.0.0.1:6379/1,
+# needs the `redis` package) to add a 'shared' cache used by all workers
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', '')
+if CACHE_REDIS_URL:
+    CACHES['shared'] = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_REDIS_URL}
+
+# Metadata cache (files/cache.py): a per-worker LRU in front of an optional
+# shared tier, the Django cache named by METADATA_CACHE_SHARED_ALIAS ('' = none).
+# Local entries expire after METADATA_CACHE_LOCAL_TTL seconds at most, which
+# bounds how long another worker's change can go unseen.
+METADATA_CACHE_ENABLED = os.environ.get('METADATA_CACHE_ENABLED', 'True') == 'True'
+METADATA_CACHE_SHARED_ALIAS = os.environ.get('METADATA_CACHE_SHARED_ALIAS', 'shared' if CACHE_REDIS_URL else '')
+METADATA_CACHE_MAX_ENTRIES = int(os.environ.get('METADATA_CACHE_MAX_ENTRIES', 10000))
+METADATA_CACHE_LOCAL_TTL = int(os.environ.get('METADATA_CACHE_LOCAL_TTL', 10))
+METADATA_CACHE_FILE_TTL = int(os.environ.get('METADATA_CACHE_FILE_TTL', 3600))
+METADATA_CACHE_STATS_TTL = int(os.environ.get('METADATA_CACHE_STATS_TTL', 30))
+METADATA_CACHE_SEARCH_TTL = int(os.environ.get('METADATA_CACHE_SEARCH_TTL', 60))
+
+# Where blob bytes live: 'local' (MEDIA_ROOT), 's3' (an S3-compatible bucket,
+# needs the `boto3` package) or 'tiered' (new and recently read blobs on local
+# disk, the rest moved to S3 by `manage.py tier_blobs`)
+FILE_STORAGE_BACKEND = os.environ.get('FILE_STORAGE_BACKEND', 'local')
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_PREFIX = os.environ.get('S3_PREFIX', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', '')
+S3_REGION = os.environ.get('S3_REGION', '')
+S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID', '')
+S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY', '')
+S3_MULTIPART_PART_SIZE = int(os.environ.get('S3_MULTIPART_PART_SIZE', 8388608))  # 8MB
+# Hot tier root for 'tiered' (default MEDIA_ROOT); blobs unread for
+# TIER_COLD_AFTER_DAYS move to S3. Reads refresh a blob's access time at most
+# once per TIER_TOUCH_SECONDS, so noatime mounts still work.
+TIER_HOT_ROOT = os.environ.get('TIER_HOT_ROOT', '')
+TIER_COLD_AFTER_DAYS = float(os.environ.get('TIER_COLD_AFTER_DAYS', 30))
+TIER_TOUCH_SECONDS = int(os.environ.get('TIER_TOUCH_SECONDS', 3600))
+
+# Post-upload job queue (files/jobs.py), processed by `manage.py run_jobs`.
+# 'database' needs nothing else; 'redis' keeps the queue in JOB_QUEUE_REDIS_URL
+# (needs the `redis` package). POST_UPLOAD_JOBS are enqueued for new content.
+JOB_QUEUE_BACKEND = os.environ.get('JOB_QUEUE_BACKEND', 'database')
+JOB_QUEUE_REDIS_URL = os.environ.get('JOB_QUEUE_REDIS_URL', CACHE_REDIS_URL)
+POST_UPLOAD_JOBS = [kind for kind in os.environ.get('POST_UPLOAD_JOBS', 'verify,preview').split(',') if kind]
+# A claimed job not finished within JOB_VISIBILITY_TIMEOUT seconds is handed
+# to another worker; failures retry after JOB_RETRY_BACKOFF * 2^(attempt-1)
+# seconds, capped at JOB_RETRY_BACKOFF_MAX, up to JOB_MAX_ATTEMPTS attempts
+JOB_VISIBILITY_TIMEOUT = int(os.environ.get('JOB_VISIBILITY_TIMEOUT', 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', 10))
+JOB_RETRY_BACKOFF_MAX = float(os.environ.get('JOB_RETRY_BACKOFF_MAX', 3600))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+
+# Previews (files/previews.py): image thumbnails and PDF first pages at one
+# of PREVIEW_SIZES pixels, and the first PREVIEW_TEXT_BYTES of text files.
+# Images and PDFs are rendered in a pool of PREVIEW_PROCESSES processes;
+# sources over PREVIEW_MAX_SOURCE_SIZE bytes are not rendered. A render is
+# stopped after PREVIEW_RENDER_TIMEOUT seconds of work; a request gives up
+# with 503 after PREVIEW_WAIT_TIMEOUT seconds including time in the queue.
+PREVIEW_SIZES = [int(size) for size in os.environ.get('PREVIEW_SIZES', '128,256,512').split(',') if size]
+PREVIEW_DEFAULT_SIZE = int(os.environ.get('PREVIEW_DEFAULT_SIZE', 256))
+PREVIEW_TEXT_BYTES = int(os.environ.get('PREVIEW_TEXT_BYTES', 4096))
+PREVIEW_PROCESSES = int(os.environ.get('PREVIEW_PROCESSES', 2))
+PREVIEW_RENDER_TIMEOUT = float(os.environ.get('PREVIEW_RENDER_TIMEOUT', 30))
+PREVIEW_WAIT_TIMEOUT = float(os.environ.get('PREVIEW_WAIT_TIMEOUT', 60))
+PREVIEW_RETRY_AFTER = int(os.environ.get('PREVIEW_RETRY_AFTER', 5))
+PREVIEW_MAX_SOURCE_SIZE = int(os.environ.get('PREVIEW_MAX_SOURCE_SIZE', 50 * 1024 * 1024))
 
 # Ensure media directory exists
 os.makedirs(MEDIA_ROOT, exist_ok=True)
 os.makedirs(os.path.join(MEDIA_ROOT, 'uploads'), exist_ok=True)
+os.makedirs(os.path.join(MEDIA_ROOT, 'tmp'), exist_ok=True)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
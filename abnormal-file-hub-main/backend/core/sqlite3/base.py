@@ -0,0 +1,39 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Django's SQLite backend plus the `init_command` and `transaction_mode`
+    OPTIONS that Django 5.1 added, so settings carry over unchanged on upgrade.
+
+    init_command holds ';'-separated statements (e.g. PRAGMAs) run on every
+    new connection. transaction_mode='IMMEDIATE' takes the write lock when a
+    transaction starts, so concurrent writers wait for busy_timeout instead
+    of failing with "database is locked" when a read lock cannot be upgraded.
+    """
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.init_command = kwargs.pop('init_command', '')
+        transaction_mode = kwargs.pop('transaction_mode', None)
+        if transaction_mode is not None and transaction_mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES transaction_mode must be one of {', '.join(TRANSACTION_MODES)}"
+            )
+        self.transaction_mode = transaction_mode.upper() if transaction_mode else None
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for statement in self.init_command.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
@@ -0,0 +1,312 @@
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import threading
+from collections import Counter
+from django.conf import settings
+from django.http import JsonResponse
+from .locks import NAMESPACE_ADMISSION, HashLock
+from .metrics import ADMISSION_REJECTIONS
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+REASON_CLIENT_UPLOADS = 'client_uploads'
+REASON_CLIENT_BYTES = 'client_bytes'
+REASON_UPLOADS = 'uploads'
+REASON_BYTES = 'bytes'
+REASON_DISK = 'disk'
+
+# Requests that write upload bodies to disk; everything else (downloads,
+# listings, stats) bypasses admission entirely
+UPLOAD_ROUTES = [
+    ('POST', re.compile(r'^/api/files/$')),
+    ('POST', re.compile(r'^/api/files/batch/$')),
+    ('PUT', re.compile(r'^/api/uploads/[0-9a-fA-F-]+/chunks/\d+/$')),
+    ('POST', re.compile(r'^/api/uploads/[0-9a-fA-F-]+/commit/$')),
+    ('POST', re.compile(r'^/api/stream/files/$')),
+    ('PUT', re.compile(r'^/api/stream/files/$')),
+]
+
+
+def needs_admission(method, path):
+    if not settings.ADMISSION_ENABLED:
+        return False
+    return any(method == route_method and pattern.match(path) for route_method, pattern in UPLOAD_ROUTES)
+
+
+def get_client_id(remote_addr, forwarded=None):
+    """Who the per-client limits apply to: the first hop of ADMISSION_CLIENT_HEADER when set."""
+    if forwarded:
+        return forwarded.split(',')[0].strip()[:100]
+    return remote_addr or 'unknown'
+
+
+def parse_content_length(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class AdmissionRejected(Exception):
+    """An upload turned away before its body is read: 429 for the client's own limits, else 503."""
+
+    def __init__(self, reason, message, status):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+
+    @property
+    def retry_after(self):
+        return settings.ADMISSION_RETRY_AFTER
+
+    def get_payload(self):
+        return {'error': str(self), 'reason': self.reason, 'retry_after': self.retry_after}
+
+
+class Ticket:
+    """An admitted upload's slot, held until release()."""
+
+    def __init__(self, controller, slot, handle):
+        self.controller = controller
+        self.slot = slot
+        self.handle = handle
+
+    def release(self):
+        if self.handle is not None:
+            self.controller.release_slot(self.slot, self.handle)
+            self.handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """Fast accept/reject for uploads, shared by every worker on the host.
+
+    Each admitted upload holds one of ADMISSION_MAX_UPLOADS slot files in
+    INGEST_LOCK_DIR with flock(2) and records its client and declared size
+    in it. The kernel drops the lock when a worker dies, so a crashed
+    upload can never leak a slot. Admission scans the slots under a short
+    HashLock, so the per-client and bytes-in-flight totals it checks are
+    exact across workers. Without fcntl the slots are per process.
+
+    Disk space uses two watermarks: uploads stop when free space (less the
+    bytes already admitted) would fall below ADMISSION_DISK_MIN_FREE, and
+    resume only once it is back above ADMISSION_DISK_RESUME_FREE, so the
+    vault does not flap around a single threshold. Each worker keeps its
+    own watermark state; they see the same disk, so they agree.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.disk_low = False
+        self.local_slots = {}
+        self.rejections = Counter()
+        self.admitted = 0
+
+    def get_slot_path(self, slot):
+        return os.path.join(settings.INGEST_LOCK_DIR, f"admission-slot-{slot:03d}.lock")
+
+    def try_hold(self, slot):
+        """A handle on slot if it is free, else None."""
+        if fcntl is None:
+            with self.lock:
+                if slot in self.local_slots:
+                    return None
+                self.local_slots[slot] = {}
+                return slot
+        fd = os.open(self.get_slot_path(slot), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def read_entry(self, slot):
+        if fcntl is None:
+            with self.lock:
+                return dict(self.local_slots.get(slot, {}))
+        try:
+            with open(self.get_slot_path(slot), 'rb') as f:
+                return json.loads(f.read() or b'{}')
+        except (OSError, ValueError):
+            return {}
+
+    def write_entry(self, slot, handle, entry):
+        if fcntl is None:
+            with self.lock:
+                self.local_slots[slot] = entry
+            return
+        data = json.dumps(entry).encode()
+        os.ftruncate(handle, 0)
+        os.pwrite(handle, data, 0)
+
+    def release_slot(self, slot, handle):
+        if fcntl is None:
+            with self.lock:
+                self.local_slots.pop(slot, None)
+            return
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        os.close(handle)
+
+    def scan(self, keep_free=False):
+        """(entries of held slots, (slot, handle) of one free slot or None)."""
+        held = []
+        free = None
+        for slot in range(settings.ADMISSION_MAX_UPLOADS):
+            handle = self.try_hold(slot)
+            if handle is None:
+                held.append(self.read_entry(slot))
+            elif keep_free and free is None:
+                free = (slot, handle)
+            else:
+                self.release_slot(slot, handle)
+        return held, free
+
+    def get_disk_free(self):
+        try:
+            return shutil.disk_usage(settings.MEDIA_ROOT).free
+        except OSError:
+            return None
+
+    def check_disk(self, pending_bytes):
+        """Update the watermark state; True while uploads may write pending_bytes more."""
+        if not settings.ADMISSION_DISK_MIN_FREE:
+            return True
+        free = self.get_disk_free()
+        if free is None:
+            return True
+        available = free - pending_bytes
+        with self.lock:
+            if self.disk_low and available >= settings.ADMISSION_DISK_RESUME_FREE:
+                logger.info("Free disk space back to %d bytes, accepting uploads again", available)
+                self.disk_low = False
+            elif not self.disk_low and available < settings.ADMISSION_DISK_MIN_FREE:
+                logger.warning("Free disk space down to %d bytes, refusing uploads", available)
+                self.disk_low = True
+            return not self.disk_low
+
+    def reject(self, reason, message, status):
+        with self.lock:
+            self.rejections[reason] += 1
+        ADMISSION_REJECTIONS.inc(reason)
+        return AdmissionRejected(reason, message, status)
+
+    def admit(self, client, size):
+        """A Ticket for an upload of size bytes from client; raises AdmissionRejected."""
+        with HashLock(['admission'], NAMESPACE_ADMISSION):
+            held, free = self.scan(keep_free=True)
+            try:
+                client_entries = [entry for entry in held if entry.get('client') == client]
+                client_bytes = sum(entry.get('bytes', 0) for entry in client_entries)
+                in_flight = sum(entry.get('bytes', 0) for entry in held)
+                if len(client_entries) >= settings.ADMISSION_MAX_UPLOADS_PER_CLIENT:
+                    raise self.reject(
+                        REASON_CLIENT_UPLOADS,
+                        f"Too many concurrent uploads from this client (limit "
+                        f"{settings.ADMISSION_MAX_UPLOADS_PER_CLIENT})",
+                        429,
+                    )
+                # The byte limits only hold back uploads that are not alone,
+                # so a single file larger than a limit can still get in
+                if client_bytes + size > settings.ADMISSION_MAX_BYTES_PER_CLIENT and client_entries:
+                    raise self.reject(REASON_CLIENT_BYTES, "Too many bytes in flight from this client", 429)
+                if free is None:
+                    raise self.reject(REASON_UPLOADS, "Too many concurrent uploads, try again later", 503)
+                if in_flight + size > settings.ADMISSION_MAX_BYTES_IN_FLIGHT and held:
+                    raise self.reject(REASON_BYTES, "Too many upload bytes in flight, try again later", 503)
+                if not self.check_disk(in_flight + size):
+                    raise self.reject(REASON_DISK, "Not enough free disk space, try again later", 503)
+            except AdmissionRejected:
+                if free is not None:
+                    self.release_slot(*free)
+                raise
+            slot, handle = free
+            self.write_entry(slot, handle, {'client': client, 'bytes': size, 'since': time.time()})
+        with self.lock:
+            self.admitted += 1
+        return Ticket(self, slot, handle)
+
+    def get_state(self):
+        """Host-wide slot usage plus this worker's disk state and counters, for dashboards."""
+        with HashLock(['admission'], NAMESPACE_ADMISSION):
+            held, _ = self.scan()
+        in_flight = sum(entry.get('bytes', 0) for entry in held)
+        clients = {}
+        for entry in held:
+            client = clients.setdefault(entry.get('client', 'unknown'), {'uploads': 0, 'bytes': 0})
+            client['uploads'] += 1
+            client['bytes'] += entry.get('bytes', 0)
+        accepting = self.check_disk(in_flight)
+        now = time.time()
+        return {
+            'enabled': settings.ADMISSION_ENABLED,
+            'uploads': {
+                'active': len(held),
+                'limit': settings.ADMISSION_MAX_UPLOADS,
+                'per_client_limit': settings.ADMISSION_MAX_UPLOADS_PER_CLIENT,
+                'oldest_seconds': round(now - min(entry.get('since', now) for entry in held), 3) if held else 0,
+            },
+            'bytes_in_flight': {
+                'active': in_flight,
+                'limit': settings.ADMISSION_MAX_BYTES_IN_FLIGHT,
+                'per_client_limit': settings.ADMISSION_MAX_BYTES_PER_CLIENT,
+            },
+            'clients': clients,
+            'disk': {
+                'free_bytes': self.get_disk_free(),
+                'min_free_bytes': settings.ADMISSION_DISK_MIN_FREE,
+                'resume_free_bytes': settings.ADMISSION_DISK_RESUME_FREE,
+                'accepting': accepting,
+            },
+            'admitted': self.admitted,
+            'rejections': dict(self.rejections),
+        }
+
+
+admission = AdmissionController()
+
+
+def rejection_response(rejected):
+    response = JsonResponse(rejected.get_payload(), status=rejected.status)
+    response['Retry-After'] = str(rejected.retry_after)
+    return response
+
+
+class AdmissionMiddleware:
+    """Admission for uploads served over WSGI, before the body is read.
+
+    Under ASGI, StreamingUploadApp admits uploads before Django's handler
+    reads the body, so requests arriving with an ASGI scope are passed on.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if getattr(request, 'scope', None) is not None or not needs_admission(request.method, request.path):
+            return self.get_response(request)
+        forwarded = request.headers.get(settings.ADMISSION_CLIENT_HEADER) if settings.ADMISSION_CLIENT_HEADER else None
+        client = get_client_id(request.META.get('REMOTE_ADDR'), forwarded)
+        try:
+            ticket = admission.admit(client, parse_content_length(request.META.get('CONTENT_LENGTH')))
+        except AdmissionRejected as e:
+            return rejection_response(e)
+        with ticket:
+            return self.get_response(request)
@@ -0,0 +1,457 @@
+import os
+import time
+import errno
+import heapq
+import logging
+import tempfile
+import threading
+from collections import namedtuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import boto3
+except ImportError:  # optional dependency
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_LOCAL = 'local'
+BACKEND_S3 = 's3'
+BACKEND_TIERED = 'tiered'
+
+# S3 refuses multipart parts below 5MB (except the last) and single copies above 5GB
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_MAX_COPY_SIZE = 5 * 1024 * 1024 * 1024
+
+BlobStat = namedtuple('BlobStat', ['size', 'modified_at', 'accessed_at'])
+
+
+def iter_file(f, chunk_size):
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        yield data
+
+
+class LocalBlobStore:
+    """Blobs as files under a root directory; keys are relative paths.
+
+    Writes go to a temp file in the target directory and are renamed into
+    place, so a blob is either absent or complete.
+    """
+    name = BACKEND_LOCAL
+
+    def __init__(self, root=None):
+        self.configured_root = root
+
+    @property
+    def root(self):
+        return self.configured_root or settings.MEDIA_ROOT
+
+    def local_path(self, key):
+        return os.path.join(self.root, key)
+
+    def put_file(self, temp_path, key):
+        """Take ownership of a finished temp file; a rename when it is on the same filesystem."""
+        full_path = self.local_path(key)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        try:
+            os.replace(temp_path, full_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            with open(temp_path, 'rb') as f:
+                self.put_stream(key, iter_file(f, settings.FILE_UPLOAD_CHUNK_SIZE))
+            os.remove(temp_path)
+
+    def put_stream(self, key, chunks):
+        full_path = self.local_path(key)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for data in chunks:
+                    f.write(data)
+            os.chmod(temp_path, settings.FILE_UPLOAD_PERMISSIONS)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def open(self, key):
+        """Binary file object positioned at 0; FileNotFoundError if absent."""
+        return open(self.local_path(key), 'rb')
+
+    def iter_range(self, key, start, end, chunk_size):
+        """Yield bytes start..end (inclusive) of the blob."""
+        remaining = end - start + 1
+        with self.open(key) as f:
+            if start:
+                f.seek(start)
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def stat(self, key):
+        try:
+            st = os.stat(self.local_path(key))
+        except FileNotFoundError:
+            return None
+        return BlobStat(st.st_size, st.st_mtime, st.st_atime)
+
+    def delete(self, key):
+        """Remove a blob; returns False if it was already gone."""
+        try:
+            os.remove(self.local_path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def copy(self, source_key, target_key):
+        """Give a blob a second key; a hard link, so no data is copied."""
+        full_path = self.local_path(target_key)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if not os.path.exists(full_path):
+            os.link(self.local_path(source_key), full_path)
+
+    def touch(self, key):
+        """Record a read for tiering; the access time is only rewritten when it is stale."""
+        full_path = self.local_path(key)
+        try:
+            st = os.stat(full_path)
+            now = time.time()
+            if now - st.st_atime > settings.TIER_TOUCH_SECONDS:
+                os.utime(full_path, (now, st.st_mtime))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix, after=None):
+        """Yield (key, BlobStat) under prefix in key order, starting past after."""
+        yield from self._walk(prefix.rstrip('/'), after)
+
+    def _walk(self, relative_dir, after):
+        try:
+            # A directory sorts as "name/", so the walk visits keys in plain string order
+            entries = sorted(
+                os.scandir(self.local_path(relative_dir)),
+                key=lambda entry: entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name,
+            )
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            key = os.path.join(relative_dir, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                if after and key + '/' < after and not after.startswith(key + '/'):
+                    continue
+                yield from self._walk(key, after)
+            elif entry.is_file(follow_symlinks=False) and (not after or key > after):
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                yield key, BlobStat(st.st_size, st.st_mtime, st.st_atime)
+
+
+def is_not_found(error):
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+
+class S3BlobStore:
+    """Blobs as objects in an S3-compatible bucket (AWS, MinIO, Ceph RGW, ...).
+
+    Uploads use multipart upload once they exceed one part, reads are ranged
+    GETs, and listing uses StartAfter, so the scrubber's cursor maps straight
+    onto the API. Needs the optional `boto3` package unless a client is given.
+    """
+    name = BACKEND_S3
+
+    def __init__(self, bucket=None, prefix=None, client=None, part_size=None):
+        self.bucket = bucket or settings.S3_BUCKET
+        self.prefix = (settings.S3_PREFIX if prefix is None else prefix).strip('/')
+        self.part_size = max(part_size or settings.S3_MULTIPART_PART_SIZE, S3_MIN_PART_SIZE)
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    if boto3 is None:
+                        raise ImproperlyConfigured("FILE_STORAGE_BACKEND 's3' needs the boto3 package")
+                    if not self.bucket:
+                        raise ImproperlyConfigured("FILE_STORAGE_BACKEND 's3' needs S3_BUCKET")
+                    self._client = boto3.client(
+                        's3',
+                        endpoint_url=settings.S3_ENDPOINT_URL or None,
+                        region_name=settings.S3_REGION or None,
+                        aws_access_key_id=settings.S3_ACCESS_KEY_ID or None,
+                        aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY or None,
+                    )
+        return self._client
+
+    def object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def blob_key(self, object_key):
+        return object_key[len(self.prefix) + 1:] if self.prefix else object_key
+
+    def local_path(self, key):
+        return None
+
+    def put_file(self, temp_path, key):
+        with open(temp_path, 'rb') as f:
+            self.put_stream(key, iter_file(f, settings.FILE_UPLOAD_CHUNK_SIZE))
+        os.remove(temp_path)
+
+    def put_stream(self, key, chunks):
+        """Upload chunks; a single PUT if they fit in one part, multipart otherwise."""
+        object_key = self.object_key(key)
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            for data in chunks:
+                buffer += data
+                while len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = self.client.create_multipart_upload(
+                            Bucket=self.bucket, Key=object_key
+                        )['UploadId']
+                    parts.append(self.upload_part(object_key, upload_id, len(parts) + 1, bytes(buffer[:self.part_size])))
+                    del buffer[:self.part_size]
+            if upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=object_key, Body=bytes(buffer))
+                return
+            if buffer:
+                parts.append(self.upload_part(object_key, upload_id, len(parts) + 1, bytes(buffer)))
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=object_key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            if upload_id is not None:
+                try:
+                    self.client.abort_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id)
+                except Exception as e:
+                    logger.error("Error aborting multipart upload of %s: %s", object_key, e)
+            raise
+
+    def upload_part(self, object_key, upload_id, number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=object_key, UploadId=upload_id, PartNumber=number, Body=data
+        )
+        return {'ETag': response['ETag'], 'PartNumber': number}
+
+    def get_object(self, key, **kwargs):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key), **kwargs)
+        except Exception as e:
+            if is_not_found(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def open(self, key):
+        return self.get_object(key)['Body']
+
+    def iter_range(self, key, start, end, chunk_size):
+        body = self.get_object(key, Range=f'bytes={start}-{end}')['Body']
+        try:
+            yield from iter_file(body, chunk_size)
+        finally:
+            body.close()
+
+    def stat(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception as e:
+            if is_not_found(e):
+                return None
+            raise
+        modified_at = response['LastModified'].timestamp()
+        return BlobStat(response['ContentLength'], modified_at, modified_at)
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    def delete(self, key):
+        # DELETE succeeds whether or not the object existed
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+        return True
+
+    def copy(self, source_key, target_key):
+        """Server-side copy; objects above 5GB are copied part by part."""
+        source = {'Bucket': self.bucket, 'Key': self.object_key(source_key)}
+        target_key = self.object_key(target_key)
+        stat = self.stat(source_key)
+        if stat is None:
+            raise FileNotFoundError(source_key)
+        if stat.size <= S3_MAX_COPY_SIZE:
+            self.client.copy_object(Bucket=self.bucket, Key=target_key, CopySource=source)
+            return
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=target_key)['UploadId']
+        try:
+            parts = []
+            part_size = max(self.part_size, stat.size // 10000 + 1)
+            for number, start in enumerate(range(0, stat.size, part_size), start=1):
+                end = min(start + part_size, stat.size) - 1
+                response = self.client.upload_part_copy(
+                    Bucket=self.bucket, Key=target_key, UploadId=upload_id, PartNumber=number,
+                    CopySource=source, CopySourceRange=f'bytes={start}-{end}',
+                )
+                parts.append({'ETag': response['CopyPartResult']['ETag'], 'PartNumber': number})
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=target_key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=target_key, UploadId=upload_id)
+            raise
+
+    def touch(self, key):
+        pass
+
+    def list(self, prefix, after=None):
+        kwargs = {'Bucket': self.bucket, 'Prefix': self.object_key(prefix.rstrip('/') + '/')}
+        if after:
+            kwargs['StartAfter'] = self.object_key(after)
+        while True:
+            response = self.client.list_objects_v2(**kwargs)
+            for item in response.get('Contents', []):
+                modified_at = item['LastModified'].timestamp()
+                yield self.blob_key(item['Key']), BlobStat(item['Size'], modified_at, modified_at)
+            if not response.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+
+class TieredBlobStore:
+    """Hot local tier in front of a cold object tier.
+
+    New blobs land on the hot tier and reads refresh their access time;
+    `manage.py tier_blobs` moves blobs not read for TIER_COLD_AFTER_DAYS to
+    the cold tier. Reads fall through to the cold tier, so a blob is
+    readable throughout a move.
+    """
+    name = BACKEND_TIERED
+
+    def __init__(self, hot, cold):
+        self.hot = hot
+        self.cold = cold
+
+    def local_path(self, key):
+        return self.hot.local_path(key) if self.hot.exists(key) else None
+
+    def put_file(self, temp_path, key):
+        self.hot.put_file(temp_path, key)
+
+    def put_stream(self, key, chunks):
+        self.hot.put_stream(key, chunks)
+
+    def open(self, key):
+        try:
+            f = self.hot.open(key)
+        except FileNotFoundError:
+            return self.cold.open(key)
+        self.hot.touch(key)
+        return f
+
+    def iter_range(self, key, start, end, chunk_size):
+        try:
+            blocks = self.hot.iter_range(key, start, end, chunk_size)
+            first = next(blocks, None)
+        except FileNotFoundError:
+            yield from self.cold.iter_range(key, start, end, chunk_size)
+            return
+        self.hot.touch(key)
+        if first is not None:
+            yield first
+            yield from blocks
+
+    def stat(self, key):
+        return self.hot.stat(key) or self.cold.stat(key)
+
+    def exists(self, key):
+        return self.hot.exists(key) or self.cold.exists(key)
+
+    def delete(self, key):
+        deleted = self.hot.delete(key)
+        return self.cold.delete(key) or deleted
+
+    def copy(self, source_key, target_key):
+        if self.hot.exists(source_key):
+            self.hot.copy(source_key, target_key)
+        else:
+            self.cold.copy(source_key, target_key)
+
+    def touch(self, key):
+        self.hot.touch(key)
+
+    def list(self, prefix, after=None):
+        """Keys of both tiers in order; a blob caught mid-move is listed once."""
+        previous = None
+        for key, stat in heapq.merge(self.hot.list(prefix, after), self.cold.list(prefix, after), key=lambda item: item[0]):
+            if key != previous:
+                yield key, stat
+            previous = key
+
+    def iter_cold_candidates(self, prefix, cutoff):
+        """Hot-tier keys under prefix not read since cutoff (a timestamp)."""
+        for key, stat in self.hot.list(prefix):
+            if max(stat.accessed_at, stat.modified_at) < cutoff:
+                yield key, stat
+
+    def demote(self, key):
+        """Copy a hot blob to the cold tier, then drop the hot copy.
+
+        Returns False if the blob left the hot tier meanwhile (e.g. it was
+        swept), in which case nothing is left behind on the cold tier.
+        """
+        try:
+            with self.hot.open(key) as f:
+                self.cold.put_stream(key, iter_file(f, settings.FILE_UPLOAD_CHUNK_SIZE))
+        except FileNotFoundError:
+            return False
+        hot_stat = self.hot.stat(key)
+        cold_stat = self.cold.stat(key)
+        if hot_stat is None:
+            self.cold.delete(key)
+            return False
+        if cold_stat is None or cold_stat.size != hot_stat.size:
+            raise IOError(f"Cold copy of {key} does not match the hot copy")
+        self.hot.delete(key)
+        return True
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def create_blob_store(backend):
+    if backend == BACKEND_LOCAL:
+        return LocalBlobStore()
+    if backend == BACKEND_S3:
+        return S3BlobStore()
+    if backend == BACKEND_TIERED:
+        return TieredBlobStore(LocalBlobStore(settings.TIER_HOT_ROOT or None), S3BlobStore())
+    raise ImproperlyConfigured(f"Unknown FILE_STORAGE_BACKEND: {backend}")
+
+
+def get_blob_store():
+    """The process-wide blob store selected by FILE_STORAGE_BACKEND."""
+    global _blob_store
+    if _blob_store is None or _blob_store[0] != settings.FILE_STORAGE_BACKEND:
+        with _blob_store_lock:
+            if _blob_store is None or _blob_store[0] != settings.FILE_STORAGE_BACKEND:
+                backend = settings.FILE_STORAGE_BACKEND
+                _blob_store = (backend, create_blob_store(backend))
+    return _blob_store[1]
@@ -0,0 +1,217 @@
+import copy
+import time
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE_FILE = 'file'
+NAMESPACE_HASH = 'hash'
+NAMESPACE_STATS = 'stats'
+NAMESPACE_SEARCH = 'search'
+NAMESPACES = [NAMESPACE_FILE, NAMESPACE_HASH, NAMESPACE_STATS, NAMESPACE_SEARCH]
+
+# Stats and search results depend on every row, so instead of tracking which
+# entries a change affects, their keys carry a generation that any change bumps
+GENERATIONAL = (NAMESPACE_STATS, NAMESPACE_SEARCH)
+GENERATION_KEY = 'generation'
+
+_missing = object()
+
+
+def make_key(*parts):
+    """Stable cache key for structured arguments, e.g. search filters."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class LRU:
+    """Size-bounded, thread-safe LRU map with per-entry expiry."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _missing
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return _missing
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class MetadataCache:
+    """Read-through cache for File metadata, stats snapshots and search results.
+
+    Lookups try a per-worker LRU first, then the optional shared tier (the
+    Django cache named by METADATA_CACHE_SHARED_ALIAS, e.g. Redis), then
+    load from the database and fill both. Local entries live at most
+    METADATA_CACHE_LOCAL_TTL seconds, since other workers cannot reach this
+    worker's LRU when they invalidate; the shared tier is invalidated
+    directly. A failing shared tier is logged and skipped.
+
+    FileService invalidates the rows it changes, after the transaction
+    commits (see invalidate_files), and every change also bumps the
+    generation of the stats and search entries.
+    """
+
+    def __init__(self):
+        self.local = None
+        self.local_generation = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.counters = defaultdict(lambda: {'local_hits': 0, 'shared_hits': 0, 'misses': 0})
+        self.invalidations = 0
+        self.shared_errors = 0
+
+    @property
+    def enabled(self):
+        return settings.METADATA_CACHE_ENABLED
+
+    @property
+    def shared(self):
+        alias = settings.METADATA_CACHE_SHARED_ALIAS
+        return caches[alias] if alias else None
+
+    def get_local(self):
+        if self.local is None:
+            self.local = LRU(settings.METADATA_CACHE_MAX_ENTRIES)
+        return self.local
+
+    def get_ttl(self, namespace):
+        return {
+            NAMESPACE_FILE: settings.METADATA_CACHE_FILE_TTL,
+            NAMESPACE_HASH: settings.METADATA_CACHE_FILE_TTL,
+            NAMESPACE_STATS: settings.METADATA_CACHE_STATS_TTL,
+            NAMESPACE_SEARCH: settings.METADATA_CACHE_SEARCH_TTL,
+        }[namespace]
+
+    def shared_call(self, method, *args, default=None):
+        shared = self.shared
+        if shared is None:
+            return default
+        try:
+            return getattr(shared, method)(*args)
+        except Exception as e:
+            self.shared_errors += 1
+            logger.warning("Shared metadata cache %s failed: %s", method, e)
+            return default
+
+    def get_generation(self):
+        if self.shared is None:
+            return self.local_generation
+        return self.shared_call('get', f'meta:{GENERATION_KEY}', default=0) or 0
+
+    def get_cache_key(self, namespace, key):
+        if namespace in GENERATIONAL:
+            return f'meta:{namespace}:{self.get_generation()}:{key}'
+        return f'meta:{namespace}:{key}'
+
+    def get_or_load(self, namespace, key, loader):
+        """Cached value for key, or loader()'s result; None results are not cached."""
+        if not self.enabled:
+            return loader()
+        counters = self.counters[namespace]
+        cache_key = self.get_cache_key(namespace, key)
+        local = self.get_local()
+        value = local.get(cache_key)
+        if value is not _missing:
+            counters['local_hits'] += 1
+            return copy.copy(value)
+
+        ttl = self.get_ttl(namespace)
+        local_ttl = min(ttl, settings.METADATA_CACHE_LOCAL_TTL)
+        value = self.shared_call('get', cache_key, _missing, default=_missing)
+        if value is not _missing:
+            counters['shared_hits'] += 1
+            local.set(cache_key, value, local_ttl)
+            return copy.copy(value)
+
+        counters['misses'] += 1
+        value = loader()
+        if value is not None:
+            local.set(cache_key, value, local_ttl)
+            self.shared_call('set', cache_key, value, ttl)
+        return copy.copy(value)
+
+    def invalidate(self, file_ids=(), file_hashes=()):
+        """Drop the given rows' entries and start a new stats/search generation."""
+        keys = [self.get_cache_key(NAMESPACE_FILE, str(file_id)) for file_id in file_ids]
+        keys += [self.get_cache_key(NAMESPACE_HASH, file_hash) for file_hash in file_hashes]
+        if self.local is not None:
+            for key in keys:
+                self.local.delete(key)
+        if keys:
+            self.shared_call('delete_many', keys)
+        self.local_generation += 1
+        if self.shared is not None:
+            # add() first: incr() fails on a key that does not exist yet
+            self.shared_call('add', f'meta:{GENERATION_KEY}', 0, None)
+            self.shared_call('incr', f'meta:{GENERATION_KEY}')
+        self.invalidations += 1
+
+    def clear(self):
+        if self.local is not None:
+            self.local.clear()
+        self.local_generation += 1
+
+    def get_stats(self):
+        namespaces = {}
+        for namespace in NAMESPACES:
+            counters = self.counters[namespace]
+            lookups = counters['local_hits'] + counters['shared_hits'] + counters['misses']
+            hits = counters['local_hits'] + counters['shared_hits']
+            namespaces[namespace] = dict(counters, lookups=lookups, hit_rate=(hits / lookups) if lookups else 0)
+        return {
+            'enabled': self.enabled,
+            'shared_tier': settings.METADATA_CACHE_SHARED_ALIAS or None,
+            'local_entries': len(self.local) if self.local is not None else 0,
+            'local_capacity': settings.METADATA_CACHE_MAX_ENTRIES,
+            'invalidations': self.invalidations,
+            'shared_errors': self.shared_errors,
+            'namespaces': namespaces,
+        }
+
+
+metadata_cache = MetadataCache()
+
+
+def invalidate_files(file_objs):
+    """Invalidate cached metadata for file_objs once the current transaction commits.
+
+    Invalidating earlier would let a concurrent read cache the old rows
+    again before the change becomes visible.
+    """
+    file_ids = [file_obj.pk for file_obj in file_objs]
+    file_hashes = {file_obj.file_hash for file_obj in file_objs}
+    transaction.on_commit(lambda: metadata_cache.invalidate(file_ids, file_hashes))
@@ -0,0 +1,204 @@
+import hashlib
+import logging
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from .chunking import ContentDefinedChunker
+from .locks import NAMESPACE_CHUNKS, HashLock
+from .models import Chunk, FileChunk, PendingBlobDeletion
+from .repositories import StatsRepository
+from .storage import chunk_store_paths
+
+logger = logging.getLogger(__name__)
+
+# Keeps IN (...) lists under SQLite's bound-parameter limit.
+BATCH_SIZE = 500
+
+
+def _batched(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class ChunkStoreError(Exception):
+    """Raised when a manifest cannot be recorded against the chunks on disk."""
+
+
+class ChunkStore:
+    """Chunk-level deduplicating store: files become ordered manifests of chunks.
+
+    Chunk data is stored under the blob key chunks/<digest[:2]>/<digest>,
+    written once per distinct digest. Chunk.reference_count counts manifest entries
+    pointing at the chunk; when the last one goes the row is dropped and the
+    chunk's data queued for `manage.py sweep_blobs`.
+    """
+
+    def __init__(self):
+        self.chunker = ContentDefinedChunker(
+            settings.CHUNK_STORE_MIN_SIZE,
+            settings.CHUNK_STORE_AVG_SIZE,
+            settings.CHUNK_STORE_MAX_SIZE,
+        )
+
+    def get_path(self, digest):
+        """The chunk's key in the blob store."""
+        return chunk_store_paths.relative_path(digest)
+
+    def write_stream(self, blocks):
+        """Chunk and store a stream of byte blocks.
+
+        Returns (file_hash, size, manifest, new_digests) where manifest is the
+        ordered list of (digest, size) pairs and new_digests are the chunks this
+        call wrote to disk for the first time.
+        """
+        file_hash = hashlib.sha256()
+        size = 0
+        manifest = []
+        new_digests = []
+        try:
+            for data in self.chunker.split(blocks):
+                file_hash.update(data)
+                digest = hashlib.sha256(data).hexdigest()
+                if self.write_chunk(digest, data):
+                    new_digests.append(digest)
+                manifest.append((digest, len(data)))
+                size += len(data)
+        except Exception:
+            self.discard(new_digests)
+            raise
+        return file_hash.hexdigest(), size, manifest, new_digests
+
+    def write_chunk(self, digest, data):
+        """Write a chunk unless it is already stored; returns True if written."""
+        path = self.get_path(digest)
+        if chunk_store_paths.exists(path):
+            return False
+        chunk_store_paths.put(path, [data])
+        return True
+
+    def discard(self, digests):
+        """Queue freshly written chunks that no manifest ended up referencing.
+
+        Another upload may already have found such a chunk on disk and be
+        about to reference it, so the file is left to `sweep_blobs`, which
+        checks again under the chunk's lock.
+        """
+        for batch in _batched(list(digests)):
+            known = set(Chunk.objects.filter(digest__in=batch).values_list('digest', flat=True))
+            PendingBlobDeletion.objects.bulk_create([
+                PendingBlobDeletion(path=self.get_path(digest), kind=PendingBlobDeletion.KIND_CHUNK, key=digest)
+                for digest in batch if digest not in known
+            ])
+
+    def lock(self, manifest):
+        """The HashLock over manifest's chunks that create_manifest must run under.
+
+        Take it before opening the transaction: the database write lock is
+        then never held while waiting on another ingest's chunk locks.
+        """
+        return HashLock({digest for digest, _ in manifest}, NAMESPACE_CHUNKS)
+
+    def create_manifest(self, file_obj, manifest):
+        """Record file_obj's manifest and take references on its chunks.
+
+        write_stream skips chunks that were already on disk, and sweep_blobs
+        may have removed one since. Under the chunks' locks (held by the
+        caller, see lock()) every chunk is checked to be present before the
+        references are taken; once they are, the sweep leaves them alone.
+        """
+        counts = Counter(digest for digest, _ in manifest)
+        sizes = dict(manifest)
+        with transaction.atomic():
+            missing = [digest for digest in counts if not chunk_store_paths.exists(self.get_path(digest))]
+            if missing:
+                raise ChunkStoreError(f"{len(missing)} chunk(s) were removed while the file was being stored")
+            existing = set()
+            for batch in _batched(list(counts)):
+                existing.update(Chunk.objects.filter(digest__in=batch).values_list('digest', flat=True))
+            new_chunks = [digest for digest in counts if digest not in existing]
+            Chunk.objects.bulk_create(
+                [Chunk(digest=digest, size=sizes[digest]) for digest in new_chunks],
+                ignore_conflicts=True,
+                batch_size=BATCH_SIZE,
+            )
+            # Most chunks occur once per file, so grouping by occurrence count
+            # keeps this to a handful of UPDATE statements.
+            by_count = defaultdict(list)
+            for digest, count in counts.items():
+                by_count[count].append(digest)
+            for count, digests in by_count.items():
+                for batch in _batched(digests):
+                    Chunk.objects.filter(digest__in=batch).update(
+                        reference_count=F('reference_count') + count
+                    )
+
+            entries = []
+            offset = 0
+            for position, (digest, size) in enumerate(manifest):
+                entries.append(FileChunk(file=file_obj, chunk_id=digest, position=position, offset=offset))
+                offset += size
+            FileChunk.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+            StatsRepository.record_chunks(len(new_chunks), sum(sizes[digest] for digest in new_chunks))
+
+    def release(self, file_obj):
+        """Drop file_obj's manifest and queue chunks no longer referenced for deletion."""
+        with transaction.atomic():
+            counts = Counter(file_obj.manifest.values_list('chunk_id', flat=True))
+            file_obj.manifest.all().delete()
+            by_count = defaultdict(list)
+            for digest, count in counts.items():
+                by_count[count].append(digest)
+            for count, digests in by_count.items():
+                for batch in _batched(digests):
+                    Chunk.objects.filter(digest__in=batch).update(
+                        reference_count=F('reference_count') - count
+                    )
+            unreferenced = []
+            released_size = 0
+            for batch in _batched(list(counts)):
+                for digest, size in Chunk.objects.filter(
+                    digest__in=batch, reference_count__lte=0
+                ).values_list('digest', 'size'):
+                    unreferenced.append(digest)
+                    released_size += size
+            for batch in _batched(unreferenced):
+                Chunk.objects.filter(digest__in=batch).delete()
+            PendingBlobDeletion.objects.bulk_create([
+                PendingBlobDeletion(path=self.get_path(digest), kind=PendingBlobDeletion.KIND_CHUNK, key=digest)
+                for digest in unreferenced
+            ], batch_size=BATCH_SIZE)
+            StatsRepository.record_chunks(-len(unreferenced), -released_size)
+
+    def get_range_entries(self, file_obj, start, end):
+        """Manifest rows (digest, offset, size) of the chunks overlapping start..end.
+
+        Duplicate rows read their canonical row's manifest. Returns a queryset
+        so async callers can iterate it with `async for`.
+        """
+        return FileChunk.objects.filter(
+            file_id=file_obj.content_file_id,
+            offset__lte=end, offset__gt=start - F('chunk__size')
+        ).order_by('position').values_list('chunk_id', 'offset', 'chunk__size')
+
+    def get_read_plan(self, entries, start, end):
+        """Turn manifest rows into (path, skip, length) reads covering start..end."""
+        plan = []
+        for digest, offset, size in entries:
+            skip = max(start - offset, 0)
+            length = min(end + 1, offset + size) - offset - skip
+            plan.append((self.get_path(digest), skip, length))
+        return plan
+
+    def iter_plan(self, plan, chunk_size=None):
+        """Yield the bytes of a read plan, one ranged read per chunk."""
+        for path, skip, length in plan:
+            yield from chunk_store_paths.iter_range(path, skip, skip + length - 1, chunk_size)
+
+    def iter_content(self, file_obj, start=0, end=None, chunk_size=None):
+        """Yield bytes start..end (inclusive) of the file by streaming its chunks in manifest order."""
+        chunk_size = chunk_size or settings.FILE_UPLOAD_CHUNK_SIZE
+        if end is None:
+            end = file_obj.size - 1
+        entries = list(self.get_range_entries(file_obj, start, end))
+        yield from self.iter_plan(self.get_read_plan(entries, start, end), chunk_size)
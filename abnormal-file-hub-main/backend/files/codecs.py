@@ -0,0 +1,133 @@
+import zlib
+import logging
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ENCODING_IDENTITY = ''
+ENCODING_GZIP = 'gzip'
+ENCODING_ZSTD = 'zstd'
+
+# Types whose content is already compressed; compressing them again costs CPU
+# and saves next to nothing.
+COMPRESSED_TYPES = {
+    '7z', 'avi', 'avif', 'br', 'bz2', 'docx', 'epub', 'flac', 'gif', 'gz', 'heic',
+    'jar', 'jpeg', 'jpg', 'm4a', 'm4v', 'mkv', 'mov', 'mp3', 'mp4', 'odp', 'ods',
+    'odt', 'ogg', 'opus', 'png', 'pptx', 'rar', 'tgz', 'webm', 'webp', 'woff',
+    'woff2', 'xlsx', 'xz', 'zip', 'zst',
+}
+
+
+class GzipCodec:
+    """gzip via the stdlib zlib module; always available."""
+    encoding = ENCODING_GZIP
+    suffix = '.gz'
+
+    def compressor(self):
+        # wbits=31 writes the gzip container, which is what HTTP `gzip` means
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def iter_decompress(self, f, chunk_size):
+        """Yield the decoded content of f in pieces of at most chunk_size bytes."""
+        decompressor = zlib.decompressobj(31)
+        while True:
+            raw = f.read(chunk_size)
+            if not raw:
+                break
+            while raw:
+                data = decompressor.decompress(raw, chunk_size)
+                if data:
+                    yield data
+                raw = decompressor.unconsumed_tail
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+class ZstdCodec:
+    """Zstandard via the optional `zstandard` package."""
+    encoding = ENCODING_ZSTD
+    suffix = '.zst'
+
+    def compressor(self):
+        return zstandard.ZstdCompressor(level=3).compressobj()
+
+    def iter_decompress(self, f, chunk_size):
+        """Yield the decoded content of f in pieces of at most chunk_size bytes."""
+        yield from zstandard.ZstdDecompressor().read_to_iter(f, read_size=chunk_size, write_size=chunk_size)
+
+
+CODECS = {ENCODING_GZIP: GzipCodec()}
+if zstandard is not None:
+    CODECS[ENCODING_ZSTD] = ZstdCodec()
+
+
+def get_codec(encoding):
+    try:
+        return CODECS[encoding]
+    except KeyError:
+        raise ValueError(f"Content encoding not available: {encoding}")
+
+
+def get_preferred_codec():
+    """FILE_COMPRESSION_CODEC if installed, else gzip."""
+    codec = CODECS.get(settings.FILE_COMPRESSION_CODEC)
+    if codec is None:
+        codec = CODECS[ENCODING_GZIP]
+    return codec
+
+
+def get_compression_types():
+    types = settings.FILE_COMPRESSION_TYPES
+    if isinstance(types, str):
+        types = types.split(',')
+    return {file_type.strip().lower() for file_type in types if file_type.strip()}
+
+
+def is_compressible(sample):
+    """Quick probe: does a fast deflate of the sample shrink it enough?"""
+    sample = sample[:settings.FILE_COMPRESSION_PROBE_SIZE]
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) <= len(sample) * settings.FILE_COMPRESSION_PROBE_RATIO
+
+
+def choose_encoding(file_type, sample):
+    """The at-rest encoding for a new whole-file blob, from its type or first chunk.
+
+    Listed text types are always compressed, known compressed formats never
+    are, and anything else is compressed when the probe says it pays off.
+    The chunk store deduplicates raw chunks, so it is never compressed.
+    """
+    if not settings.FILE_COMPRESSION_ENABLED or settings.FILE_STORE_MODE != 'file':
+        return ENCODING_IDENTITY
+    file_type = file_type.lower()
+    if file_type in COMPRESSED_TYPES:
+        return ENCODING_IDENTITY
+    if file_type in get_compression_types() or is_compressible(sample):
+        return get_preferred_codec().encoding
+    return ENCODING_IDENTITY
+
+
+def iter_decoded(f, encoding, start, end, chunk_size):
+    """Yield decoded bytes start..end (inclusive) of an encoded blob read from f.
+
+    Compressed streams cannot seek, so a range is served by decoding from
+    the beginning and discarding the bytes before start. f is closed when
+    the generator finishes.
+    """
+    codec = get_codec(encoding)
+    position = 0
+    with f:
+        for data in codec.iter_decompress(f, chunk_size):
+            data_start = position
+            position += len(data)
+            if position > start:
+                yield data[max(start - data_start, 0):end + 1 - data_start]
+            if position > end:
+                break
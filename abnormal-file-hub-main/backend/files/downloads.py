@@ -0,0 +1,293 @@
+import os
+import re
+import uuid
+import logging
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from .chunkstore import ChunkStore
+from .codecs import iter_decoded
+from .executors import run_io
+from .storage import content_store
+
+logger = logging.getLogger(__name__)
+
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+# Requests asking for more ranges than this get the whole file instead.
+MAX_RANGES = 32
+
+OFFLOAD_ACCEL = 'x-accel'
+OFFLOAD_SENDFILE = 'x-sendfile'
+
+
+def get_etag(file_obj, content_encoding=''):
+    """Strong ETag: file_hash is content-addressed, so equal tags mean equal bytes.
+
+    An encoded representation has different bytes, so it gets its own tag.
+    """
+    if content_encoding:
+        return f'"{file_obj.file_hash}-{content_encoding}"'
+    return f'"{file_obj.file_hash}"'
+
+
+def parse_etags(header):
+    """Split an If-None-Match/If-Match header into bare tags, dropping W/ prefixes."""
+    return [tag.strip().removeprefix('W/') for tag in header.split(',') if tag.strip()]
+
+
+def parse_range_header(header, size):
+    """Parse a `bytes=` Range header into a list of inclusive (start, end) pairs.
+
+    Returns None when the header is absent or malformed (serve the whole
+    file) and an empty list when no range is satisfiable (respond 416).
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        match = RANGE_RE.match(spec)
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0 or size == 0:
+                # Nothing to return, e.g. any suffix of an empty file
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = min(int(last), size - 1) if last else size - 1
+        ranges.append((start, end))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def accepts_encoding(header, content_encoding):
+    """Whether an Accept-Encoding header allows content_encoding (q > 0)."""
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if coding.strip().lower() not in (content_encoding, '*'):
+            continue
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def is_not_modified(request, file_obj, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        tags = parse_etags(if_none_match)
+        return '*' in tags or etag in tags
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if if_modified_since is not None:
+        return int(file_obj.uploaded_at.timestamp()) <= if_modified_since
+    return False
+
+
+def range_applies(request, file_obj, etag):
+    """Honour If-Range: only serve a partial response if the validator still matches."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(file_obj.uploaded_at.timestamp()) <= since
+
+
+def is_asgi_request(request):
+    """Whether request came in over ASGI, where streamed bodies must be async iterators.
+
+    Django's ASGI handler drains a sync streaming iterator into a list
+    before sending the first byte, so a sync body would be held in memory.
+    """
+    return getattr(request, 'scope', None) is not None
+
+
+class DownloadBuilder:
+    """Builds download responses with Range, ETag and conditional GET support.
+
+    Whole-file blobs on a local disk can be handed to the front-end web
+    server via X-Accel-Redirect (nginx) or X-Sendfile (Apache/lighttpd) so
+    the bytes never pass through the Python worker; chunked files and blobs
+    in an object store are streamed with ranged reads.
+
+    Blobs compressed at rest are sent as stored, with Content-Encoding, when
+    the client accepts that coding (ranges then apply to the encoded bytes);
+    otherwise they are decoded on the fly. They are never offloaded.
+
+    With asynchronous=True the response bodies are async iterators that read
+    in the I/O thread pool, for any view served over ASGI (see
+    is_asgi_request); the server then only pulls the next block once the
+    client has taken the previous one.
+    All reads go through the blob store, so every FILE_STORAGE_BACKEND works.
+    """
+
+    def __init__(self, file_obj, asynchronous=False):
+        self.file_obj = file_obj
+        self.asynchronous = asynchronous
+        # True once build() decides to send the stored bytes with Content-Encoding
+        self.passthrough = False
+        self.blob_path = None if file_obj.is_chunked else file_obj.file_path
+
+    def exists(self):
+        return self.blob_path is None or content_store.exists(self.blob_path)
+
+    def iter_range(self, start, end):
+        """Yield the bytes start..end (inclusive) of the file."""
+        if self.file_obj.is_chunked:
+            yield from ChunkStore().iter_content(self.file_obj, start, end)
+            return
+        chunk_size = settings.FILE_UPLOAD_CHUNK_SIZE
+        if self.file_obj.content_encoding and not self.passthrough:
+            yield from iter_decoded(
+                content_store.open(self.blob_path), self.file_obj.content_encoding, start, end, chunk_size
+            )
+            return
+        yield from content_store.iter_range(self.blob_path, start, end, chunk_size)
+
+    async def aiter_range(self, start, end):
+        """Async iter_range(): blob reads run in the I/O pool, DB reads use the async ORM."""
+        if self.file_obj.is_chunked:
+            chunk_store = ChunkStore()
+            entries = [row async for row in chunk_store.get_range_entries(self.file_obj, start, end)]
+            blocks = chunk_store.iter_plan(chunk_store.get_read_plan(entries, start, end))
+        else:
+            blocks = self.iter_range(start, end)
+        try:
+            while True:
+                data = await run_io(next, blocks, None)
+                if data is None:
+                    break
+                yield data
+        finally:
+            await run_io(blocks.close)
+
+    def stream_range(self, start, end):
+        return self.aiter_range(start, end) if self.asynchronous else self.iter_range(start, end)
+
+    def set_common_headers(self, response, etag):
+        response['ETag'] = etag
+        if self.file_obj.content_encoding:
+            response['Vary'] = 'Accept-Encoding'
+        if self.passthrough:
+            response['Content-Encoding'] = self.file_obj.content_encoding
+        response['Last-Modified'] = http_date(self.file_obj.uploaded_at.timestamp())
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Disposition'] = f'attachment; filename="{self.file_obj.original_filename}"'
+        return response
+
+    def build(self, request):
+        file_obj = self.file_obj
+        size = file_obj.size
+        if file_obj.content_encoding and settings.FILE_COMPRESSION_PASSTHROUGH:
+            self.passthrough = accepts_encoding(request.headers.get('Accept-Encoding'), file_obj.content_encoding)
+            if self.passthrough:
+                size = file_obj.stored_size
+        etag = get_etag(file_obj, file_obj.content_encoding if self.passthrough else '')
+
+        if is_not_modified(request, file_obj, etag):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(file_obj.uploaded_at.timestamp())
+            if file_obj.content_encoding:
+                response['Vary'] = 'Accept-Encoding'
+            return response
+
+        offload = settings.FILE_DOWNLOAD_OFFLOAD
+        if offload and not file_obj.is_chunked and not file_obj.content_encoding:
+            local_path = content_store.local_path(self.blob_path)
+            if local_path is not None:
+                return self.build_offload(offload, etag, local_path)
+
+        ranges = None
+        if range_applies(request, file_obj, etag):
+            ranges = parse_range_header(request.headers.get('Range'), size)
+
+        if ranges is None:
+            response = StreamingHttpResponse(self.stream_range(0, size - 1), content_type='application/octet-stream')
+            response['Content-Length'] = str(size)
+            return self.set_common_headers(response, etag)
+
+        if not ranges:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return self.set_common_headers(response, etag)
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            response = StreamingHttpResponse(
+                self.stream_range(start, end), status=206, content_type='application/octet-stream'
+            )
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            return self.set_common_headers(response, etag)
+
+        return self.build_multipart(ranges, etag)
+
+    def build_multipart(self, ranges, etag):
+        """Serve several ranges as a streamed multipart/byteranges body."""
+        size = self.file_obj.stored_size if self.passthrough else self.file_obj.size
+        boundary = uuid.uuid4().hex
+        headers = [
+            (
+                f'--{boundary}\r\n'
+                f'Content-Type: application/octet-stream\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode()
+            for start, end in ranges
+        ]
+        closing = f'\r\n--{boundary}--\r\n'.encode()
+        length = sum(len(h) for h in headers) + sum(end - start + 1 for start, end in ranges)
+        length += 2 * (len(ranges) - 1) + len(closing)
+
+        def parts():
+            for i, (start, end) in enumerate(ranges):
+                if i:
+                    yield b'\r\n'
+                yield headers[i]
+                yield from self.iter_range(start, end)
+            yield closing
+
+        async def aparts():
+            for i, (start, end) in enumerate(ranges):
+                if i:
+                    yield b'\r\n'
+                yield headers[i]
+                async for data in self.aiter_range(start, end):
+                    yield data
+            yield closing
+
+        response = StreamingHttpResponse(
+            aparts() if self.asynchronous else parts(), status=206, content_type=f'multipart/byteranges; boundary={boundary}'
+        )
+        response['Content-Length'] = str(length)
+        return self.set_common_headers(response, etag)
+
+    def build_offload(self, offload, etag, local_path):
+        """Let the web server send the file; it also handles Range itself."""
+        response = HttpResponse(content_type='application/octet-stream')
+        if offload == OFFLOAD_ACCEL:
+            prefix = settings.FILE_DOWNLOAD_ACCEL_PREFIX.rstrip('/')
+            response['X-Accel-Redirect'] = f'{prefix}/{self.file_obj.file_path}'
+        elif offload == OFFLOAD_SENDFILE:
+            response['X-Sendfile'] = os.path.abspath(local_path)
+        else:
+            raise ValueError(f"Unknown FILE_DOWNLOAD_OFFLOAD mode: {offload}")
+        return self.set_common_headers(response, etag)
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+
+_lock = threading.Lock()
+_executors = {}
+
+
+def _get_executor(name, max_workers, processes=False):
+    executor = _executors.get(name)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(name)
+            if executor is None:
+                if processes:
+                    # Spawned, so children never inherit the server's threads or connections
+                    executor = ProcessPoolExecutor(
+                        max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                    )
+                else:
+                    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+                _executors[name] = executor
+    return executor
+
+
+def get_io_executor():
+    """Process-wide thread pool for blocking reads (downloads) off the event loop."""
+    return _get_executor('file-io', settings.ASYNC_IO_THREADS)
+
+
+def get_ingest_executor():
+    """Thread pool for hashing and writing upload bodies, apart from reads so they never queue behind ingest."""
+    return _get_executor('file-ingest', settings.ASYNC_INGEST_THREADS)
+
+
+def get_hash_executor():
+    """Thread pool for hashing batch uploads; hashlib releases the GIL on large updates."""
+    return _get_executor('file-hash', settings.BATCH_UPLOAD_WORKERS)
+
+
+def get_scrub_executor():
+    """Small pool for the store scrubber, kept apart so it never queues ahead of uploads."""
+    return _get_executor('file-scrub', settings.SCRUB_WORKERS)
+
+
+def get_preview_executor():
+    """Process pool for rendering previews, so image decoding never holds a web worker's GIL."""
+    return _get_executor('file-preview', settings.PREVIEW_PROCESSES, processes=True)
+
+
+def discard_preview_executor():
+    """Drop the preview pool after a worker died in it; the next call starts a fresh one."""
+    with _lock:
+        executor = _executors.pop('file-preview', None)
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_io(func, *args):
+    """Run a blocking call in the I/O pool and await its result."""
+    return await asyncio.get_running_loop().run_in_executor(get_io_executor(), func, *args)
+
+
+async def run_ingest_io(func, *args):
+    """Run a blocking ingest call in the ingest pool and await its result."""
+    return await asyncio.get_running_loop().run_in_executor(get_ingest_executor(), func, *args)
@@ -0,0 +1,239 @@
+import math
+import time
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over SHA-256 hex digests.
+
+    The keys are already uniformly distributed, so the bit positions are
+    derived from the digest itself with double hashing instead of rehashing.
+    """
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.num_bits = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.capacity = capacity
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, file_hash):
+        h1 = int(file_hash[:16], 16)
+        h2 = int(file_hash[16:32], 16) | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, file_hash):
+        for position in self._positions(file_hash):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, file_hash):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(file_hash))
+
+
+class HashIndex:
+    """Per-worker negative-lookup index in front of the file_hash column.
+
+    A miss in the Bloom filter means the hash is definitely not stored, so
+    FileRepository.get_file_by_hash can skip the database. The filter is
+    warmed from the file_hash column when the worker boots (start()),
+    updated on insert, and periodically pulls rows inserted by other
+    workers. Deletes cannot be removed from a Bloom filter; they only make
+    false positives more likely, so the filter is rebuilt once enough of
+    them pile up.
+
+    The refresh window is keyed on uploaded_at, which is set before the
+    inserting transaction commits, so a row committed much later than it
+    was stamped (a long batch) can fall behind the window. A full rebuild
+    every HASH_INDEX_REBUILD_SECONDS, done in a background thread while
+    the current filter keeps serving, bounds how long such a row can be
+    reported missing.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.watermark = None
+        self.last_refresh = 0.0
+        self.last_rebuild = 0.0
+        self.rebuilding = False
+        self.added_during_rebuild = None
+        self.stale_entries = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.lookups = 0
+        self.definite_misses = 0
+        self.db_hits = 0
+        self.false_positives = 0
+        self.rebuilds = 0
+
+    @property
+    def enabled(self):
+        return settings.HASH_INDEX_ENABLED
+
+    def start(self):
+        """Build the filter at worker boot, so no request pays for the first column scan."""
+        if self.enabled:
+            self.warm()
+
+    def warm(self):
+        """(Re)build the filter from the file_hash column.
+
+        The scan runs without the lock, so lookups and inserts carry on
+        against the current filter; hashes added meanwhile are replayed
+        into the new one before it is swapped in.
+        """
+        from .models import File
+
+        with self.lock:
+            self.added_during_rebuild = []
+        try:
+            total = File.objects.count()
+            bloom = BloomFilter(
+                max(total * 2, settings.HASH_INDEX_CAPACITY),
+                settings.HASH_INDEX_ERROR_RATE,
+            )
+            watermark = File.objects.aggregate(Max('uploaded_at'))['uploaded_at__max']
+            for file_hash in File.objects.values_list('file_hash', flat=True).iterator(chunk_size=10000):
+                bloom.add(file_hash)
+            with self.lock:
+                for file_hash in self.added_during_rebuild:
+                    bloom.add(file_hash)
+                self.bloom = bloom
+                self.watermark = watermark
+                self.last_refresh = self.last_rebuild = time.monotonic()
+                self.stale_entries = 0
+                self.rebuilds += 1
+        finally:
+            with self.lock:
+                self.added_during_rebuild = None
+        logger.info("Hash index warmed with %d hashes (%d bytes)", bloom.count, len(bloom.bits))
+
+    def rebuild_in_background(self):
+        """Start a rebuild thread unless one is already running."""
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+
+        def rebuild():
+            try:
+                self.warm()
+            except Exception:
+                logger.exception("Hash index rebuild failed")
+            finally:
+                self.rebuilding = False
+                connection.close()
+
+        threading.Thread(target=rebuild, name='hash-index-rebuild', daemon=True).start()
+
+    def refresh(self):
+        """Pull hashes inserted by other workers since the last refresh."""
+        from .models import File
+
+        with self.lock:
+            queryset = File.objects.all()
+            if self.watermark is not None:
+                # Overlap the window so rows committed slightly out of
+                # uploaded_at order are not missed.
+                since = self.watermark - timedelta(seconds=settings.HASH_INDEX_REFRESH_SECONDS * 2)
+                queryset = queryset.filter(uploaded_at__gte=since)
+            for file_hash, uploaded_at in queryset.values_list('file_hash', 'uploaded_at').iterator():
+                self.bloom.add(file_hash)
+                if self.added_during_rebuild is not None:
+                    self.added_during_rebuild.append(file_hash)
+                if self.watermark is None or uploaded_at > self.watermark:
+                    self.watermark = uploaded_at
+            self.last_refresh = time.monotonic()
+
+    def ensure_fresh(self):
+        if self.bloom is None:
+            self.warm()
+            return
+        if self.needs_rebuild() or time.monotonic() - self.last_rebuild >= settings.HASH_INDEX_REBUILD_SECONDS:
+            self.rebuild_in_background()
+        if time.monotonic() - self.last_refresh >= settings.HASH_INDEX_REFRESH_SECONDS:
+            self.refresh()
+
+    def refresh_due(self):
+        now = time.monotonic()
+        return (
+            self.bloom is None
+            or (not self.rebuilding and (
+                self.needs_rebuild() or now - self.last_rebuild >= settings.HASH_INDEX_REBUILD_SECONDS
+            ))
+            or now - self.last_refresh >= settings.HASH_INDEX_REFRESH_SECONDS
+        )
+
+    def needs_rebuild(self):
+        return self.bloom.count > self.bloom.capacity or self.stale_entries > self.bloom.count // 4
+
+    def might_contain(self, file_hash):
+        """False means the hash is definitely not stored; True means check the DB."""
+        if not self.enabled:
+            return True
+        self.ensure_fresh()
+        self.lookups += 1
+        if file_hash in self.bloom:
+            return True
+        self.definite_misses += 1
+        return False
+
+    async def amight_contain(self, file_hash):
+        """might_contain() for async callers; refreshes run in a worker thread."""
+        if self.enabled and self.refresh_due():
+            await sync_to_async(self.ensure_fresh)()
+        return self.might_contain(file_hash)
+
+    def record_result(self, found):
+        """Record whether a lookup that passed the filter found a row."""
+        if not self.enabled:
+            return
+        if found:
+            self.db_hits += 1
+        else:
+            self.false_positives += 1
+
+    def add(self, file_hash):
+        if self.bloom is not None:
+            with self.lock:
+                self.bloom.add(file_hash)
+                if self.added_during_rebuild is not None:
+                    self.added_during_rebuild.append(file_hash)
+
+    def remove(self, file_hash):
+        if self.bloom is not None:
+            self.stale_entries += 1
+
+    def get_stats(self):
+        absent = self.false_positives + self.definite_misses
+        return {
+            'enabled': self.enabled,
+            'warmed': self.bloom is not None,
+            'rebuilding': self.rebuilding,
+            'entries': self.bloom.count if self.bloom else 0,
+            'capacity': self.bloom.capacity if self.bloom else 0,
+            'size_bytes': len(self.bloom.bits) if self.bloom else 0,
+            'num_hashes': self.bloom.num_hashes if self.bloom else 0,
+            'stale_entries': self.stale_entries,
+            'lookups': self.lookups,
+            'definite_misses': self.definite_misses,
+            'db_hits': self.db_hits,
+            'false_positives': self.false_positives,
+            'false_positive_rate': (self.false_positives / absent) if absent else 0,
+            'rebuilds': self.rebuilds,
+        }
+
+
+hash_index = HashIndex()
@@ -0,0 +1,474 @@
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from .downloads import DownloadBuilder
+from .metrics import log_event
+from .models import File, Job
+from .previews import PreviewService, PreviewUnavailable, get_preview_type
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DATABASE = 'database'
+BACKEND_REDIS = 'redis'
+
+KIND_VERIFY = 'verify'
+KIND_PREVIEW = 'preview'
+
+handlers = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help; the job fails at once."""
+
+
+def register(kind):
+    """Register the decorated function as the handler of kind; it is called with the Job."""
+    def decorator(func):
+        handlers[kind] = func
+        return func
+    return decorator
+
+
+def get_retry_delay(attempts):
+    return min(settings.JOB_RETRY_BACKOFF * 2 ** max(attempts - 1, 0), settings.JOB_RETRY_BACKOFF_MAX)
+
+
+def make_worker_id():
+    return f"{socket.gethostname()[:32]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class DatabaseJobQueue:
+    """Job queue in the Job table; needs nothing but the database.
+
+    claim() marks jobs running with a per-claim token in locked_by, using
+    an UPDATE that only matches rows that are still claimable, so two
+    workers never run the same claim even where SELECT ... FOR UPDATE SKIP
+    LOCKED is unavailable (SQLite). Running jobs whose locked_until has
+    passed are claimable again.
+    """
+    name = BACKEND_DATABASE
+
+    def enqueue(self, kind, keys, payload=None):
+        jobs = [Job(kind=kind, key=key, payload=payload or {}) for key in keys]
+        Job.objects.bulk_create(jobs, ignore_conflicts=True)
+        # Content that was deleted, swept and stored again needs its jobs again
+        Job.objects.filter(
+            kind=kind, key__in=keys, status__in=[Job.STATUS_DONE, Job.STATUS_FAILED],
+        ).update(
+            status=Job.STATUS_QUEUED, payload=payload or {}, attempts=0, run_at=timezone.now(),
+            locked_by='', locked_until=None, last_error='', finished_at=None,
+        )
+
+    def claimable(self, now):
+        return (
+            Q(status=Job.STATUS_QUEUED, run_at__lte=now)
+            | Q(status=Job.STATUS_RUNNING, locked_until__lte=now)
+        )
+
+    def claim(self, worker_id, kinds=None, limit=1):
+        now = timezone.now()
+        queryset = Job.objects.filter(self.claimable(now))
+        if kinds:
+            queryset = queryset.filter(kind__in=kinds)
+        token = f"{worker_id}:{uuid.uuid4().hex[:8]}"
+        with transaction.atomic():
+            ids = list(
+                queryset.select_for_update(skip_locked=True).order_by('run_at').values_list('id', flat=True)[:limit]
+            )
+            if not ids:
+                return []
+            Job.objects.filter(self.claimable(now), id__in=ids).update(
+                status=Job.STATUS_RUNNING,
+                locked_by=token,
+                locked_until=now + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT),
+                attempts=F('attempts') + 1,
+            )
+        jobs = []
+        for job in Job.objects.filter(locked_by=token):
+            if job.attempts > settings.JOB_MAX_ATTEMPTS:
+                # Its earlier workers died or hung past the visibility timeout
+                self.fail(job, 'Not finished within the visibility timeout', permanent=True)
+            else:
+                jobs.append(job)
+        return jobs
+
+    def complete(self, job):
+        Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+            status=Job.STATUS_DONE, locked_until=None, finished_at=timezone.now(), last_error='',
+        )
+
+    def fail(self, job, error, permanent=False):
+        queryset = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+        if permanent or job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            queryset.update(
+                status=Job.STATUS_FAILED, locked_until=None, finished_at=timezone.now(), last_error=error,
+            )
+            return False
+        queryset.update(
+            status=Job.STATUS_QUEUED, locked_until=None, last_error=error,
+            run_at=timezone.now() + timedelta(seconds=get_retry_delay(job.attempts)),
+        )
+        return True
+
+    def retry_failed(self, kinds=None):
+        queryset = Job.objects.filter(status=Job.STATUS_FAILED)
+        if kinds:
+            queryset = queryset.filter(kind__in=kinds)
+        return queryset.update(status=Job.STATUS_QUEUED, attempts=0, run_at=timezone.now(), finished_at=None)
+
+    def prune(self, before):
+        """Delete jobs that finished successfully before `before`."""
+        deleted, _ = Job.objects.filter(status=Job.STATUS_DONE, finished_at__lt=before).delete()
+        return deleted
+
+    def get_stats(self):
+        kinds = {}
+        rows = Job.objects.order_by().values('kind', 'status').annotate(count=Count('*'))
+        for row in rows:
+            kinds.setdefault(row['kind'], dict.fromkeys(dict(Job.STATUS_CHOICES), 0))[row['status']] = row['count']
+        oldest = Job.objects.filter(status=Job.STATUS_QUEUED).aggregate(Min('run_at'))['run_at__min']
+        return {
+            'backend': self.name,
+            'kinds': kinds,
+            'oldest_queued_at': oldest,
+        }
+
+
+# Moves timed-out running jobs back to their ready set, then claims up to
+# ARGV[3] ready jobs, all in one atomic step
+CLAIM_SCRIPT = """
+local prefix = ARGV[4]
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, member in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], member)
+    local kind = string.match(member, '^([^:]+):')
+    redis.call('ZADD', prefix .. 'ready:' .. kind, ARGV[1], member)
+end
+local claimed = {}
+for i = 5, #ARGV do
+    local ready = prefix .. 'ready:' .. ARGV[i]
+    local members = redis.call('ZRANGEBYSCORE', ready, '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]) - #claimed)
+    for _, member in ipairs(members) do
+        redis.call('ZREM', ready, member)
+        redis.call('ZADD', KEYS[1], ARGV[2], member)
+        table.insert(claimed, member)
+    end
+    if #claimed >= tonumber(ARGV[3]) then
+        break
+    end
+end
+return claimed
+"""
+
+
+class RedisJobQueue:
+    """Job queue in a Redis-compatible server, for deployments that already run one.
+
+    Each job is a JSON record in one hash, keyed `<kind>:<key>`; a sorted
+    set per kind holds ready jobs by run time and one sorted set holds
+    running jobs by visibility deadline. Records of finished jobs stay in
+    the hash until pruned; enqueueing one queues it again, as in the
+    database queue. Needs the optional `redis` package.
+    """
+    name = BACKEND_REDIS
+    prefix = 'filehub:jobs:'
+
+    def __init__(self, url=None, client=None):
+        self.url = url if url is not None else settings.JOB_QUEUE_REDIS_URL
+        self._client = client
+        self._claim_script = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            if redis is None:
+                raise ImproperlyConfigured("JOB_QUEUE_BACKEND 'redis' needs the redis package")
+            if not self.url:
+                raise ImproperlyConfigured("JOB_QUEUE_BACKEND 'redis' needs JOB_QUEUE_REDIS_URL")
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    @property
+    def records(self):
+        return self.prefix + 'records'
+
+    @property
+    def running(self):
+        return self.prefix + 'running'
+
+    def ready(self, kind):
+        return f'{self.prefix}ready:{kind}'
+
+    def load(self, member):
+        raw = self.client.hget(self.records, member)
+        return json.loads(raw) if raw else None
+
+    def save(self, member, record):
+        self.client.hset(self.records, member, json.dumps(record))
+
+    def to_job(self, member, record):
+        # Unsaved Job as a value object; locked_by carries the record's member
+        return Job(
+            kind=record['kind'], key=record['key'], payload=record['payload'], status=record['status'],
+            attempts=record['attempts'], last_error=record['last_error'], locked_by=member,
+        )
+
+    def enqueue(self, kind, keys, payload=None):
+        now = time.time()
+        for key in keys:
+            member = f'{kind}:{key}'
+            record = {
+                'kind': kind, 'key': key, 'payload': payload or {}, 'status': Job.STATUS_QUEUED,
+                'attempts': 0, 'last_error': '', 'created_at': now,
+            }
+            if not self.client.hsetnx(self.records, member, json.dumps(record)):
+                existing = self.load(member)
+                if existing is None or existing['status'] not in (Job.STATUS_DONE, Job.STATUS_FAILED):
+                    continue
+                self.save(member, record)
+            self.client.zadd(self.ready(kind), {member: now})
+
+    def claim(self, worker_id, kinds=None, limit=1):
+        if self._claim_script is None:
+            self._claim_script = self.client.register_script(CLAIM_SCRIPT)
+        kinds = kinds or sorted(handlers)
+        now = time.time()
+        members = self._claim_script(
+            keys=[self.running],
+            args=[now, now + settings.JOB_VISIBILITY_TIMEOUT, limit, self.prefix] + list(kinds),
+        )
+        jobs = []
+        for member in members:
+            member = member.decode() if isinstance(member, bytes) else member
+            record = self.load(member)
+            if record is None:
+                self.client.zrem(self.running, member)
+                continue
+            record['attempts'] += 1
+            record['status'] = Job.STATUS_RUNNING
+            self.save(member, record)
+            job = self.to_job(member, record)
+            if job.attempts > settings.JOB_MAX_ATTEMPTS:
+                self.fail(job, 'Not finished within the visibility timeout', permanent=True)
+            else:
+                jobs.append(job)
+        return jobs
+
+    def finish(self, job, status, error=''):
+        member = job.locked_by
+        record = self.load(member)
+        if record is not None:
+            record.update(status=status, last_error=error, finished_at=time.time())
+            self.save(member, record)
+        self.client.zrem(self.running, member)
+
+    def complete(self, job):
+        self.finish(job, Job.STATUS_DONE)
+
+    def fail(self, job, error, permanent=False):
+        if permanent or job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            self.finish(job, Job.STATUS_FAILED, error)
+            return False
+        member = job.locked_by
+        record = self.load(member)
+        if record is None:
+            self.client.zrem(self.running, member)
+            return False
+        record.update(status=Job.STATUS_QUEUED, last_error=error)
+        self.save(member, record)
+        self.client.zrem(self.running, member)
+        self.client.zadd(self.ready(job.kind), {member: time.time() + get_retry_delay(job.attempts)})
+        return True
+
+    def iter_records(self):
+        for member, raw in self.client.hscan_iter(self.records):
+            yield (member.decode() if isinstance(member, bytes) else member), json.loads(raw)
+
+    def retry_failed(self, kinds=None):
+        retried = 0
+        for member, record in self.iter_records():
+            if record['status'] != Job.STATUS_FAILED or (kinds and record['kind'] not in kinds):
+                continue
+            record.update(status=Job.STATUS_QUEUED, attempts=0)
+            self.save(member, record)
+            self.client.zadd(self.ready(record['kind']), {member: time.time()})
+            retried += 1
+        return retried
+
+    def prune(self, before):
+        cutoff = before.timestamp()
+        stale = [
+            member for member, record in self.iter_records()
+            if record['status'] == Job.STATUS_DONE and record.get('finished_at', 0) < cutoff
+        ]
+        if stale:
+            self.client.hdel(self.records, *stale)
+        return len(stale)
+
+    def get_stats(self):
+        kinds = {}
+        for _, record in self.iter_records():
+            counts = kinds.setdefault(record['kind'], dict.fromkeys(dict(Job.STATUS_CHOICES), 0))
+            counts[record['status']] += 1
+        return {'backend': self.name, 'kinds': kinds}
+
+
+_job_queue = None
+
+
+def get_job_queue():
+    """The process-wide job queue selected by JOB_QUEUE_BACKEND."""
+    global _job_queue
+    if _job_queue is None or _job_queue.name != settings.JOB_QUEUE_BACKEND:
+        backend = settings.JOB_QUEUE_BACKEND
+        if backend == BACKEND_DATABASE:
+            _job_queue = DatabaseJobQueue()
+        elif backend == BACKEND_REDIS:
+            _job_queue = RedisJobQueue()
+        else:
+            raise ImproperlyConfigured(f"Unknown JOB_QUEUE_BACKEND: {backend}")
+    return _job_queue
+
+
+def enqueue_post_upload(file_objs):
+    """Enqueue POST_UPLOAD_JOBS for newly stored content once the transaction commits.
+
+    Enqueueing after the commit means a worker never picks up a job for a
+    row it cannot see yet. A failure to enqueue is logged rather than
+    failing the upload, which is already stored by then.
+    """
+    kinds = settings.POST_UPLOAD_JOBS
+    file_hashes = sorted({file_obj.file_hash for file_obj in file_objs})
+    if not kinds or not file_hashes:
+        return
+
+    def enqueue():
+        for kind in kinds:
+            try:
+                get_job_queue().enqueue(kind, file_hashes)
+            except Exception as e:
+                logger.error("Error enqueueing %s jobs: %s", kind, e)
+
+    transaction.on_commit(enqueue)
+
+
+def run_job(queue, job):
+    """Run one claimed job and record the outcome; returns 'done', 'retry' or 'failed'."""
+    handler = handlers.get(job.kind)
+    started = time.perf_counter()
+    try:
+        if handler is None:
+            raise PermanentJobError(f"No handler for job kind '{job.kind}'")
+        handler(job)
+    except PermanentJobError as e:
+        queue.fail(job, str(e), permanent=True)
+        outcome = 'failed'
+    except Exception as e:
+        logger.exception("Job %s:%s raised", job.kind, job.key)
+        outcome = 'retry' if queue.fail(job, f"{type(e).__name__}: {str(e)}") else 'failed'
+    else:
+        queue.complete(job)
+        outcome = 'done'
+    log_event(
+        logger, 'job', kind=job.kind, key=job.key, attempt=job.attempts, outcome=outcome,
+        duration_ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+    return outcome
+
+
+class Worker:
+    """Runs claimed jobs on `threads` threads until stop_event is set.
+
+    With drain=True each thread exits once the queue has nothing claimable
+    instead of polling every JOB_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, queue=None, kinds=None, threads=1, stop_event=None, drain=False):
+        self.queue = queue or get_job_queue()
+        self.kinds = kinds
+        self.threads = threads
+        self.stop_event = stop_event or threading.Event()
+        self.drain = drain
+        self.worker_id = make_worker_id()
+        self.outcomes = {'done': 0, 'retry': 0, 'failed': 0}
+        self.lock = threading.Lock()
+
+    def loop(self):
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                jobs = self.queue.claim(self.worker_id, self.kinds)
+                if not jobs:
+                    if self.drain:
+                        return
+                    self.stop_event.wait(settings.JOB_POLL_INTERVAL)
+                    continue
+                for job in jobs:
+                    outcome = run_job(self.queue, job)
+                    with self.lock:
+                        self.outcomes[outcome] += 1
+        finally:
+            connections.close_all()
+
+    def run(self):
+        if self.threads <= 1:
+            self.loop()
+            return self.outcomes
+        threads = [
+            threading.Thread(target=self.loop, name=f'job-worker-{index}', daemon=True)
+            for index in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.outcomes
+
+
+@register(KIND_VERIFY)
+def verify_content(job):
+    """Read stored content back and check it against the hash and size on record."""
+    file_obj = File.objects.filter(file_hash=job.key, is_duplicate=False).first()
+    if file_obj is None:
+        logger.info("No file with hash %s any more, nothing to verify", job.key)
+        return
+    builder = DownloadBuilder(file_obj)
+    if not builder.exists():
+        raise PermanentJobError(f"Blob missing: {builder.blob_path}")
+    sha256_hash = hashlib.sha256()
+    size = 0
+    if file_obj.size:
+        for data in builder.iter_range(0, file_obj.size - 1):
+            sha256_hash.update(data)
+            size += len(data)
+    if sha256_hash.hexdigest() != file_obj.file_hash or size != file_obj.size:
+        logger.error("Content of file %s does not match its hash", file_obj.id)
+        raise PermanentJobError(f"Content does not match hash {file_obj.file_hash}")
+
+
+@register(KIND_PREVIEW)
+def render_preview(job):
+    """Render the default-size preview ahead of the first request for it."""
+    file_obj = File.objects.filter(file_hash=job.key, is_duplicate=False).first()
+    if file_obj is None or get_preview_type(file_obj.file_type) is None:
+        return
+    try:
+        PreviewService().get_preview(file_obj)
+    except PreviewUnavailable as e:
+        logger.info("No preview for %s: %s", job.key, e)
@@ -0,0 +1,81 @@
+import os
+import zlib
+import threading
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+NAMESPACE_FILES = 'files'
+NAMESPACE_CHUNKS = 'chunks'
+NAMESPACE_PREVIEWS = 'previews'
+NAMESPACE_ADMISSION = 'admission'
+
+# Keys share a fixed set of lock files, so the lock directory never grows
+LOCK_STRIPES = 256
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def get_stripe(key):
+    return zlib.crc32(key.encode()) % LOCK_STRIPES
+
+
+class HashLock:
+    """Exclusive lock on a set of content hashes, held across processes and threads.
+
+    Each key maps onto one of LOCK_STRIPES lock files in INGEST_LOCK_DIR,
+    taken with flock(2) on a fresh descriptor, so it excludes other threads
+    of the same process as well as other workers on the host. Stripes are
+    taken in ascending order, so holders of overlapping sets cannot deadlock.
+    Code that needs both namespaces takes the file lock before the chunk
+    lock. Without fcntl only threads of this process are excluded.
+    """
+
+    def __init__(self, keys, namespace=NAMESPACE_FILES):
+        self.namespace = namespace
+        self.stripes = sorted({get_stripe(key) for key in keys})
+        self.held = []
+
+    def get_path(self, stripe):
+        return os.path.join(settings.INGEST_LOCK_DIR, f"{self.namespace}-{stripe:02x}.lock")
+
+    def acquire(self, stripe):
+        if fcntl is None:
+            with _thread_locks_lock:
+                lock = _thread_locks.setdefault((self.namespace, stripe), threading.Lock())
+            lock.acquire()
+            return lock
+        fd = os.open(self.get_path(stripe), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def release(self):
+        while self.held:
+            held = self.held.pop()
+            if fcntl is None:
+                held.release()
+            else:
+                fcntl.flock(held, fcntl.LOCK_UN)
+                os.close(held)
+
+    def __enter__(self):
+        if self.stripes:
+            os.makedirs(settings.INGEST_LOCK_DIR, exist_ok=True)
+        try:
+            for stripe in self.stripes:
+                self.held.append(self.acquire(stripe))
+        except BaseException:
+            self.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,102 @@
+import os
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from files.models import File
+
+SOURCE_ALIAS = 'copy_source'
+
+# Parents before children; File is split so canonical rows precede the
+# duplicates that point at them
+COPY_ORDER = [
+    'files.File',
+    'files.Job',
+    'files.Chunk',
+    'files.FileChunk',
+    'files.StorageCounter',
+    'files.StorageRollup',
+    'files.UploadSession',
+    'files.UploadChunk',
+    'files.PendingBlobDeletion',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy an existing SQLite vault into the configured default database (e.g. Postgres) "
+        "in batches. Rows already present are skipped, so an interrupted copy can be rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', default=os.path.join(settings.BASE_DIR, 'data', 'db.sqlite3'),
+            help='Path of the SQLite database to copy from',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--no-migrate', action='store_true', help='Do not run migrate on the target first')
+
+    def add_source(self, path):
+        if not os.path.exists(path):
+            raise CommandError(f"No SQLite database at {path}")
+        source = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}
+        configured = connections.configure_settings({
+            DEFAULT_DB_ALIAS: settings.DATABASES[DEFAULT_DB_ALIAS], SOURCE_ALIAS: source,
+        })
+        connections.settings[SOURCE_ALIAS] = configured[SOURCE_ALIAS]
+
+    def copy_queryset(self, model, queryset, batch_size):
+        """Copy queryset to the target in primary key order; returns the row count."""
+        copied = 0
+        last_pk = None
+        queryset = queryset.order_by('pk')
+        while True:
+            batch = list((queryset.filter(pk__gt=last_pk) if last_pk is not None else queryset)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                model.objects.using(DEFAULT_DB_ALIAS).bulk_create(batch, ignore_conflicts=True)
+            copied += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f"  {model._meta.label}: {copied}")
+        return copied
+
+    def check_copy_order(self):
+        """Refuse to run when a files model is missing from COPY_ORDER, rather than drop its rows."""
+        missing = sorted(
+            model._meta.label for model in apps.get_app_config('files').get_models()
+            if model._meta.label not in COPY_ORDER
+        )
+        if missing:
+            raise CommandError(f"COPY_ORDER does not cover: {', '.join(missing)}")
+
+    def handle(self, *args, **options):
+        self.check_copy_order()
+        self.add_source(options['source'])
+        target = connections[DEFAULT_DB_ALIAS]
+        if target.vendor == 'sqlite' and os.path.abspath(target.settings_dict['NAME']) == os.path.abspath(options['source']):
+            raise CommandError("The source and the target are the same database")
+        if not options['no_migrate']:
+            call_command('migrate', database=DEFAULT_DB_ALIAS, verbosity=0)
+
+        batch_size = options['batch_size']
+        total = 0
+        for label in COPY_ORDER:
+            model = apps.get_model(label)
+            queryset = model.objects.using(SOURCE_ALIAS).all()
+            if model is File:
+                total += self.copy_queryset(model, queryset.filter(is_duplicate=False), batch_size)
+                total += self.copy_queryset(model, queryset.filter(is_duplicate=True), batch_size)
+            else:
+                total += self.copy_queryset(model, queryset, batch_size)
+
+        # bulk_create with explicit ids leaves Postgres sequences behind
+        models = [apps.get_model(label) for label in COPY_ORDER]
+        statements = target.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with target.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+        self.stdout.write(self.style.SUCCESS(f"Copied {total} row(s) from {options['source']}, skipping rows already present"))
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from files.cache import invalidate_files
+from files.locks import HashLock
+from files.models import File
+from files.storage import content_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Move existing blobs into the FILE_STORE_FANOUT directory layout and rewrite "
+        "File.file_path in batches. Safe to run while the server is up and to resume: each blob is "
+        "moved under its content hash's ingest lock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches')
+        parser.add_argument('--limit', type=int, default=0, help='Stop after this many blobs (0 = no limit)')
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument(
+            '--state-file',
+            default=os.path.join(settings.MEDIA_ROOT, '.migrate_layout.json'),
+            help='Where the resume cursor is kept',
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore the saved cursor')
+
+    def load_cursor(self, state_file):
+        try:
+            with open(state_file) as f:
+                return json.load(f).get('last_id')
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_cursor(self, state_file, last_id, moved):
+        temp_file = f"{state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump({'last_id': last_id, 'moved': moved, 'fanout': list(content_store.fanout)}, f)
+        os.replace(temp_file, state_file)
+
+    def migrate_blob(self, file_obj, dry_run):
+        """Move one blob; returns True if its path changed."""
+        # Everything after the hash, e.g. ".txt" or ".txt.zst" for an encoded blob
+        basename = os.path.basename(file_obj.file_path)
+        if basename.startswith(file_obj.file_hash):
+            extension = basename[len(file_obj.file_hash):]
+        else:
+            extension = os.path.splitext(basename)[1]
+        target = content_store.relative_path(file_obj.file_hash, extension)
+        if file_obj.file_path == target:
+            return False
+        if dry_run:
+            self.stdout.write(f"{file_obj.file_path} -> {target}")
+            return True
+
+        source = file_obj.file_path
+        # Under the hash's lock the sweeper cannot unlink source and ingest
+        # cannot commit the content, between the link and the unlink.
+        with HashLock([file_obj.file_hash]):
+            target_existed = content_store.exists(target)
+            if content_store.exists(source):
+                # Hard-link first so downloads holding the old path keep working
+                # until the row points at the new one.
+                content_store.link(source, target)
+            elif not target_existed:
+                self.stderr.write(f"Missing blob for {file_obj.id}: {source}")
+                return False
+
+            try:
+                with transaction.atomic():
+                    # Lock the canonical row: a create_reference in flight
+                    # commits first, and one starting now waits and then
+                    # copies the new path (it re-reads the row).
+                    File.objects.select_for_update().filter(
+                        file_hash=file_obj.file_hash, is_duplicate=False
+                    ).first()
+                    # The canonical row and every reference share the blob
+                    rows = File.objects.filter(file_hash=file_obj.file_hash, file_path=source)
+                    changed = list(rows.only('id', 'file_hash'))
+                    invalidate_files(changed)
+                    rows.update(file_path=target)
+            except BaseException:
+                self.discard_link(target, target_existed)
+                raise
+            if not changed:
+                # Deleted (its tombstone names source) or moved since the batch was read
+                self.discard_link(target, target_existed)
+                return False
+            content_store.delete(source)
+        return True
+
+    def discard_link(self, target, target_existed):
+        """Remove a link made by migrate_blob that no row ended up pointing at."""
+        if not target_existed and not File.objects.filter(file_path=target).exists():
+            content_store.delete(target)
+
+    def handle(self, *args, **options):
+        state_file = options['state_file']
+        last_id = None if options['restart'] else self.load_cursor(state_file)
+        if last_id:
+            self.stdout.write(f"Resuming after {last_id}")
+
+        queryset = File.objects.filter(
+            is_duplicate=False, storage_mode=File.STORAGE_FILE
+        ).order_by('pk').only('id', 'file_path', 'file_hash')
+        moved = 0
+        scanned = 0
+        finished = False
+        while True:
+            batch_queryset = queryset.filter(pk__gt=last_id) if last_id else queryset
+            batch = list(batch_queryset[:options['batch_size']])
+            if not batch:
+                finished = True
+                break
+            for file_obj in batch:
+                if self.migrate_blob(file_obj, options['dry_run']):
+                    moved += 1
+                scanned += 1
+                if options['limit'] and moved >= options['limit']:
+                    break
+            last_id = str(file_obj.pk)
+            if not options['dry_run']:
+                self.save_cursor(state_file, last_id, moved)
+            self.stdout.write(f"Scanned {scanned}, moved {moved}")
+            if options['limit'] and moved >= options['limit']:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        if finished and not options['dry_run'] and os.path.exists(state_file):
+            # A completed pass starts over next time, e.g. after a fan-out change
+            os.remove(state_file)
+        self.stdout.write(self.style.SUCCESS(f"Layout migration done: {moved} blob(s) moved, {scanned} scanned"))
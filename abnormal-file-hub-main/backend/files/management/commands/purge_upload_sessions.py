@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.services import UploadSessionService
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete open upload sessions older than the TTL, along with their chunks. "
+        "Run it from cron, or with --loop as a background worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=settings.UPLOAD_SESSION_TTL_HOURS,
+            help='Maximum age of an open session in hours',
+        )
+        parser.add_argument('--loop', action='store_true', help='Keep purging until interrupted')
+        parser.add_argument('--interval', type=int, default=3600, help='Seconds between purges with --loop')
+
+    def handle(self, *args, **options):
+        service = UploadSessionService()
+        max_age = timedelta(hours=options['hours'])
+        while True:
+            count = service.purge_expired(max_age)
+            if count or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Purged {count} expired upload session(s)"))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
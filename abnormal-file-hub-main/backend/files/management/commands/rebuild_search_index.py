@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from files.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Reinstall and rebuild the filename search index from the File table. "
+        "On SQLite, run this after a VACUUM, which can renumber the rowids the FTS5 index is keyed on."
+    )
+
+    def handle(self, *args, **options):
+        backend = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the {backend.vendor or 'LIKE'} search index"))
@@ -0,0 +1,28 @@
+import json
+from django.core.management.base import BaseCommand
+from files.repositories import StatsRepository
+
+
+class Command(BaseCommand):
+    help = "Recompute storage stats from scratch and report drift from the stored counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Overwrite the counters with the recomputed values')
+        parser.add_argument('--json', action='store_true', help='Print the drift report as JSON')
+
+    def handle(self, *args, **options):
+        drift = StatsRepository.reconcile(fix=options['fix'])
+        if options['json']:
+            self.stdout.write(json.dumps({'drift': drift, 'fixed': bool(drift and options['fix'])}, default=str))
+            return
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Storage counters match the File table"))
+            return
+        for record in drift:
+            self.stdout.write(
+                f"{record['scope']}.{record['field']}: stored={record['stored']} actual={record['actual']}"
+            )
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(drift)} drifted counter(s)"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} drifted counter(s); rerun with --fix to repair"))
@@ -0,0 +1,86 @@
+import signal
+import threading
+import multiprocessing
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from files.jobs import Worker, get_job_queue, handlers
+
+
+def run_worker(kinds, threads, drain):
+    """Entry point of a forked worker process."""
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+    Worker(kinds=kinds, threads=threads, stop_event=stop_event, drain=drain).run()
+
+
+class Command(BaseCommand):
+    help = (
+        "Process post-upload jobs (files/jobs.py) with a pool of worker processes and threads. "
+        "Runs until SIGTERM/SIGINT, finishing the jobs in hand, or with --drain until the queue is empty."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes')
+        parser.add_argument('--threads', type=int, default=1, help='Threads per worker process')
+        parser.add_argument('--kinds', default='', help='Comma-separated job kinds to run (default: all)')
+        parser.add_argument('--drain', action='store_true', help='Exit once no job is claimable')
+        parser.add_argument('--retry-failed', action='store_true', help='Requeue failed jobs first')
+        parser.add_argument(
+            '--prune-days', type=float, default=None,
+            help='Delete jobs that finished successfully more than this many days ago, then exit',
+        )
+        parser.add_argument('--stats', action='store_true', help='Print queue counts and exit')
+
+    def handle(self, *args, **options):
+        queue = get_job_queue()
+        kinds = [kind for kind in options['kinds'].split(',') if kind] or None
+        unknown = set(kinds or []) - set(handlers)
+        if unknown:
+            raise CommandError(f"Unknown job kind(s): {', '.join(sorted(unknown))}")
+
+        if options['stats']:
+            for kind, counts in sorted(queue.get_stats()['kinds'].items()):
+                self.stdout.write(f"{kind}: " + ', '.join(f"{status} {count}" for status, count in counts.items()))
+            return
+        if options['prune_days'] is not None:
+            pruned = queue.prune(timezone.now() - timedelta(days=options['prune_days']))
+            self.stdout.write(self.style.SUCCESS(f"Deleted {pruned} finished job(s)"))
+            return
+        if options['retry_failed']:
+            self.stdout.write(f"Requeued {queue.retry_failed(kinds)} failed job(s)")
+
+        if options['processes'] <= 1:
+            stop_event = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+            signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+            outcomes = Worker(
+                queue, kinds=kinds, threads=options['threads'], stop_event=stop_event, drain=options['drain'],
+            ).run()
+            self.stdout.write(self.style.SUCCESS(
+                f"Jobs done {outcomes['done']}, retrying {outcomes['retry']}, failed {outcomes['failed']}"
+            ))
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=run_worker, args=(kinds, options['threads'], options['drain']))
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(*args):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS(f"{len(processes)} worker process(es) stopped"))
@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import logging
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.scrubber import StoreScrubber, summarize
+
+logger = logging.getLogger('files.scrubber')
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that the content store and the File/Chunk tables agree: re-verify SHA-256 "
+        "of stored blobs and find orphaned and missing blobs. Work is done incrementally "
+        "from a saved cursor and paced by SCRUB_MAX_BYTES_PER_SECOND."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=0, help='Stop after this many items (0 = whole cycle)')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--rate', type=int, default=None, help='Bytes per second to read (0 = unlimited)')
+        parser.add_argument('--fix', action='store_true', help='Queue orphaned blobs for sweep_blobs')
+        parser.add_argument(
+            '--delete-missing', action='store_true',
+            help='Delete File rows (and their duplicates) whose blob is gone',
+        )
+        parser.add_argument('--loop', action='store_true', help='Keep scrubbing until interrupted')
+        parser.add_argument(
+            '--interval', type=int, default=settings.SCRUB_INTERVAL_SECONDS,
+            help='Seconds to pause between runs with --loop',
+        )
+        parser.add_argument(
+            '--state-file',
+            default=os.path.join(settings.MEDIA_ROOT, '.scrub_store.json'),
+            help='Where the cursor and the running report are kept',
+        )
+        parser.add_argument(
+            '--report-file',
+            default=os.path.join(settings.MEDIA_ROOT, '.scrub_report.json'),
+            help='Where the report of the last finished cycle is written',
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore the saved cursor')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def write_report(self, report_file, report):
+        temp_file = f"{report_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(temp_file, report_file)
+
+    def handle(self, *args, **options):
+        scrubber = StoreScrubber(
+            options['state_file'],
+            rate=options['rate'],
+            fix=options['fix'],
+            delete_missing=options['delete_missing'],
+            batch_size=options['batch_size'],
+        )
+        if options['restart']:
+            scrubber.reset()
+
+        while True:
+            report, finished = scrubber.run(options['limit'])
+            logger.info("Scrub %s: %s", 'cycle finished' if finished else 'progress', summarize(report))
+            if finished:
+                self.write_report(options['report_file'], report)
+            if options['json']:
+                self.stdout.write(json.dumps({'finished': finished, 'report': report}))
+            else:
+                style = self.style.SUCCESS if finished else self.style.NOTICE
+                self.stdout.write(style(f"{'Cycle finished' if finished else 'Paused'}: {summarize(report)}"))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
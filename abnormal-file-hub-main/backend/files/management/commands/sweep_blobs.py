@@ -0,0 +1,37 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.services import BlobSweepService
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete blobs and chunks whose last reference was removed more than the grace "
+        "period ago. Run it from cron, or with --loop as a background worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-seconds', type=int, default=settings.BLOB_SWEEP_GRACE_SECONDS,
+            help='Minimum age of a pending deletion in seconds',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping until interrupted')
+        parser.add_argument(
+            '--interval', type=int, default=settings.BLOB_SWEEP_INTERVAL_SECONDS,
+            help='Seconds between sweeps with --loop',
+        )
+
+    def handle(self, *args, **options):
+        sweeper = BlobSweepService()
+        grace = timedelta(seconds=options['grace_seconds'])
+        while True:
+            removed, kept = sweeper.sweep(grace, options['batch_size'])
+            if removed or kept or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Removed {removed} blob(s), kept {kept} that are referenced again"
+                ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
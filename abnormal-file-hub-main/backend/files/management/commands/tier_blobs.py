@@ -0,0 +1,55 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from files.blobstores import TieredBlobStore, get_blob_store
+from files.locks import NAMESPACE_CHUNKS, NAMESPACE_FILES, HashLock
+
+AREAS = [('uploads', NAMESPACE_FILES), ('chunks', NAMESPACE_CHUNKS)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Move blobs not read for TIER_COLD_AFTER_DAYS from the hot (local) tier to the "
+        "cold (S3) tier. Only meaningful with FILE_STORAGE_BACKEND=tiered."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=float, default=settings.TIER_COLD_AFTER_DAYS,
+            help='Demote blobs whose last read is older than this many days',
+        )
+        parser.add_argument('--limit', type=int, default=0, help='Stop after this many blobs (0 = no limit)')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        store = get_blob_store()
+        if not isinstance(store, TieredBlobStore):
+            raise CommandError(f"FILE_STORAGE_BACKEND is '{settings.FILE_STORAGE_BACKEND}', not 'tiered'")
+
+        cutoff = time.time() - options['days'] * 86400
+        moved = 0
+        moved_bytes = 0
+        for area, namespace in AREAS:
+            for key, stat in store.iter_cold_candidates(area, cutoff):
+                if options['limit'] and moved >= options['limit']:
+                    break
+                if options['dry_run']:
+                    self.stdout.write(f"{key} ({stat.size} bytes)")
+                    moved += 1
+                    moved_bytes += stat.size
+                    continue
+                # Same lock as ingest and sweep_blobs, so a blob is not
+                # demoted while it is being re-uploaded or deleted
+                with HashLock([os.path.basename(key)[:64]], namespace):
+                    try:
+                        if not store.demote(key):
+                            continue
+                    except Exception as e:
+                        self.stderr.write(f"Error demoting {key}: {str(e)}")
+                        continue
+                moved += 1
+                moved_bytes += stat.size
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {moved} blob(s), {moved_bytes} bytes, to the cold tier"))
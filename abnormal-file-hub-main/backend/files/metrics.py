@@ -0,0 +1,212 @@
+import time
+import random
+import logging
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from django.conf import settings
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(1024 * 4 ** power for power in range(12))  # 1KB .. 4GB
+
+# Timings of the request being served, for the Server-Timing header
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labelnames, values, extra=''):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        if not settings.METRICS_ENABLED:
+            return
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            yield f'{self.name}_total{format_labels(self.labelnames, label_values)} {format_value(value)}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram. With a timing name, observations are
+    also added to the current request's Server-Timing header."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS, timing=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.timing = timing
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        if not settings.METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                # One slot per bucket plus +Inf, then the sum
+                counts = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+        if self.timing:
+            add_timing('-'.join((self.timing,) + label_values), value)
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self):
+        with self.lock:
+            items = sorted((label_values, list(counts)) for label_values, counts in self.values.items())
+        for label_values, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"' if bound == '+Inf' else f'le="{format_value(float(bound))}"'
+                yield f'{self.name}_bucket{format_labels(self.labelnames, label_values, le)} {cumulative}'
+            labels = format_labels(self.labelnames, label_values)
+            yield f'{self.name}_sum{labels} {format_value(counts[-1])}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+INGEST_SECONDS = registry.register(Histogram(
+    'filehub_ingest_seconds', 'Time spent per upload in each ingest stage', ['stage'], timing='ingest',
+))
+INGEST_BYTES = registry.register(Histogram(
+    'filehub_ingest_bytes', 'Size of ingested uploads', buckets=BYTES_BUCKETS,
+))
+DB_SECONDS = registry.register(Histogram(
+    'filehub_db_seconds', 'Time spent in ingest database operations', ['operation'], timing='db',
+))
+DEDUP_HITS = registry.register(Counter(
+    'filehub_dedup_hits', 'Uploads stored as a reference to existing content',
+))
+INGEST_RACES = registry.register(Counter(
+    'filehub_ingest_races', 'Uploads that found their content stored concurrently by another request',
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    'filehub_request_seconds', 'Time to build the response, per view and action', ['view', 'action', 'method'],
+))
+REQUEST_BYTES = registry.register(Histogram(
+    'filehub_request_bytes', 'Request body size', ['view', 'action'], buckets=BYTES_BUCKETS,
+))
+RESPONSE_BYTES = registry.register(Histogram(
+    'filehub_response_bytes', 'Response size where known up front', ['view', 'action'], buckets=BYTES_BUCKETS,
+))
+RESPONSES = registry.register(Counter(
+    'filehub_responses', 'Responses per view, action and status code', ['view', 'action', 'status'],
+))
+ERRORS = registry.register(Counter(
+    'filehub_errors', 'Responses with a 5xx status, per view and action', ['view', 'action'],
+))
+ADMISSION_REJECTIONS = registry.register(Counter(
+    'filehub_admission_rejections', 'Uploads turned away by admission control, per reason', ['reason'],
+))
+
+
+def add_timing(name, seconds):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def start_request():
+    """Begin collecting timings for the current request; returns a token for finish_request()."""
+    return _request_timings.set({})
+
+
+def finish_request(token):
+    """Stop collecting and return the request's {name: seconds}."""
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return timings
+
+
+def format_server_timing(timings, total):
+    entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.items()]
+    entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
+
+
+def observe_request(view, action, method, status_code, seconds, request_bytes=None, response_bytes=None):
+    """Record one served request in the request metrics."""
+    if not settings.METRICS_ENABLED:
+        return
+    REQUEST_SECONDS.observe(seconds, view, action, method)
+    RESPONSES.inc(view, action, str(status_code))
+    if status_code >= 500:
+        ERRORS.inc(view, action)
+    if request_bytes:
+        REQUEST_BYTES.observe(request_bytes, view, action)
+    if response_bytes is not None:
+        RESPONSE_BYTES.observe(response_bytes, view, action)
+
+
+def log_event(logger, event, level=logging.INFO, sample_rate=1.0, **fields):
+    """Structured log line `event key=value ...`, sampled at sample_rate.
+
+    Nothing is formatted unless the logger is enabled for level and the
+    event is sampled; the fields are also passed as `extra` for JSON
+    formatters.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    logger.log(
+        level, '%s %s', event, ' '.join(f'{key}={value}' for key, value in fields.items()),
+        extra={'event': event, 'fields': fields},
+    )
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chunk',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.IntegerField()),
+                ('reference_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='storage_mode',
+            field=models.CharField(choices=[('file', 'Whole file'), ('chunked', 'Chunk manifest')], default='file', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='FileChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('offset', models.BigIntegerField()),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='files.chunk')),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='manifest', to='files.file')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='filechunk',
+            constraint=models.UniqueConstraint(fields=('file', 'position'), name='unique_file_chunk_position'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_chunk_store'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['uploaded_at', 'id'], name='files_file_uploade_964dac_idx'),
+        ),
+    ]
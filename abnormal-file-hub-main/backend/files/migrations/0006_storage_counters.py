@@ -0,0 +1,97 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:36
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_counters(apps, schema_editor):
+    """Seed the counters from the existing File and Chunk rows."""
+    File = apps.get_model('files', 'File')
+    Chunk = apps.get_model('files', 'Chunk')
+    StorageCounter = apps.get_model('files', 'StorageCounter')
+    StorageRollup = apps.get_model('files', 'StorageRollup')
+
+    unique = File.objects.filter(is_duplicate=False)
+    StorageCounter.objects.create(
+        pk=1,
+        total_files=File.objects.count(),
+        unique_files=unique.count(),
+        duplicate_files=File.objects.filter(is_duplicate=True).count(),
+        total_size=File.objects.aggregate(Sum('size'))['size__sum'] or 0,
+        unique_size=unique.aggregate(Sum('size'))['size__sum'] or 0,
+        chunked_size=unique.filter(storage_mode='chunked').aggregate(Sum('size'))['size__sum'] or 0,
+        chunk_count=Chunk.objects.count(),
+        chunk_stored_size=Chunk.objects.aggregate(Sum('size'))['size__sum'] or 0,
+    )
+    rows = (
+        File.objects.annotate(day=TruncDate('uploaded_at'))
+        .values('file_type', 'day')
+        .annotate(
+            rollup_total_files=Count('id'),
+            rollup_unique_files=Count('id', filter=Q(is_duplicate=False)),
+            rollup_duplicate_files=Count('id', filter=Q(is_duplicate=True)),
+            rollup_total_size=Sum('size'),
+            rollup_unique_size=Sum('size', filter=Q(is_duplicate=False)),
+        )
+        .order_by()
+    )
+    StorageRollup.objects.bulk_create([
+        StorageRollup(
+            file_type=row['file_type'],
+            day=row['day'],
+            total_files=row['rollup_total_files'],
+            unique_files=row['rollup_unique_files'],
+            duplicate_files=row['rollup_duplicate_files'],
+            total_size=row['rollup_total_size'] or 0,
+            unique_size=row['rollup_unique_size'] or 0,
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0005_filename_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_files', models.BigIntegerField(default=0)),
+                ('unique_files', models.BigIntegerField(default=0)),
+                ('duplicate_files', models.BigIntegerField(default=0)),
+                ('total_size', models.BigIntegerField(default=0)),
+                ('unique_size', models.BigIntegerField(default=0)),
+                ('chunked_size', models.BigIntegerField(default=0)),
+                ('chunk_count', models.BigIntegerField(default=0)),
+                ('chunk_stored_size', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StorageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_type', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('total_files', models.BigIntegerField(default=0)),
+                ('unique_files', models.BigIntegerField(default=0)),
+                ('duplicate_files', models.BigIntegerField(default=0)),
+                ('total_size', models.BigIntegerField(default=0)),
+                ('unique_size', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day', 'file_type'],
+                'indexes': [models.Index(fields=['day'], name='files_stora_day_937326_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='storagerollup',
+            constraint=models.UniqueConstraint(fields=('file_type', 'day'), name='unique_rollup_type_day'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0006_storage_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='content_encoding',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='stored_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='storagecounter',
+            name='compressed_size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='storagecounter',
+            name='compressed_stored_size',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
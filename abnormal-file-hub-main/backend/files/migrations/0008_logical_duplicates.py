@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_at_rest_compression'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingBlobDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255)),
+                ('kind', models.CharField(choices=[('file', 'Whole-file blob'), ('chunk', 'Chunk')], default='file', max_length=10)),
+                ('key', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='file_hash',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='file',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_duplicate', False)), fields=('file_hash',), name='unique_canonical_file_hash'),
+        ),
+    ]
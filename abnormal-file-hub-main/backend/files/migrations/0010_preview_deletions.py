@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0009_job_queue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pendingblobdeletion',
+            name='kind',
+            field=models.CharField(choices=[('file', 'Whole-file blob'), ('chunk', 'Chunk'), ('preview', 'Previews of a content hash')], default='file', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0010_preview_deletions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('open', 'Open'), ('committing', 'Committing'), ('committed', 'Committed')], default='open', max_length=20),
+        ),
+    ]
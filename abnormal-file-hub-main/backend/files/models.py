@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 import uuid
 import os
@@ -18,6 +19,13 @@ def calculate_file_hash(file_obj):
     return sha256_hash.hexdigest()
 
 class File(models.Model):
+    STORAGE_FILE = 'file'
+    STORAGE_CHUNKED = 'chunked'
+    STORAGE_CHOICES = [
+        (STORAGE_FILE, 'Whole file'),
+        (STORAGE_CHUNKED, 'Chunk manifest'),
+    ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     file = models.FileField(upload_to=file_upload_path)
     original_filename = models.CharField(max_length=255)
@@ -25,10 +33,15 @@ class File(models.Model):
     file_type = models.CharField(max_length=50)
     size = models.BigIntegerField()
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    file_hash = models.CharField(max_length=64, unique=True)
+    file_hash = models.CharField(max_length=64)
     is_duplicate = models.BooleanField(default=False)
     original_file = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='duplicates')
+    # On the canonical row: the number of File rows (itself included) sharing its blob
     reference_count = models.IntegerField(default=1)
+    storage_mode = models.CharField(max_length=10, choices=STORAGE_CHOICES, default=STORAGE_FILE)
+    # At-rest codec of the blob ('' = stored raw) and its size on disk when encoded
+    content_encoding = models.CharField(max_length=16, blank=True, default='')
+    stored_size = models.BigIntegerField(null=True, blank=True)
     
     class Meta:
         ordering = ['-uploaded_at']
@@ -37,29 +50,253 @@ class File(models.Model):
             models.Index(fields=['file_type']),
             models.Index(fields=['uploaded_at']),
             models.Index(fields=['size']),
+            models.Index(fields=['uploaded_at', 'id']),
+        ]
+        constraints = [
+            # Each blob has exactly one canonical row; duplicates are logical
+            # rows pointing at it through original_file.
+            models.UniqueConstraint(
+                fields=['file_hash'],
+                condition=models.Q(is_duplicate=False),
+                name='unique_canonical_file_hash',
+            ),
         ]
     
     def __str__(self):
         return self.original_filename
 
     def get_file_path(self):
-        """Get the full file path."""
-        return os.path.join('media', self.file_path)
-
-    def delete(self, *args, **kwargs):
-        """Delete the file from storage when the model is deleted."""
-        try:
-            # Only delete the actual file if it's not a duplicate
-            if not self.is_duplicate:
-                full_path = os.path.join('media', self.file_path)
-                if os.path.exists(full_path):
-                    os.remove(full_path)
-        except Exception as e:
-            # Log the error but continue with model deletion
-            print(f"Error deleting file: {str(e)}")
-        super().delete(*args, **kwargs)
+        """Get the full file path (None when the blob store is not a local disk)."""
+        from .storage import content_store
+        return content_store.local_path(self.file_path)
+
+    @property
+    def is_chunked(self):
+        return self.storage_mode == self.STORAGE_CHUNKED
+
+    @property
+    def content_file_id(self):
+        """Id of the row that owns the stored content (manifest, blob bookkeeping)."""
+        if self.is_duplicate and self.original_file_id:
+            return self.original_file_id
+        return self.id
 
     def save(self, *args, **kwargs):
         if not self.file_hash and self.file:
             self.file_hash = calculate_file_hash(self.file)
         super().save(*args, **kwargs)
+
+
+class Chunk(models.Model):
+    """A content-addressed piece of file data shared by chunk manifests."""
+    digest = models.CharField(max_length=64, primary_key=True)
+    size = models.IntegerField()
+    reference_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
+
+    def get_file_path(self):
+        """Get the chunk's key in the blob store."""
+        from .storage import chunk_store_paths
+        return chunk_store_paths.relative_path(self.digest)
+
+
+class FileChunk(models.Model):
+    """One entry of a file's ordered chunk manifest."""
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='manifest')
+    chunk = models.ForeignKey(Chunk, on_delete=models.PROTECT, related_name='+')
+    position = models.IntegerField()
+    offset = models.BigIntegerField()
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'position'], name='unique_file_chunk_position'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_id}#{self.position}"
+
+
+class PendingBlobDeletion(models.Model):
+    """A blob, chunk or set of previews whose last reference is gone, waiting for `sweep_blobs`.
+
+    Deleting a File only touches metadata; the files on disk are removed
+    later, after a grace period and a check that nothing took the content
+    again in the meantime.
+    """
+    KIND_FILE = 'file'
+    KIND_CHUNK = 'chunk'
+    KIND_PREVIEW = 'preview'
+    KIND_CHOICES = [
+        (KIND_FILE, 'Whole-file blob'),
+        (KIND_CHUNK, 'Chunk'),
+        (KIND_PREVIEW, 'Previews of a content hash'),
+    ]
+
+    path = models.CharField(max_length=255)  # blob store key
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=KIND_FILE)
+    key = models.CharField(max_length=64)  # file_hash or chunk digest
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.path
+
+
+class StorageCounter(models.Model):
+    """Running storage totals, kept in step with File rows by FileService.
+
+    There is a single row (pk=1); reading stats is a primary-key lookup
+    instead of aggregate scans over the File table.
+    """
+    total_files = models.BigIntegerField(default=0)
+    unique_files = models.BigIntegerField(default=0)
+    duplicate_files = models.BigIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0)
+    unique_size = models.BigIntegerField(default=0)
+    chunked_size = models.BigIntegerField(default=0)
+    chunk_count = models.BigIntegerField(default=0)
+    chunk_stored_size = models.BigIntegerField(default=0)
+    compressed_size = models.BigIntegerField(default=0)
+    compressed_stored_size = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.total_files} files, {self.total_size} bytes"
+
+
+class StorageRollup(models.Model):
+    """Per file type, per upload day counters for stats breakdowns."""
+    file_type = models.CharField(max_length=50)
+    day = models.DateField()
+    total_files = models.BigIntegerField(default=0)
+    unique_files = models.BigIntegerField(default=0)
+    duplicate_files = models.BigIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0)
+    unique_size = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day', 'file_type']
+        constraints = [
+            models.UniqueConstraint(fields=['file_type', 'day'], name='unique_rollup_type_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.file_type} {self.day}"
+
+
+class UploadSession(models.Model):
+    """A resumable upload assembled from independently uploaded chunks."""
+    STATUS_OPEN = 'open'
+    STATUS_COMMITTING = 'committing'
+    STATUS_COMMITTED = 'committed'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_COMMITTING, 'Committing'),
+        (STATUS_COMMITTED, 'Committed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    original_filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    created_at = models.DateTimeField(auto_now_add=True)
+    file = models.ForeignKey(File, null=True, blank=True, on_delete=models.SET_NULL, related_name='upload_sessions')
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.original_filename} ({self.status})"
+
+    @property
+    def chunk_count(self):
+        """Number of chunks needed to cover total_size."""
+        if self.total_size == 0:
+            return 1
+        return (self.total_size + self.chunk_size - 1) // self.chunk_size
+
+    def expected_chunk_size(self, index):
+        """Size in bytes the chunk at index must have."""
+        if index == self.chunk_count - 1:
+            return self.total_size - index * self.chunk_size
+        return self.chunk_size
+
+    def get_chunk_dir(self):
+        """Get the directory holding this session's chunks."""
+        return os.path.join(settings.MEDIA_ROOT, 'sessions', str(self.id))
+
+    def get_chunk_path(self, index):
+        """Get the full path of a received chunk."""
+        return os.path.join(self.get_chunk_dir(), f"{index}.part")
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    size = models.IntegerField()
+    received_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['index']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='unique_session_chunk'),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id}#{self.index}"
+
+
+class Job(models.Model):
+    """A unit of post-upload work, run by `manage.py run_jobs` (see files/jobs.py).
+
+    (kind, key) is unique and key is the content hash, so enqueueing work
+    that is queued or running is a no-op; enqueueing a finished job queues
+    it again, for content that was deleted and stored again. A claimed job is invisible to other workers
+    until locked_until; if its worker dies it becomes claimable again then.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=32)
+    key = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.IntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_at']
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='unique_job_kind_key'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+            models.Index(fields=['status', 'locked_until']),
+            models.Index(fields=['locked_by']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.key} ({self.status})"
@@ -0,0 +1,112 @@
+import json
+import base64
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """Keyset (seek) pagination on (<ordering field>, id).
+
+    Each page is fetched with `WHERE (field, id) < (last field, last id)`
+    instead of an OFFSET, so the cost of a page does not grow with its depth
+    and rows inserted while paging never shift the window. The cursor is an
+    opaque token holding the last row's key.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    page_size = 50
+    max_page_size = 500
+    default_ordering = '-uploaded_at'
+    tiebreak_field = 'id'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            page_size = self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, request, view):
+        ordering = request.query_params.get(self.ordering_query_param, '').split(',')[0].strip()
+        allowed = getattr(view, 'ordering_fields', [])
+        if ordering.lstrip('-') in allowed:
+            return ordering
+        return self.default_ordering
+
+    def encode_cursor(self, values):
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != 2:
+                raise ValueError
+            return values
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(request, view)
+        field_name = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        model = queryset.model
+        field = model._meta.get_field(field_name)
+        tiebreak = model._meta.get_field(self.tiebreak_field)
+
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{field_name}', f'{prefix}{self.tiebreak_field}')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            raw_value, raw_id = self.decode_cursor(cursor)
+            try:
+                value = field.to_python(raw_value)
+                last_id = tiebreak.to_python(raw_id)
+            except Exception:
+                raise NotFound('Invalid cursor')
+            op = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field_name}__{op}': value})
+                | Q(**{field_name: value, f'{self.tiebreak_field}__{op}': last_id})
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_cursor = None
+        if self.has_next and rows:
+            last = rows[-1]
+            self.next_cursor = self.encode_cursor([
+                field.value_to_string(last),
+                str(getattr(last, self.tiebreak_field)),
+            ])
+        return rows
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
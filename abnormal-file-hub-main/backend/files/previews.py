@@ -0,0 +1,169 @@
+import os
+import logging
+import tempfile
+from collections import namedtuple
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from . import renderers
+from .downloads import DownloadBuilder
+from .executors import discard_preview_executor, get_preview_executor
+from .locks import NAMESPACE_PREVIEWS, HashLock
+from .storage import content_store, preview_store
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_IMAGE = 'image'
+PREVIEW_TEXT = 'text'
+
+IMAGE_TYPES = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'tif', 'tiff'}
+PDF_TYPES = {'pdf'}
+TEXT_TYPES = {
+    'txt', 'csv', 'tsv', 'json', 'jsonl', 'ndjson', 'md', 'log', 'xml', 'yaml', 'yml', 'ini', 'toml',
+    'html', 'css', 'js', 'ts', 'py', 'sql', 'sh',
+}
+
+# A derivative of one piece of content: its key in the preview store is
+# "<file_hash>-<name><extension>", shared by every row with that content
+PreviewSpec = namedtuple('PreviewSpec', ['name', 'extension', 'content_type', 'size'])
+
+# Stored in place of a derivative whose source could not be rendered, so
+# the work is not retried on every request
+FAILED_EXTENSION = '.failed'
+
+
+class PreviewUnavailable(Exception):
+    """There is no preview for this file: unsupported type, too large or unrenderable."""
+
+
+class PreviewBusy(Exception):
+    """The preview could not be rendered right now (pool saturated or restarting); try again later."""
+
+
+def get_preview_type(file_type):
+    """'image' or 'text' when this deployment can preview file_type, else None."""
+    file_type = (file_type or '').lower()
+    if file_type in IMAGE_TYPES and renderers.can_render_images():
+        return PREVIEW_IMAGE
+    if file_type in PDF_TYPES and renderers.can_render_pdfs():
+        return PREVIEW_IMAGE
+    if file_type in TEXT_TYPES:
+        return PREVIEW_TEXT
+    return None
+
+
+class PreviewService:
+    """Thumbnails of images, first-page renders of PDFs and head snippets of text files.
+
+    Derivatives are keyed by content hash and spec, so each is rendered
+    once however many rows share the content; the HashLock makes that
+    single flight across workers too. Images and PDFs are rendered in the
+    preview process pool (renderers.py), so decoding never runs on a web
+    worker's CPU; text snippets are a cheap read and are cut in process.
+    """
+
+    def get_spec(self, file_obj, size=None):
+        preview_type = get_preview_type(file_obj.file_type)
+        if preview_type is None:
+            raise PreviewUnavailable(f"No preview for {file_obj.file_type or 'untyped'} files")
+        if preview_type == PREVIEW_TEXT:
+            return PreviewSpec('head', '.txt', 'text/plain; charset=utf-8', settings.PREVIEW_TEXT_BYTES)
+        size = size or settings.PREVIEW_DEFAULT_SIZE
+        if size not in settings.PREVIEW_SIZES:
+            raise ValueError(f"size must be one of: {', '.join(map(str, settings.PREVIEW_SIZES))}")
+        name = 'page' if file_obj.file_type.lower() in PDF_TYPES else 'thumb'
+        return PreviewSpec(f'{name}{size}', '.jpg', 'image/jpeg', size)
+
+    def get_path(self, file_hash, spec, extension=None):
+        return preview_store.relative_path(f'{file_hash}-{spec.name}', spec.extension if extension is None else extension)
+
+    def get_preview(self, file_obj, size=None):
+        """(spec, relative path) of the file's preview, rendering it first if needed."""
+        spec = self.get_spec(file_obj, size)
+        path = self.get_path(file_obj.file_hash, spec)
+        failed_path = self.get_path(file_obj.file_hash, spec, FAILED_EXTENSION)
+        if preview_store.exists(path):
+            return spec, path
+        if preview_store.exists(failed_path):
+            raise PreviewUnavailable("The file could not be rendered")
+        if file_obj.size > settings.PREVIEW_MAX_SOURCE_SIZE and spec.name != 'head':
+            raise PreviewUnavailable("The file is too large to preview")
+
+        with HashLock([file_obj.file_hash], NAMESPACE_PREVIEWS):
+            # Another worker may have rendered it while this one waited
+            if preview_store.exists(path):
+                return spec, path
+            try:
+                data = self.render(file_obj, spec)
+            except renderers.RenderError as e:
+                # Only the renderer's own verdict on the content is recorded;
+                # PreviewBusy passes through without a marker
+                logger.warning("Cannot render %s preview of %s: %s", spec.name, file_obj.file_hash, e)
+                preview_store.put(failed_path, [b''])
+                raise PreviewUnavailable("The file could not be rendered")
+            preview_store.put(path, [data])
+        return spec, path
+
+    def render(self, file_obj, spec):
+        builder = DownloadBuilder(file_obj)
+        if not builder.exists():
+            raise PreviewUnavailable("File not found in storage")
+        if spec.name == 'head':
+            return self.render_head(builder, file_obj, spec.size)
+
+        # The renderers need a file; raw local blobs are read in place
+        source_path = None
+        if not file_obj.is_chunked and not file_obj.content_encoding:
+            source_path = content_store.local_path(file_obj.file_path)
+        temp_path = None
+        try:
+            if source_path is None:
+                with tempfile.NamedTemporaryFile(dir=os.path.join(settings.MEDIA_ROOT, 'tmp'), delete=False) as f:
+                    temp_path = f.name
+                    if file_obj.size:
+                        for data in builder.iter_range(0, file_obj.size - 1):
+                            f.write(data)
+                source_path = temp_path
+            # PREVIEW_RENDER_TIMEOUT is enforced in the pool process and covers
+            # the render alone; PREVIEW_WAIT_TIMEOUT also covers the queue.
+            render = renderers.render_pdf_page if spec.name.startswith('page') else renderers.render_image
+            try:
+                future = get_preview_executor().submit(render, source_path, spec.size, settings.PREVIEW_RENDER_TIMEOUT)
+                return future.result(timeout=settings.PREVIEW_WAIT_TIMEOUT)
+            except FutureTimeoutError:
+                # Drops the job if it has not started; a running one stops at its own limit
+                future.cancel()
+                raise PreviewBusy("The preview renderers are busy")
+            except BrokenProcessPool:
+                # A renderer process died (e.g. killed, or a decoder fault)
+                discard_preview_executor()
+                raise PreviewBusy("The preview renderers are restarting")
+        finally:
+            if temp_path:
+                os.remove(temp_path)
+
+    def render_head(self, builder, file_obj, limit):
+        """The first lines of a text file, up to limit bytes, as UTF-8."""
+        end = min(file_obj.size, limit) - 1
+        head = b''.join(builder.iter_range(0, end)) if end >= 0 else b''
+        if b'\0' in head:
+            raise renderers.RenderError("Content is not text")
+        if file_obj.size > limit and b'\n' in head:
+            # Do not end on a partial line
+            head = head[:head.rindex(b'\n') + 1]
+        return head.decode('utf-8', errors='replace').encode('utf-8')
+
+    def read(self, path):
+        with preview_store.open(path) as f:
+            return f.read()
+
+    def delete_previews(self, file_hash):
+        """Delete every derivative (and failure marker) of file_hash; returns the count."""
+        prefix = preview_store.relative_path(f'{file_hash}-')
+        deleted = 0
+        for key, _ in preview_store.blobs.list(os.path.dirname(prefix), after=prefix[:-1]):
+            if not key.startswith(prefix):
+                break
+            if preview_store.delete(key):
+                deleted += 1
+        return deleted
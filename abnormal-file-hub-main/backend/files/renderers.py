@@ -0,0 +1,103 @@
+"""Preview renderers, run in the preview process pool (see previews.py).
+
+They take a source path and return the encoded derivative. This module
+must not import Django, so pool processes started with the 'spawn' method
+can import it without configuring settings.
+"""
+import io
+import os
+import signal
+import functools
+import contextlib
+import shutil
+import subprocess
+import tempfile
+import threading
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+
+JPEG_QUALITY = 80
+
+
+class RenderError(Exception):
+    """The source cannot be rendered (unsupported, corrupt, too large or too slow)."""
+
+
+@contextlib.contextmanager
+def time_limit(seconds):
+    """Raise RenderError if the block runs longer than seconds.
+
+    Uses SIGALRM, so it only applies in a process's main thread, which is
+    where the pool runs its jobs; elsewhere the block runs unlimited.
+    """
+    if not seconds or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expired(signum, frame):
+        raise RenderError(f"Rendering took longer than {seconds}s")
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def can_render_images():
+    return Image is not None
+
+
+@functools.lru_cache(maxsize=None)
+def can_render_pdfs():
+    return Image is not None and shutil.which('pdftoppm') is not None
+
+
+def encode_jpeg(image, size):
+    """Fit image within size x size and encode it as a JPEG."""
+    image.thumbnail((size, size))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def render_image(source_path, size, timeout=None):
+    """JPEG thumbnail of an image, at most size pixels on its longer side."""
+    try:
+        with time_limit(timeout), Image.open(source_path) as image:
+            # Let the JPEG decoder downscale while decoding
+            image.draft('RGB', (size, size))
+            image = ImageOps.exif_transpose(image)
+            return encode_jpeg(image, size)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise RenderError(str(e))
+
+
+def render_pdf_page(source_path, size, timeout):
+    """JPEG render of a PDF's first page, at most size pixels on its longer side."""
+    with tempfile.TemporaryDirectory() as out_dir:
+        out_prefix = os.path.join(out_dir, 'page')
+        try:
+            subprocess.run(
+                ['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(size), '-png',
+                 source_path, out_prefix],
+                check=True, capture_output=True, timeout=timeout,
+            )
+        except subprocess.CalledProcessError as e:
+            raise RenderError(e.stderr.decode(errors='replace').strip() or 'pdftoppm failed')
+        except subprocess.TimeoutExpired:
+            raise RenderError('pdftoppm timed out')
+        with Image.open(out_prefix + '.png') as image:
+            return encode_jpeg(image, size)
@@ -1,7 +1,13 @@
-from django.db.models import Q, Sum
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
+from collections import defaultdict
 from datetime import timedelta
-from .models import File
+from .hash_index import hash_index
+from .models import File, Chunk, StorageCounter, StorageRollup
+from .search import MODE_SUBSTRING, get_search_backend
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,19 +17,57 @@ class FileRepository:
     def get_all_files():
         return File.objects.all()
 
+    @staticmethod
+    def with_list_annotations(queryset):
+        """Load what FileSerializer needs for a page of files in one query.
+
+        The duplicate count is a correlated subquery, so it is evaluated only
+        for the rows of the page rather than grouped over the whole table.
+        """
+        duplicates = (
+            File.objects.filter(original_file=OuterRef('pk'))
+            .order_by()
+            .values('original_file')
+            .annotate(count=Count('*'))
+            .values('count')
+        )
+        return queryset.select_related('original_file').annotate(
+            annotated_duplicates_count=Coalesce(Subquery(duplicates, output_field=IntegerField()), 0)
+        )
+
     @staticmethod
     def get_file_by_hash(file_hash):
-        return File.objects.filter(file_hash=file_hash).first()
+        if not hash_index.might_contain(file_hash):
+            return None
+        file_obj = File.objects.filter(file_hash=file_hash, is_duplicate=False).first()
+        hash_index.record_result(file_obj is not None)
+        return file_obj
+
+    @staticmethod
+    async def aget_file_by_hash(file_hash):
+        if not await hash_index.amight_contain(file_hash):
+            return None
+        file_obj = await File.objects.filter(file_hash=file_hash, is_duplicate=False).afirst()
+        hash_index.record_result(file_obj is not None)
+        return file_obj
+
+    @staticmethod
+    def get_files_by_hashes(file_hashes):
+        """Map each known hash in file_hashes to its canonical File, in one query per batch."""
+        file_hashes = [h for h in file_hashes if hash_index.might_contain(h)]
+        found = {}
+        for start in range(0, len(file_hashes), 500):
+            batch = file_hashes[start:start + 500]
+            for file_obj in File.objects.filter(file_hash__in=batch, is_duplicate=False):
+                found[file_obj.file_hash] = file_obj
+        for file_hash in file_hashes:
+            hash_index.record_result(file_hash in found)
+        return found
 
     @staticmethod
     def search_files(filters):
         query = Q()
         
-        # Search by filename
-        filename = filters.get('filename', '')
-        if filename:
-            query &= Q(original_filename__icontains=filename)
-        
         # Filter by file type
         file_type = filters.get('file_type', '')
         if file_type:
@@ -48,41 +92,228 @@ class FileRepository:
             elif date_range == 'month':
                 query &= Q(uploaded_at__gte=today - timedelta(days=30))
         
-        return File.objects.filter(query)
+        queryset = File.objects.filter(query)
+
+        # Search by filename through the index-backed search backend
+        filename = filters.get('filename', '')
+        if filename:
+            mode = filters.get('match') or MODE_SUBSTRING
+            queryset = get_search_backend().filter(queryset, filename, mode)
+
+        return queryset
 
     @staticmethod
     def get_storage_stats():
         try:
-            # Get total size of unique files
-            total_size = File.objects.filter(is_duplicate=False).aggregate(Sum('size'))['size__sum'] or 0
-            logger.debug(f"Total size of unique files: {total_size}")
-            
-            # Get total size of all files
-            original_size = File.objects.aggregate(Sum('size'))['size__sum'] or 0
-            logger.debug(f"Total size of all files: {original_size}")
-            
-            # Calculate savings
-            savings = original_size - total_size
-            logger.debug(f"Storage savings: {savings}")
-            
-            # Get file counts
-            total_files = File.objects.count()
-            unique_files = File.objects.filter(is_duplicate=False).count()
-            duplicate_files = File.objects.filter(is_duplicate=True).count()
-            
-            logger.debug(f"Total files: {total_files}")
-            logger.debug(f"Unique files: {unique_files}")
-            logger.debug(f"Duplicate files: {duplicate_files}")
-            
-            return {
-                'total_files': total_files,
-                'unique_files': unique_files,
-                'duplicate_files': duplicate_files,
-                'total_size_bytes': original_size,
-                'unique_size_bytes': total_size,
-                'storage_savings_bytes': savings,
-                'storage_savings_percentage': (savings / original_size * 100) if original_size > 0 else 0
-            }
+            counter = StatsRepository.get_counter()
+            logger.debug("Storage counters: %s files, %s bytes", counter.total_files, counter.total_size)
+            return StatsRepository.format_stats(counter)
         except Exception as e:
-            logger.error(f"Error calculating storage stats: {str(e)}")
-            raise 
\ No newline at end of file
+            logger.error("Error calculating storage stats: %s", e)
+            raise
+
+    @staticmethod
+    def get_storage_stats_breakdown(group_by):
+        """Stats per file_type or per upload day, read from the rollup rows."""
+        return StatsRepository.get_breakdown(group_by)
+
+
+COUNTER_FIELDS = [
+    'total_files', 'unique_files', 'duplicate_files', 'total_size', 'unique_size',
+    'chunked_size', 'chunk_count', 'chunk_stored_size', 'compressed_size', 'compressed_stored_size',
+]
+ROLLUP_FIELDS = ['total_files', 'unique_files', 'duplicate_files', 'total_size', 'unique_size']
+
+
+class StatsRepository:
+    """Incrementally maintained storage statistics.
+
+    StorageCounter holds the global totals and StorageRollup the per
+    file_type/day counters. Both are adjusted with F() expressions inside the
+    same transaction as the File insert or delete, and can be recomputed from
+    scratch with `manage.py reconcile_stats`.
+    """
+    COUNTER_ID = 1
+
+    @staticmethod
+    def increment(model, lookup, deltas):
+        updates = {field: F(field) + value for field, value in deltas.items() if value}
+        if not updates:
+            return
+        if model.objects.filter(**lookup).update(**updates):
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **deltas)
+        except IntegrityError:
+            model.objects.filter(**lookup).update(**updates)
+
+    @staticmethod
+    def record_file(file_obj, sign=1):
+        """Apply a File insert (sign=1) or delete (sign=-1) to the counters."""
+        StatsRepository.record_files([file_obj], sign)
+
+    @staticmethod
+    def record_files(file_objs, sign=1):
+        """record_file() for many rows: one counter update plus one per rollup bucket."""
+        totals = dict.fromkeys(ROLLUP_FIELDS + ['chunked_size', 'compressed_size', 'compressed_stored_size'], 0)
+        rollups = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+        for file_obj in file_objs:
+            unique = not file_obj.is_duplicate
+            deltas = {
+                'total_files': sign,
+                'unique_files': sign if unique else 0,
+                'duplicate_files': 0 if unique else sign,
+                'total_size': sign * file_obj.size,
+                'unique_size': sign * file_obj.size if unique else 0,
+            }
+            bucket = rollups[(file_obj.file_type, timezone.localdate(file_obj.uploaded_at))]
+            for field, delta in deltas.items():
+                totals[field] += delta
+                bucket[field] += delta
+            if unique and file_obj.is_chunked:
+                totals['chunked_size'] += sign * file_obj.size
+            if unique and file_obj.content_encoding:
+                totals['compressed_size'] += sign * file_obj.size
+                totals['compressed_stored_size'] += sign * file_obj.stored_size
+        if not rollups:
+            return
+        StatsRepository.increment(StorageCounter, {'pk': StatsRepository.COUNTER_ID}, totals)
+        for (file_type, day), deltas in rollups.items():
+            StatsRepository.increment(StorageRollup, {'file_type': file_type, 'day': day}, deltas)
+
+    @staticmethod
+    def record_chunks(count, size):
+        """Apply chunks added to (positive) or removed from (negative) the chunk store."""
+        StatsRepository.increment(
+            StorageCounter, {'pk': StatsRepository.COUNTER_ID},
+            {'chunk_count': count, 'chunk_stored_size': size},
+        )
+
+    @staticmethod
+    def get_counter():
+        counter = StorageCounter.objects.filter(pk=StatsRepository.COUNTER_ID).first()
+        return counter or StorageCounter(pk=StatsRepository.COUNTER_ID)
+
+    @staticmethod
+    def format_stats(counter):
+        total_size = counter.total_size
+        savings = total_size - counter.unique_size
+        chunk_savings = counter.chunked_size - counter.chunk_stored_size
+        compression_savings = counter.compressed_size - counter.compressed_stored_size
+        return {
+            'total_files': counter.total_files,
+            'unique_files': counter.unique_files,
+            'duplicate_files': counter.duplicate_files,
+            'total_size_bytes': total_size,
+            'unique_size_bytes': counter.unique_size,
+            'storage_savings_bytes': savings,
+            'storage_savings_percentage': (savings / total_size * 100) if total_size > 0 else 0,
+            'chunk_count': counter.chunk_count,
+            'chunk_logical_size_bytes': counter.chunked_size,
+            'chunk_stored_size_bytes': counter.chunk_stored_size,
+            'chunk_savings_bytes': chunk_savings,
+            'chunk_savings_percentage': (chunk_savings / counter.chunked_size * 100) if counter.chunked_size > 0 else 0,
+            'compression_logical_size_bytes': counter.compressed_size,
+            'compression_stored_size_bytes': counter.compressed_stored_size,
+            'compression_savings_bytes': compression_savings,
+            'compression_savings_percentage': (
+                compression_savings / counter.compressed_size * 100
+            ) if counter.compressed_size > 0 else 0,
+            'storage_backend': settings.FILE_STORAGE_BACKEND,
+        }
+
+    @staticmethod
+    def get_breakdown(group_by):
+        if group_by not in ('file_type', 'day'):
+            raise ValueError("group_by must be 'file_type' or 'day'")
+        rows = (
+            StorageRollup.objects.values(group_by)
+            .annotate(**{field: Sum(field) for field in ROLLUP_FIELDS})
+            .order_by(group_by)
+        )
+        result = []
+        for row in rows:
+            row['storage_savings_bytes'] = row['total_size'] - row['unique_size']
+            result.append(row)
+        return result
+
+    @staticmethod
+    def compute_counters():
+        """Recompute every counter with full scans of File and Chunk."""
+        unique = File.objects.filter(is_duplicate=False)
+        encoded = unique.exclude(content_encoding='')
+        return {
+            'total_files': File.objects.count(),
+            'unique_files': unique.count(),
+            'duplicate_files': File.objects.filter(is_duplicate=True).count(),
+            'total_size': File.objects.aggregate(Sum('size'))['size__sum'] or 0,
+            'unique_size': unique.aggregate(Sum('size'))['size__sum'] or 0,
+            'chunked_size': unique.filter(
+                storage_mode=File.STORAGE_CHUNKED
+            ).aggregate(Sum('size'))['size__sum'] or 0,
+            'chunk_count': Chunk.objects.count(),
+            'chunk_stored_size': Chunk.objects.aggregate(Sum('size'))['size__sum'] or 0,
+            'compressed_size': encoded.aggregate(Sum('size'))['size__sum'] or 0,
+            'compressed_stored_size': encoded.aggregate(Sum('stored_size'))['stored_size__sum'] or 0,
+        }
+
+    @staticmethod
+    def compute_rollups():
+        """Recompute the per file_type/day rollups; returns {(file_type, day): counters}."""
+        rows = (
+            File.objects.annotate(day=TruncDate('uploaded_at'))
+            .values('file_type', 'day')
+            .annotate(
+                rollup_total_files=Count('id'),
+                rollup_unique_files=Count('id', filter=Q(is_duplicate=False)),
+                rollup_duplicate_files=Count('id', filter=Q(is_duplicate=True)),
+                rollup_total_size=Sum('size'),
+                rollup_unique_size=Sum('size', filter=Q(is_duplicate=False)),
+            )
+            .order_by()
+        )
+        return {
+            (row['file_type'], row['day']): {field: row[f'rollup_{field}'] or 0 for field in ROLLUP_FIELDS}
+            for row in rows
+        }
+
+    @staticmethod
+    def reconcile(fix=False):
+        """Compare stored counters with a full recomputation.
+
+        Returns a list of drift records; with fix=True the stored counters are
+        overwritten with the recomputed values in one transaction.
+        """
+        with transaction.atomic():
+            drift = []
+            actual = StatsRepository.compute_counters()
+            counter = StatsRepository.get_counter()
+            for field in COUNTER_FIELDS:
+                stored = getattr(counter, field)
+                if stored != actual[field]:
+                    drift.append({'scope': 'total', 'field': field, 'stored': stored, 'actual': actual[field]})
+
+            actual_rollups = StatsRepository.compute_rollups()
+            stored_rollups = {
+                (rollup.file_type, rollup.day): rollup for rollup in StorageRollup.objects.all()
+            }
+            for key in set(actual_rollups) | set(stored_rollups):
+                expected = actual_rollups.get(key, dict.fromkeys(ROLLUP_FIELDS, 0))
+                rollup = stored_rollups.get(key)
+                for field in ROLLUP_FIELDS:
+                    stored = getattr(rollup, field) if rollup else 0
+                    if stored != expected[field]:
+                        drift.append({
+                            'scope': f'{key[0]}/{key[1]}', 'field': field,
+                            'stored': stored, 'actual': expected[field],
+                        })
+
+            if fix and drift:
+                StorageCounter.objects.update_or_create(pk=StatsRepository.COUNTER_ID, defaults=actual)
+                StorageRollup.objects.all().delete()
+                StorageRollup.objects.bulk_create([
+                    StorageRollup(file_type=file_type, day=day, **values)
+                    for (file_type, day), values in actual_rollups.items()
+                ], batch_size=500)
+            return drift
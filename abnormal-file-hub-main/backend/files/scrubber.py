@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from django.conf import settings
+from django.utils import timezone
+from . import codecs
+from .blobstores import LocalBlobStore
+from .executors import get_scrub_executor
+from .models import Chunk, File, PendingBlobDeletion
+from .services import FileService
+from .storage import chunk_store_paths, content_store
+
+logger = logging.getLogger(__name__)
+
+PHASE_FILES = 'files'
+PHASE_CHUNKS = 'chunks'
+PHASE_WALK_UPLOADS = 'walk_uploads'
+PHASE_WALK_CHUNKS = 'walk_chunks'
+PHASE_WALK_TMP = 'walk_tmp'
+PHASES = [PHASE_FILES, PHASE_CHUNKS, PHASE_WALK_UPLOADS, PHASE_WALK_CHUNKS, PHASE_WALK_TMP]
+WALK_AREAS = {PHASE_WALK_UPLOADS: 'uploads', PHASE_WALK_CHUNKS: 'chunks', PHASE_WALK_TMP: 'tmp'}
+
+# Problem paths and ids kept in the report; the counters are always complete
+MAX_REPORTED = 100
+
+
+class RateLimiter:
+    """Paces reads to `rate` bytes per second across all scrub threads (0 = unlimited)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.available_at = time.monotonic()
+
+    def consume(self, amount):
+        if not self.rate or not amount:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.available_at)
+            self.available_at = start + amount / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class ThrottledReader:
+    """File wrapper whose reads are charged to a RateLimiter."""
+
+    def __init__(self, f, limiter):
+        self.f = f
+        self.limiter = limiter
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.limiter.consume(len(data))
+        return data
+
+
+def new_report():
+    return {
+        'started_at': timezone.now().isoformat(),
+        'files_checked': 0,
+        'chunks_checked': 0,
+        'blobs_walked': 0,
+        'bytes_verified': 0,
+        'seconds_spent': 0.0,
+        'missing_files': [],
+        'missing_file_count': 0,
+        'corrupt_files': [],
+        'corrupt_file_count': 0,
+        'missing_chunk_count': 0,
+        'corrupt_chunk_count': 0,
+        'orphans': [],
+        'orphan_count': 0,
+        'orphan_bytes': 0,
+        'orphans_queued': 0,
+        'rows_deleted': 0,
+    }
+
+
+class StoreScrubber:
+    """Incremental consistency check of the File/Chunk tables against the blob store.
+
+    A cycle runs through PHASES in order: re-hash every canonical whole-file
+    blob and every chunk against the digest on record, then walk uploads/,
+    chunks/ and tmp/ for files nothing references. The position within the
+    cycle is kept in a state file, so each run can do a bounded amount of
+    work and the next one carries on. Reads are paced by a RateLimiter and
+    hashed on the scrub thread pool.
+
+    Orphans older than the sweep grace period are queued in
+    PendingBlobDeletion when fixing, so `sweep_blobs` removes them after
+    checking once more that nothing claimed them. Rows whose blob is gone
+    are only reported unless delete_missing is set; corrupt blobs are
+    always only reported.
+    """
+
+    def __init__(self, state_file, rate=None, fix=False, delete_missing=False, batch_size=100):
+        self.state_file = state_file
+        self.limiter = RateLimiter(settings.SCRUB_MAX_BYTES_PER_SECOND if rate is None else rate)
+        self.fix = fix
+        self.delete_missing = delete_missing
+        self.batch_size = batch_size
+        self.state = None
+
+    def load_state(self):
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+            if state.get('phase') in PHASES:
+                return state
+        except (FileNotFoundError, ValueError):
+            pass
+        return {'phase': PHASES[0], 'cursor': None, 'report': new_report()}
+
+    def save_state(self):
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temp_file, self.state_file)
+
+    def reset(self):
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+
+    @property
+    def report(self):
+        return self.state['report']
+
+    def record(self, kind, value):
+        self.report[f'{kind[:-1]}_count'] += 1
+        if len(self.report[kind]) < MAX_REPORTED:
+            self.report[kind].append(value)
+
+    def run(self, limit=0):
+        """Process up to limit items (0 = until the cycle ends).
+
+        Returns (report, finished); a finished cycle's state is cleared so
+        the next run starts over.
+        """
+        self.state = self.load_state()
+        started = time.monotonic()
+        processed = 0
+        finished = False
+        try:
+            while not limit or processed < limit:
+                budget = self.batch_size if not limit else min(self.batch_size, limit - processed)
+                count = self.run_batch(budget)
+                processed += count
+                if count < budget:
+                    index = PHASES.index(self.state['phase'])
+                    if index + 1 == len(PHASES):
+                        finished = True
+                        break
+                    self.state['phase'] = PHASES[index + 1]
+                    self.state['cursor'] = None
+                self.save_state()
+        finally:
+            self.report['seconds_spent'] += time.monotonic() - started
+        if finished:
+            self.report['finished_at'] = timezone.now().isoformat()
+            self.reset()
+        else:
+            self.save_state()
+        return self.report, finished
+
+    def run_batch(self, budget):
+        phase = self.state['phase']
+        if phase == PHASE_FILES:
+            return self.check_files(budget)
+        if phase == PHASE_CHUNKS:
+            return self.check_chunks(budget)
+        return self.walk_area(WALK_AREAS[phase], budget)
+
+    def hash_blob(self, store, relative_path, content_encoding=''):
+        """(sha256 hexdigest, raw size) of a blob, decoding it if needed; None if missing."""
+        sha256_hash = hashlib.sha256()
+        size = 0
+        chunk_size = settings.FILE_UPLOAD_CHUNK_SIZE
+        try:
+            with store.open(relative_path) as f:
+                reader = ThrottledReader(f, self.limiter)
+                if content_encoding:
+                    blocks = codecs.get_codec(content_encoding).iter_decompress(reader, chunk_size)
+                else:
+                    blocks = iter(lambda: reader.read(chunk_size), b'')
+                for data in blocks:
+                    sha256_hash.update(data)
+                    size += len(data)
+        except FileNotFoundError:
+            return None
+        return sha256_hash.hexdigest(), size
+
+    def check_files(self, budget):
+        queryset = File.objects.filter(
+            is_duplicate=False, storage_mode=File.STORAGE_FILE
+        ).order_by('pk').only('id', 'file_path', 'file_hash', 'size', 'content_encoding')
+        cursor = self.state['cursor']
+        batch = list((queryset.filter(pk__gt=cursor) if cursor else queryset)[:budget])
+        executor = get_scrub_executor()
+        futures = [
+            executor.submit(self.hash_blob, content_store, file_obj.file_path, file_obj.content_encoding)
+            for file_obj in batch
+        ]
+        for file_obj, future in zip(batch, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error("Error verifying %s: %s", file_obj.file_path, e)
+                result = ('', -1)
+            self.report['files_checked'] += 1
+            if result is None:
+                logger.warning("Blob missing for file %s: %s", file_obj.id, file_obj.file_path)
+                self.record('missing_files', str(file_obj.id))
+                if self.delete_missing:
+                    self.delete_file_rows(file_obj)
+                continue
+            file_hash, size = result
+            self.report['bytes_verified'] += max(size, 0)
+            if file_hash != file_obj.file_hash or size != file_obj.size:
+                logger.error("Content of %s does not match file %s", file_obj.file_path, file_obj.id)
+                self.record('corrupt_files', str(file_obj.id))
+        if batch:
+            self.state['cursor'] = str(batch[-1].pk)
+        return len(batch)
+
+    def delete_file_rows(self, file_obj):
+        """Drop a canonical row whose blob is gone, together with its duplicates."""
+        file_service = FileService()
+        for duplicate_id in list(file_obj.duplicates.values_list('id', flat=True)):
+            file_service.delete_file(duplicate_id)
+            self.report['rows_deleted'] += 1
+        if file_service.delete_file(file_obj.id):
+            self.report['rows_deleted'] += 1
+
+    def check_chunks(self, budget):
+        queryset = Chunk.objects.order_by('digest').only('digest', 'size')
+        cursor = self.state['cursor']
+        batch = list((queryset.filter(digest__gt=cursor) if cursor else queryset)[:budget])
+        executor = get_scrub_executor()
+        futures = [
+            executor.submit(self.hash_blob, chunk_store_paths, chunk_store_paths.relative_path(chunk.digest))
+            for chunk in batch
+        ]
+        for chunk, future in zip(batch, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error("Error verifying chunk %s: %s", chunk.digest, e)
+                result = ('', -1)
+            self.report['chunks_checked'] += 1
+            if result is None:
+                logger.warning("Chunk missing: %s", chunk.digest)
+                self.report['missing_chunk_count'] += 1
+                continue
+            digest, size = result
+            self.report['bytes_verified'] += max(size, 0)
+            if digest != chunk.digest or size != chunk.size:
+                logger.error("Chunk %s is corrupt", chunk.digest)
+                self.report['corrupt_chunk_count'] += 1
+        if batch:
+            self.state['cursor'] = batch[-1].digest
+        return len(batch)
+
+    def list_area(self, area, after):
+        """(relative_path, BlobStat) of the blobs in an area, in key order."""
+        if area == 'uploads':
+            return content_store.list(after)
+        if area == 'chunks':
+            return chunk_store_paths.list(after)
+        # Upload spools are always local, whatever backend holds the blobs
+        return LocalBlobStore().list(area, after)
+
+    def walk_area(self, area, budget):
+        batch = []
+        for relative_path, stat in self.list_area(area, self.state['cursor']):
+            batch.append((relative_path, stat))
+            if len(batch) >= budget:
+                break
+        if not batch:
+            return 0
+
+        cutoff = time.time() - settings.BLOB_SWEEP_GRACE_SECONDS
+        paths = [relative_path for relative_path, _ in batch]
+        if area == 'chunks':
+            names = [os.path.basename(path) for path in paths]
+            known = set(Chunk.objects.filter(digest__in=names).values_list('digest', flat=True))
+            referenced = {path for path, name in zip(paths, names) if name in known}
+        elif area == 'uploads':
+            referenced = set(File.objects.filter(file_path__in=paths).values_list('file_path', flat=True))
+        else:
+            referenced = set()
+        pending = set(PendingBlobDeletion.objects.filter(path__in=paths).values_list('path', flat=True))
+
+        orphans = []
+        for relative_path, stat in batch:
+            self.report['blobs_walked'] += 1
+            if relative_path in referenced or relative_path in pending:
+                continue
+            # Blobs are moved into place before their row is inserted, and
+            # temp files belong to uploads in progress, so only old ones count
+            if stat.modified_at > cutoff:
+                continue
+            self.record('orphans', relative_path)
+            self.report['orphan_bytes'] += stat.size
+            orphans.append(relative_path)
+
+        if self.fix and orphans:
+            kind = PendingBlobDeletion.KIND_CHUNK if area == 'chunks' else PendingBlobDeletion.KIND_FILE
+            PendingBlobDeletion.objects.bulk_create([
+                PendingBlobDeletion(path=path, kind=kind, key=os.path.basename(path)[:64]) for path in orphans
+            ])
+            self.report['orphans_queued'] += len(orphans)
+        self.state['cursor'] = batch[-1][0]
+        return len(batch)
+
+
+def summarize(report):
+    """One-line summary with throughput, for logs and the command output."""
+    seconds = report['seconds_spent'] or 0.0
+    throughput = report['bytes_verified'] / seconds / 1048576 if seconds else 0.0
+    return (
+        f"files={report['files_checked']} chunks={report['chunks_checked']} walked={report['blobs_walked']} "
+        f"verified={report['bytes_verified']}B ({throughput:.1f} MB/s) "
+        f"missing={report['missing_file_count']}+{report['missing_chunk_count']} "
+        f"corrupt={report['corrupt_file_count']}+{report['corrupt_chunk_count']} "
+        f"orphans={report['orphan_count']} ({report['orphan_bytes']}B, {report['orphans_queued']} queued) "
+        f"rows_deleted={report['rows_deleted']}"
+    )
@@ -0,0 +1,208 @@
+import logging
+from django.db import connection as default_connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+MODE_SUBSTRING = 'substring'
+MODE_PREFIX = 'prefix'
+MODE_RANKED = 'ranked'
+SEARCH_MODES = (MODE_SUBSTRING, MODE_PREFIX, MODE_RANKED)
+
+# Trigram indexes cannot answer queries shorter than one trigram.
+MIN_TRIGRAM_LENGTH = 3
+
+
+class LikeSearchBackend:
+    """Plain LIKE scans; used when no index-backed backend is available."""
+    vendor = None
+
+    def install(self, connection):
+        pass
+
+    def uninstall(self, connection):
+        pass
+
+    def rebuild(self, connection):
+        pass
+
+    def filter(self, queryset, term, mode=MODE_SUBSTRING):
+        if mode == MODE_PREFIX:
+            return queryset.filter(original_filename__istartswith=term)
+        return queryset.filter(original_filename__icontains=term)
+
+
+class SQLiteFTSSearchBackend(LikeSearchBackend):
+    """FTS5 shadow table with the trigram tokenizer (SQLite 3.34+).
+
+    files_file_fts is an external-content index over files_file keyed by
+    rowid and kept in sync by triggers. SQLite migrations that rebuild
+    files_file drop those triggers and renumber rowids, so install() is also
+    run after every migrate and rebuilds the index when triggers are missing.
+    files_file has a UUID primary key, so its rowid is implicit and VACUUM
+    may renumber it too without touching the triggers; run
+    `manage.py rebuild_search_index` after a VACUUM.
+    """
+    vendor = 'sqlite'
+    table = 'files_file_fts'
+    triggers = {
+        'files_file_fts_ai': """
+            CREATE TRIGGER files_file_fts_ai AFTER INSERT ON files_file BEGIN
+                INSERT INTO files_file_fts(rowid, original_filename, file_type)
+                VALUES (new.rowid, new.original_filename, new.file_type);
+            END
+        """,
+        'files_file_fts_ad': """
+            CREATE TRIGGER files_file_fts_ad AFTER DELETE ON files_file BEGIN
+                INSERT INTO files_file_fts(files_file_fts, rowid, original_filename, file_type)
+                VALUES ('delete', old.rowid, old.original_filename, old.file_type);
+            END
+        """,
+        'files_file_fts_au': """
+            CREATE TRIGGER files_file_fts_au AFTER UPDATE OF original_filename, file_type ON files_file BEGIN
+                INSERT INTO files_file_fts(files_file_fts, rowid, original_filename, file_type)
+                VALUES ('delete', old.rowid, old.original_filename, old.file_type);
+                INSERT INTO files_file_fts(rowid, original_filename, file_type)
+                VALUES (new.rowid, new.original_filename, new.file_type);
+            END
+        """,
+    }
+
+    @staticmethod
+    def is_supported(connection):
+        import sqlite3
+        return sqlite3.sqlite_version_info >= (3, 34, 0)
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                "original_filename, file_type, content='files_file', content_rowid='rowid', "
+                "tokenize='trigram')"
+            )
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'files_file'"
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in self.triggers if name not in existing]
+            for name in missing:
+                cursor.execute(self.triggers[name])
+        if missing:
+            self.rebuild(connection)
+
+    def rebuild(self, connection):
+        """Reindex every row of files_file from scratch."""
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+        logger.info("Rebuilt %s search index", self.table)
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            for name in self.triggers:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def match_expression(self, term, mode):
+        if mode == MODE_RANKED:
+            words = [word for word in term.split() if len(word) >= MIN_TRIGRAM_LENGTH]
+            phrases = [self.quote(word) for word in words] or [self.quote(term)]
+            return 'original_filename : (' + ' OR '.join(phrases) + ')'
+        return 'original_filename : ' + self.quote(term)
+
+    @staticmethod
+    def quote(term):
+        return '"' + term.replace('"', '""') + '"'
+
+    def filter(self, queryset, term, mode=MODE_SUBSTRING):
+        if len(term) < MIN_TRIGRAM_LENGTH:
+            return super().filter(queryset, term, mode)
+
+        match = self.match_expression(term, mode)
+        queryset = queryset.annotate(
+            fts_rowid=RawSQL('"files_file".rowid', ())
+        ).filter(
+            fts_rowid__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", (match,))
+        )
+        if mode == MODE_PREFIX:
+            # The index narrows candidates; LIKE on that small set anchors them.
+            queryset = queryset.filter(original_filename__istartswith=term)
+        elif mode == MODE_RANKED:
+            queryset = queryset.annotate(
+                search_rank=RawSQL(
+                    f"SELECT bm25({self.table}) FROM {self.table} "
+                    f"WHERE {self.table} MATCH %s AND {self.table}.rowid = \"files_file\".rowid",
+                    (match,),
+                    output_field=FloatField(),
+                )
+            ).order_by('search_rank', '-uploaded_at')
+        return queryset
+
+
+class PostgresTrigramSearchBackend(LikeSearchBackend):
+    """pg_trgm GIN index over UPPER(original_filename).
+
+    Django compiles icontains/istartswith to
+    UPPER("original_filename"::text) LIKE UPPER(%s) on Postgres, so the
+    index is on that expression; an index on the bare column would never
+    be used by those lookups.
+    """
+    vendor = 'postgresql'
+    index = 'files_file_filename_upper_trgm'
+    # Earlier installs indexed the bare column, which no lookup could use
+    legacy_index = 'files_file_filename_trgm'
+    similarity_threshold = 0.3
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(f"DROP INDEX IF EXISTS {self.legacy_index}")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.index} ON files_file "
+                "USING gin ((UPPER(original_filename::text)) gin_trgm_ops)"
+            )
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {self.index}")
+
+    def rebuild(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"REINDEX INDEX {self.index}")
+
+    def filter(self, queryset, term, mode=MODE_SUBSTRING):
+        if mode != MODE_RANKED or len(term) < MIN_TRIGRAM_LENGTH:
+            return super().filter(queryset, term, mode)
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        return queryset.annotate(
+            search_rank=TrigramSimilarity('original_filename', term)
+        ).filter(
+            Q(original_filename__icontains=term) | Q(search_rank__gt=self.similarity_threshold)
+        ).order_by('-search_rank', '-uploaded_at')
+
+
+def get_search_backend(connection=None):
+    """Pick the best search backend for the database behind connection."""
+    connection = connection or default_connection
+    if connection.vendor == 'sqlite' and SQLiteFTSSearchBackend.is_supported(connection):
+        return SQLiteFTSSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresTrigramSearchBackend()
+    return LikeSearchBackend()
+
+
+def install_search_index(connection=None):
+    get_search_backend(connection).install(connection or default_connection)
+
+
+def uninstall_search_index(connection=None):
+    get_search_backend(connection).uninstall(connection or default_connection)
+
+
+def rebuild_search_index(connection=None):
+    connection = connection or default_connection
+    backend = get_search_backend(connection)
+    backend.install(connection)
+    backend.rebuild(connection)
+    return backend
@@ -1,18 +1,32 @@
+import os
 from rest_framework import serializers
-from .models import File
+from .models import File, UploadSession
+from .previews import get_preview_type
 
 class FileSerializer(serializers.ModelSerializer):
     original_file_details = serializers.SerializerMethodField()
     duplicates_count = serializers.SerializerMethodField()
+    preview_type = serializers.SerializerMethodField()
 
     class Meta:
         model = File
         fields = [
             'id', 'file', 'original_filename', 'file_type', 'size',
             'uploaded_at', 'is_duplicate', 'original_file', 'original_file_details',
-            'reference_count', 'duplicates_count'
+            'reference_count', 'duplicates_count', 'content_encoding', 'stored_size', 'preview_type'
         ]
-        read_only_fields = ['id', 'uploaded_at', 'is_duplicate', 'reference_count']
+        read_only_fields = [
+            'id', 'uploaded_at', 'is_duplicate', 'reference_count', 'content_encoding', 'stored_size'
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sparse fieldsets: ?fields=id,original_filename keeps only those fields,
+        # which also skips the work behind any method fields left out.
+        requested = self.context.get('fields')
+        if requested:
+            for field_name in set(self.fields) - set(requested):
+                self.fields.pop(field_name)
 
     def get_original_file_details(self, obj):
         if obj.original_file:
@@ -26,6 +40,39 @@ class FileSerializer(serializers.ModelSerializer):
         return None
 
     def get_duplicates_count(self, obj):
-        if not obj.is_duplicate:
-            return File.objects.filter(original_file=obj).count()
-        return 0 
\ No newline at end of file
+        if obj.is_duplicate:
+            return 0
+        if hasattr(obj, 'annotated_duplicates_count'):
+            return obj.annotated_duplicates_count
+        return File.objects.filter(original_file=obj).count()
+
+    def get_preview_type(self, obj):
+        return get_preview_type(obj.file_type)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_count = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+    received_bytes = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'original_filename', 'total_size', 'chunk_size', 'chunk_count',
+            'status', 'created_at', 'file', 'received_chunks', 'received_bytes'
+        ]
+        read_only_fields = ['id', 'status', 'created_at', 'file']
+        extra_kwargs = {'chunk_size': {'required': False}}
+
+    def validate_original_filename(self, value):
+        # Same rule as the stream and batch ingest paths: keep the last path component
+        name = os.path.basename(value.strip())
+        if name in ('', '.', '..'):
+            raise serializers.ValidationError('Invalid filename')
+        return name
+
+    def get_received_chunks(self, obj):
+        return [chunk.index for chunk in obj.chunks.all()]
+
+    def get_received_bytes(self, obj):
+        return sum(chunk.size for chunk in obj.chunks.all())
@@ -1,15 +1,132 @@
+import io
 import os
+import shutil
 import hashlib
 import logging
-import traceback
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+import concurrent.futures
+from collections import Counter, defaultdict, namedtuple
 from django.conf import settings
-from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
-from .models import File
-from .repositories import FileRepository
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from . import codecs
+from .cache import NAMESPACE_FILE, NAMESPACE_HASH, NAMESPACE_STATS, invalidate_files, metadata_cache
+from .chunkstore import ChunkStore
+from .executors import get_hash_executor
+from .hash_index import hash_index
+from .jobs import enqueue_post_upload
+from .locks import NAMESPACE_CHUNKS, HashLock
+from .metrics import DB_SECONDS, DEDUP_HITS, INGEST_BYTES, INGEST_RACES, INGEST_SECONDS
+from .models import Chunk, File, PendingBlobDeletion, UploadSession, UploadChunk
+from .previews import PreviewService
+from .repositories import FileRepository, StatsRepository
+from .storage import content_store, preview_store
 
 logger = logging.getLogger(__name__)
 
+
+class UploadSessionError(ValueError):
+    """Raised when a chunked upload request cannot be applied to its session."""
+
+
+class BatchIngestError(ValueError):
+    """Raised when a batch upload request is rejected as a whole."""
+
+
+SpooledUpload = namedtuple(
+    'SpooledUpload', ['temp_path', 'file_hash', 'size', 'content_encoding', 'stored_size']
+)
+
+
+class IngestWriter:
+    """Hashes and writes one incoming upload to a temp file, a chunk at a time.
+
+    Shared by the WSGI views, which drive it from a loop, and the ASGI
+    streaming path, which calls write() from a thread pool as body messages
+    arrive. The hash is always of the raw content; the at-rest encoding is
+    picked from the file type and the first chunk (see codecs.choose_encoding).
+    """
+
+    def __init__(self, original_filename=''):
+        tmp_dir = os.path.join(settings.MEDIA_ROOT, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+        self.file = os.fdopen(fd, 'wb')
+        self.file_type = os.path.splitext(original_filename)[1][1:]
+        self.sha256_hash = hashlib.sha256()
+        self.size = 0
+        self.stored_size = 0
+        self.content_encoding = None
+        self.compressor = None
+        # Seconds per stage, reported to filehub_ingest_seconds by finish()
+        self.hash_seconds = 0.0
+        self.compress_seconds = 0.0
+        self.write_seconds = 0.0
+
+    def write(self, chunk):
+        if self.content_encoding is None:
+            self.content_encoding = codecs.choose_encoding(self.file_type, chunk)
+            if self.content_encoding:
+                self.compressor = codecs.get_codec(self.content_encoding).compressor()
+        started = time.perf_counter()
+        self.sha256_hash.update(chunk)
+        hashed = time.perf_counter()
+        self.hash_seconds += hashed - started
+        self.size += len(chunk)
+        if self.compressor is not None:
+            chunk = self.compressor.compress(chunk)
+            compressed = time.perf_counter()
+            self.compress_seconds += compressed - hashed
+            hashed = compressed
+        self.file.write(chunk)
+        self.write_seconds += time.perf_counter() - hashed
+        self.stored_size += len(chunk)
+
+    def finish(self):
+        """Close the temp file; returns a SpooledUpload."""
+        if self.compressor is not None:
+            tail = self.compressor.flush()
+            self.file.write(tail)
+            self.stored_size += len(tail)
+        self.file.close()
+        if self.content_encoding and self.stored_size >= self.size:
+            # Small or incompressible after all: keep the raw bytes
+            self.decode_in_place()
+        os.chmod(self.temp_path, settings.FILE_UPLOAD_PERMISSIONS)
+        INGEST_SECONDS.observe(self.hash_seconds, 'hash')
+        INGEST_SECONDS.observe(self.write_seconds, 'write')
+        if self.compressor is not None:
+            INGEST_SECONDS.observe(self.compress_seconds, 'compress')
+        INGEST_BYTES.observe(self.size)
+        if not self.content_encoding:
+            return SpooledUpload(self.temp_path, self.sha256_hash.hexdigest(), self.size, '', None)
+        return SpooledUpload(
+            self.temp_path, self.sha256_hash.hexdigest(), self.size, self.content_encoding, self.stored_size
+        )
+
+    def decode_in_place(self):
+        codec = codecs.get_codec(self.content_encoding)
+        raw_path = f"{self.temp_path}.raw"
+        with open(self.temp_path, 'rb') as source, open(raw_path, 'wb') as target:
+            for data in codec.iter_decompress(source, settings.FILE_UPLOAD_CHUNK_SIZE):
+                target.write(data)
+        os.replace(raw_path, self.temp_path)
+        self.content_encoding = ''
+        self.stored_size = self.size
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
 class FileService:
     def __init__(self):
         self.repository = FileRepository()
@@ -20,89 +137,334 @@ class FileService:
             logger.debug("Calculating file hash")
             return hashlib.sha256(file_content).hexdigest()
         except Exception as e:
-            logger.error(f"Error calculating file hash: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error calculating file hash: %s", e)
             raise
 
     def get_file_extension(self, filename):
         """Get file extension from filename."""
         try:
-            logger.debug(f"Getting file extension for: {filename}")
+            logger.debug("Getting file extension for: %s", filename)
             return os.path.splitext(filename)[1].lower()
         except Exception as e:
-            logger.error(f"Error getting file extension: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error getting file extension: %s", e)
             raise
 
+    def iter_chunks(self, file_obj):
+        """Yield the content of an uploaded or plain file object in chunks."""
+        chunk_size = settings.FILE_UPLOAD_CHUNK_SIZE
+        if hasattr(file_obj, 'chunks'):
+            yield from file_obj.chunks(chunk_size)
+            return
+        while True:
+            chunk = file_obj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def write_stream(self, chunks, original_filename=''):
+        """Write chunks to a temp file in MEDIA_ROOT, hashing them in the same pass.
+
+        Returns a SpooledUpload. The temp file lives on the same filesystem as
+        the uploads directory so it can be renamed atomically.
+        """
+        writer = IngestWriter(original_filename)
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+            return writer.finish()
+        except Exception:
+            writer.abort()
+            raise
+
+    def get_blob_path(self, file_hash, file_extension, content_encoding=''):
+        """Content-store path of a blob; encoded blobs carry the codec's suffix."""
+        if content_encoding:
+            file_extension += codecs.get_codec(content_encoding).suffix
+        return content_store.relative_path(file_hash, file_extension)
+
+    def find_existing(self, file_hash):
+        """Fetch the canonical row that won a file_hash race, bypassing the hash index."""
+        with DB_SECONDS.time('lookup'):
+            existing_file = File.objects.filter(file_hash=file_hash, is_duplicate=False).first()
+        if existing_file is not None:
+            hash_index.add(file_hash)
+        return existing_file
+
+    def find_existing_by_hashes(self, file_hashes):
+        """find_existing() for many hashes; returns {file_hash: File}."""
+        file_hashes = list(file_hashes)
+        found = {}
+        for start in range(0, len(file_hashes), 500):
+            for file_obj in File.objects.filter(file_hash__in=file_hashes[start:start + 500], is_duplicate=False):
+                found[file_obj.file_hash] = file_obj
+                hash_index.add(file_obj.file_hash)
+        return found
+
+    def build_reference(self, canonical, original_filename):
+        """An unsaved duplicate row for canonical's content under the uploader's own name."""
+        file_extension = self.get_file_extension(original_filename)
+        return File(
+            original_filename=original_filename,
+            file_path=canonical.file_path,
+            file_type=file_extension[1:],  # Remove the dot
+            size=canonical.size,
+            file_hash=canonical.file_hash,
+            is_duplicate=True,
+            original_file=canonical,
+            reference_count=0,
+            storage_mode=canonical.storage_mode,
+            content_encoding=canonical.content_encoding,
+            stored_size=canonical.stored_size
+        )
+
+    def create_reference(self, canonical, original_filename):
+        """Record a duplicate upload as a metadata row sharing canonical's blob.
+
+        The canonical row's reference_count is bumped with an F() update in
+        the same transaction, so concurrent uploads and deletes never lose a
+        count. Returns None if canonical was deleted or demoted meanwhile.
+        """
+        with DB_SECONDS.time('reference'), transaction.atomic():
+            updated = File.objects.filter(pk=canonical.pk, is_duplicate=False).update(
+                reference_count=F('reference_count') + 1
+            )
+            if not updated:
+                return None
+            # Re-read under the row lock just taken: migrate_layout may have
+            # moved the blob since canonical was loaded
+            canonical = File.objects.get(pk=canonical.pk)
+            file_obj = self.build_reference(canonical, original_filename)
+            file_obj.save(force_insert=True)
+            StatsRepository.record_file(file_obj)
+            invalidate_files([canonical, file_obj])
+        DEDUP_HITS.inc()
+        return file_obj
+
+    def add_reference(self, existing_file, original_filename):
+        """create_reference(), following the content to its new canonical row if
+        existing_file went away after the lookup. Returns None if nothing holds
+        the content any more."""
+        while existing_file is not None:
+            file_obj = self.create_reference(existing_file, original_filename)
+            if file_obj is not None:
+                return file_obj
+            existing_file = self.find_existing(existing_file.file_hash)
+        return None
+
     def save_file(self, file_obj, original_filename):
         """Save file and create database record."""
+        return self.save_stream(self.iter_chunks(file_obj), original_filename)
+
+    def save_stream(self, chunks, original_filename):
+        """Ingest an iterable of byte chunks and create the database record.
+
+        The content is hashed and written to disk in a single pass, so memory
+        use is bounded by the chunk size regardless of the file size.
+        """
+        if settings.FILE_STORE_MODE == File.STORAGE_CHUNKED:
+            return self.save_chunked_stream(chunks, original_filename)
+
+        temp_path = None
         try:
-            logger.info(f"Starting file save process for: {original_filename}")
+            logger.info("Starting file save process for: %s", original_filename)
             
-            # Read file content
-            logger.debug("Reading file content")
-            file_content = file_obj.read()
-            
-            # Calculate file hash
-            logger.debug("Calculating file hash")
-            file_hash = self.calculate_file_hash(file_content)
-            logger.debug(f"File hash: {file_hash}")
+            # Stream content to a temp file while hashing it
+            logger.debug("Streaming file content to temp file")
+            spooled = self.write_stream(chunks, original_filename)
+            temp_path, file_hash = spooled.temp_path, spooled.file_hash
+            logger.debug("File hash: %s, encoding: %s", file_hash, spooled.content_encoding or 'identity')
             
             # Check for duplicate
             logger.debug("Checking for duplicate file")
-            existing_file = self.repository.get_file_by_hash(file_hash)
+            with DB_SECONDS.time('lookup'):
+                existing_file = self.repository.get_file_by_hash(file_hash)
             if existing_file:
-                logger.info(f"Duplicate file found: {existing_file.original_filename}")
-                return existing_file, True
+                logger.info("Duplicate file found: %s", existing_file.original_filename)
+                file_obj = self.add_reference(existing_file, original_filename)
+                if file_obj is not None:
+                    os.remove(temp_path)
+                    return file_obj, True
             
+            return self.store_new_file(spooled, original_filename)
+
+        except Exception as e:
+            logger.exception("Error saving file: %s", e)
+            # Clean up the temp file if it was not moved into place
+            if temp_path and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except Exception as cleanup_error:
+                    logger.error("Error cleaning up file: %s", cleanup_error)
+            raise
+
+    def store_new_file(self, spooled, original_filename):
+        """Move a SpooledUpload into the content store and create its record.
+
+        Single flight per hash: the commit runs under the hash's HashLock and
+        re-checks the table first, so when several workers receive the same
+        content at once exactly one moves its blob into place and inserts the
+        canonical row; the others wait for it, drop their temp file and
+        record a reference to that row. The unique constraint stays as a
+        backstop for workers that do not share the lock directory.
+        Returns a (file_obj, is_duplicate) tuple like save_stream.
+        """
+        temp_path, file_hash = spooled.temp_path, spooled.file_hash
+        committed_path = None
+        try:
             # Get file extension
             logger.debug("Getting file extension")
             file_extension = self.get_file_extension(original_filename)
             
-            # Generate unique filename
-            unique_filename = f"{file_hash}{file_extension}"
-            logger.debug(f"Generated unique filename: {unique_filename}")
-            
-            # Create uploads directory if it doesn't exist
-            uploads_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
-            os.makedirs(uploads_dir, exist_ok=True)
-            
-            # Save file to storage
-            logger.debug("Saving file to storage")
-            file_path = os.path.join('uploads', unique_filename)
-            full_path = os.path.join(settings.MEDIA_ROOT, file_path)
-            
-            # Write file content
-            with open(full_path, 'wb') as f:
-                f.write(file_content)
+            # Generate the content-addressed path
+            file_path = self.get_blob_path(file_hash, file_extension, spooled.content_encoding)
+            logger.debug("Generated file path: %s", file_path)
             
-            logger.debug(f"File saved to: {file_path}")
-            
-            # Create database record
-            logger.debug("Creating database record")
-            file_obj = File.objects.create(
-                original_filename=original_filename,
-                file_path=file_path,
-                file_type=file_extension[1:],  # Remove the dot
-                size=len(file_content),
-                file_hash=file_hash,
-                is_duplicate=False
-            )
-            logger.info(f"File saved successfully: {original_filename}")
+            with HashLock([file_hash]):
+                existing_file = self.find_existing(file_hash)
+                if existing_file is not None:
+                    logger.info("Stored concurrently as: %s", existing_file.original_filename)
+                    INGEST_RACES.inc()
+                    file_obj = self.add_reference(existing_file, original_filename)
+                    if file_obj is not None:
+                        os.remove(temp_path)
+                        return file_obj, True
+
+                # Move the temp file into place
+                logger.debug("Saving file to storage")
+                with INGEST_SECONDS.time('commit'):
+                    content_store.commit(temp_path, file_path)
+                committed_path = file_path
+                logger.debug("File saved to: %s", file_path)
+
+                # Create database record
+                logger.debug("Creating database record")
+                try:
+                    with DB_SECONDS.time('insert'), transaction.atomic():
+                        file_obj = File.objects.create(
+                            original_filename=original_filename,
+                            file_path=file_path,
+                            file_type=file_extension[1:],  # Remove the dot
+                            size=spooled.size,
+                            file_hash=file_hash,
+                            is_duplicate=False,
+                            content_encoding=spooled.content_encoding,
+                            stored_size=spooled.stored_size
+                        )
+                        StatsRepository.record_file(file_obj)
+                        invalidate_files([file_obj])
+                        enqueue_post_upload([file_obj])
+                except IntegrityError:
+                    INGEST_RACES.inc()
+                    existing_file = self.find_existing(file_hash)
+                    if existing_file is None:
+                        raise
+                    if existing_file.file_path == file_path:
+                        # Same bytes at the same path: the blob is the winner's now
+                        committed_path = None
+                    file_obj = self.add_reference(existing_file, original_filename)
+                    if file_obj is None:
+                        raise
+                    if committed_path:
+                        content_store.delete(committed_path)
+                    return file_obj, True
+            logger.info("File saved successfully: %s", original_filename)
             
             return file_obj, False
             
-        except Exception as e:
-            logger.error(f"Error saving file: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+        except Exception:
             # Clean up any partially saved files
-            if 'full_path' in locals() and os.path.exists(full_path):
+            try:
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
+                if committed_path:
+                    content_store.delete(committed_path)
+            except Exception as cleanup_error:
+                logger.error("Error cleaning up file: %s", cleanup_error)
+            raise
+
+    def save_chunked_stream(self, chunks, original_filename):
+        """Ingest chunks into the chunk store and record the file as a manifest."""
+        chunk_store = ChunkStore()
+        new_digests = []
+        try:
+            logger.info("Starting chunked file save process for: %s", original_filename)
+            with INGEST_SECONDS.time('chunk'):
+                file_hash, size, manifest, new_digests = chunk_store.write_stream(chunks)
+            logger.debug("File hash: %s, %s chunks, %s new", file_hash, len(manifest), len(new_digests))
+
+            with DB_SECONDS.time('lookup'):
+                existing_file = self.repository.get_file_by_hash(file_hash)
+            if existing_file:
+                logger.info("Duplicate file found: %s", existing_file.original_filename)
+                file_obj = self.add_reference(existing_file, original_filename)
+                if file_obj is not None:
+                    chunk_store.discard(new_digests)
+                    return file_obj, True
+
+            file_extension = self.get_file_extension(original_filename)
+            # Same single flight as store_new_file. The chunk locks nest inside
+            # the file lock, and both are taken before the transaction opens,
+            # in the same HashLock -> atomic order as store_new_file.
+            with HashLock([file_hash]):
+                existing_file = self.find_existing(file_hash)
+                if existing_file is not None:
+                    INGEST_RACES.inc()
+                    file_obj = self.add_reference(existing_file, original_filename)
+                    if file_obj is not None:
+                        chunk_store.discard(new_digests)
+                        return file_obj, True
                 try:
-                    os.remove(full_path)
-                except Exception as cleanup_error:
-                    logger.error(f"Error cleaning up file: {str(cleanup_error)}")
+                    with chunk_store.lock(manifest), DB_SECONDS.time('insert'), transaction.atomic():
+                        file_obj = File.objects.create(
+                            original_filename=original_filename,
+                            file_path='',
+                            file_type=file_extension[1:],  # Remove the dot
+                            size=size,
+                            file_hash=file_hash,
+                            is_duplicate=False,
+                            storage_mode=File.STORAGE_CHUNKED
+                        )
+                        chunk_store.create_manifest(file_obj, manifest)
+                        StatsRepository.record_file(file_obj)
+                        invalidate_files([file_obj])
+                        enqueue_post_upload([file_obj])
+                except IntegrityError:
+                    INGEST_RACES.inc()
+                    existing_file = self.find_existing(file_hash)
+                    file_obj = self.add_reference(existing_file, original_filename)
+                    if file_obj is None:
+                        raise
+                    chunk_store.discard(new_digests)
+                    return file_obj, True
+            logger.info("File saved successfully: %s", original_filename)
+
+            return file_obj, False
+
+        except Exception as e:
+            logger.exception("Error saving chunked file: %s", e)
+            chunk_store.discard(new_digests)
             raise
 
+    def get_file(self, file_id):
+        """Fetch a file by id through the metadata cache; None if it does not exist."""
+        def load():
+            try:
+                return File.objects.get(pk=file_id)
+            except (File.DoesNotExist, ValueError, ValidationError):
+                return None
+        return metadata_cache.get_or_load(NAMESPACE_FILE, str(file_id), load)
+
+    def find_by_hash(self, file_hash):
+        """Look up a file by its SHA-256 hash."""
+        file_hash = file_hash.lower()
+        return metadata_cache.get_or_load(
+            NAMESPACE_HASH, file_hash, lambda: self.repository.get_file_by_hash(file_hash)
+        )
+
+    def find_by_hashes(self, file_hashes):
+        """Look up many hashes at once; returns {hash: File} for those that exist."""
+        return self.repository.get_files_by_hashes({file_hash.lower() for file_hash in file_hashes})
+
     def search_files(self, filters):
         """Search files with filters."""
         return self.repository.search_files(filters)
@@ -111,23 +473,556 @@ class FileService:
         """Get storage statistics."""
         try:
             logger.debug("Getting storage stats from repository")
-            stats = self.repository.get_storage_stats()
-            logger.debug(f"Retrieved storage stats: {stats}")
+            stats = metadata_cache.get_or_load(NAMESPACE_STATS, 'total', self.repository.get_storage_stats)
+            logger.debug("Retrieved storage stats: %s", stats)
             return stats
         except Exception as e:
-            logger.error(f"Error in get_storage_stats service: {str(e)}")
+            logger.error("Error in get_storage_stats service: %s", e)
             raise
 
+    def get_storage_stats_breakdown(self, group_by):
+        """Get storage statistics grouped by file_type or upload day."""
+        return metadata_cache.get_or_load(
+            NAMESPACE_STATS, group_by, lambda: self.repository.get_storage_stats_breakdown(group_by)
+        )
+
     def delete_file(self, file_id):
-        """Delete file and its record."""
+        """Delete a file record and drop its reference on the stored content.
+
+        Only metadata changes here. Deleting a duplicate decrements the
+        canonical row's reference_count; deleting a canonical row that still
+        has duplicates hands the content over to the oldest of them. When the
+        last reference goes, the blob (or the manifest's chunks) is queued in
+        PendingBlobDeletion for `manage.py sweep_blobs`.
+        """
         try:
-            file_obj = File.objects.get(id=file_id)
-            
-            # Only delete the actual file if it's not a duplicate
-            if not file_obj.is_duplicate:
-                default_storage.delete(file_obj.file_path)
-            
-            file_obj.delete()
+            with transaction.atomic():
+                file_obj = File.objects.select_for_update().get(id=file_id)
+                StatsRepository.record_file(file_obj, sign=-1)
+                invalidate_files([file_obj])
+
+                if file_obj.is_duplicate:
+                    File.objects.filter(pk=file_obj.original_file_id).update(
+                        reference_count=F('reference_count') - 1
+                    )
+                    invalidate_files([file_obj.original_file])
+                    file_obj.delete()
+                    return True
+
+                successor = file_obj.duplicates.order_by('uploaded_at', 'id').first()
+                if successor is not None:
+                    self.promote(file_obj, successor)
+                    return True
+                if file_obj.is_chunked:
+                    ChunkStore().release(file_obj)
+                else:
+                    PendingBlobDeletion.objects.create(
+                        path=file_obj.file_path, kind=PendingBlobDeletion.KIND_FILE, key=file_obj.file_hash
+                    )
+                PendingBlobDeletion.objects.create(
+                    path=preview_store.relative_path(file_obj.file_hash),
+                    kind=PendingBlobDeletion.KIND_PREVIEW,
+                    key=file_obj.file_hash,
+                )
+                file_obj.delete()
             return True
         except File.DoesNotExist:
-            return False 
\ No newline at end of file
+            return False
+
+    def promote(self, canonical, successor):
+        """Delete canonical, handing its content and remaining references to successor."""
+        StatsRepository.record_file(successor, sign=-1)
+        # Every remaining row of the content changes its canonical row
+        invalidate_files(list(canonical.duplicates.only('id', 'file_hash')))
+        canonical.duplicates.exclude(pk=successor.pk).update(original_file=successor)
+        if canonical.is_chunked:
+            canonical.manifest.update(file=successor)
+        # canonical goes first: only one row per hash may be canonical
+        canonical.delete()
+        File.objects.filter(pk=successor.pk).update(
+            is_duplicate=False, original_file=None, reference_count=canonical.reference_count - 1
+        )
+        successor.refresh_from_db()
+        StatsRepository.record_file(successor)
+
+
+class BlobSweepService:
+    """Removes queued blobs and chunks once their grace period is over.
+
+    A tombstone is only acted on if nothing took the content again in the
+    meantime: no File row with that blob path, or no Chunk row with that
+    digest, or for previews no File row with that hash. The check and the
+    unlink run under the key's HashLock, which ingest holds while it moves
+    a blob in and inserts its row, so a re-upload cannot slip in between
+    them. Either way the tombstone itself is dropped.
+    """
+
+    def is_referenced(self, pending):
+        if pending.kind == PendingBlobDeletion.KIND_CHUNK:
+            return Chunk.objects.filter(digest=pending.key).exists()
+        if pending.kind == PendingBlobDeletion.KIND_PREVIEW:
+            return File.objects.filter(file_hash=pending.key).exists()
+        return File.objects.filter(file_path=pending.path).exists()
+
+    def sweep(self, grace, batch_size=500):
+        """Process tombstones older than grace; returns (removed, kept)."""
+        cutoff = timezone.now() - grace
+        removed = kept = 0
+        while True:
+            batch = list(PendingBlobDeletion.objects.filter(created_at__lt=cutoff).order_by('id')[:batch_size])
+            if not batch:
+                break
+            for pending in batch:
+                if pending.kind == PendingBlobDeletion.KIND_CHUNK:
+                    lock = HashLock([pending.key], NAMESPACE_CHUNKS)
+                else:
+                    lock = HashLock([pending.key])
+                with lock:
+                    if self.is_referenced(pending):
+                        kept += 1
+                        continue
+                    try:
+                        if pending.kind == PendingBlobDeletion.KIND_PREVIEW:
+                            PreviewService().delete_previews(pending.key)
+                        else:
+                            content_store.delete(pending.path)
+                        removed += 1
+                    except Exception as e:
+                        logger.exception("Error removing blob %s: %s", pending.path, e)
+            PendingBlobDeletion.objects.filter(pk__in=[pending.pk for pending in batch]).delete()
+        return removed, kept
+
+
+class UploadSessionService:
+    """Resumable uploads: chunks arrive in any order and are assembled on commit."""
+
+    def __init__(self):
+        self.file_service = FileService()
+
+    def open_session(self, original_filename, total_size, chunk_size=None):
+        """Create a new upload session."""
+        chunk_size = chunk_size or settings.UPLOAD_SESSION_CHUNK_SIZE
+        if total_size < 0:
+            raise UploadSessionError('total_size must not be negative')
+        if chunk_size <= 0 or chunk_size > settings.UPLOAD_SESSION_MAX_CHUNK_SIZE:
+            raise UploadSessionError(
+                f"chunk_size must be between 1 and {settings.UPLOAD_SESSION_MAX_CHUNK_SIZE}"
+            )
+        session = UploadSession.objects.create(
+            original_filename=original_filename,
+            total_size=total_size,
+            chunk_size=chunk_size,
+        )
+        os.makedirs(session.get_chunk_dir(), exist_ok=True)
+        logger.info("Opened upload session %s for: %s", session.id, original_filename)
+        return session
+
+    def write_chunk(self, session, index, stream, checksum=None):
+        """Store one chunk read from stream, replacing any earlier copy of it."""
+        if session.status != UploadSession.STATUS_OPEN:
+            raise UploadSessionError('Upload session is not open')
+        if index < 0 or index >= session.chunk_count:
+            raise UploadSessionError(f"Chunk index must be between 0 and {session.chunk_count - 1}")
+
+        expected_size = session.expected_chunk_size(index)
+        chunk_dir = session.get_chunk_dir()
+        os.makedirs(chunk_dir, exist_ok=True)
+
+        sha256_hash = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=chunk_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while stream is not None:
+                    data = stream.read(settings.FILE_UPLOAD_CHUNK_SIZE)
+                    if not data:
+                        break
+                    size += len(data)
+                    if size > expected_size:
+                        raise UploadSessionError(f"Chunk {index} must be {expected_size} bytes")
+                    sha256_hash.update(data)
+                    f.write(data)
+            if size != expected_size:
+                raise UploadSessionError(f"Chunk {index} must be {expected_size} bytes, got {size}")
+            if checksum and checksum.lower() != sha256_hash.hexdigest():
+                raise UploadSessionError(f"Chunk {index} checksum mismatch")
+            os.replace(temp_path, session.get_chunk_path(index))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        chunk, _ = UploadChunk.objects.update_or_create(
+            session=session, index=index, defaults={'size': size}
+        )
+        logger.debug("Stored chunk %s of upload session %s", index, session.id)
+        return chunk
+
+    def get_missing_chunks(self, session):
+        """Return the indexes of chunks that have not arrived yet."""
+        received = set(session.chunks.values_list('index', flat=True))
+        return [index for index in range(session.chunk_count) if index not in received]
+
+    def iter_session_content(self, session):
+        """Yield the session's content by reading its chunks in order."""
+        for index in range(session.chunk_count):
+            with open(session.get_chunk_path(index), 'rb') as f:
+                yield from self.file_service.iter_chunks(f)
+
+    def commit_session(self, session):
+        """Assemble the chunks into a file; returns (file, is_duplicate).
+
+        The session is claimed with a conditional UPDATE from open to
+        committing first, so of two concurrent commits only one assembles
+        the file and removes the chunks. A failed commit reopens it.
+        """
+        if session.status != UploadSession.STATUS_OPEN:
+            raise UploadSessionError('Upload session is not open')
+        missing = self.get_missing_chunks(session)
+        if missing:
+            raise UploadSessionError(f"Missing chunks: {missing}")
+        claimed = UploadSession.objects.filter(pk=session.pk, status=UploadSession.STATUS_OPEN).update(
+            status=UploadSession.STATUS_COMMITTING
+        )
+        if not claimed:
+            raise UploadSessionError('Upload session is not open')
+        session.status = UploadSession.STATUS_COMMITTING
+
+        try:
+            file_obj, is_duplicate = self.file_service.save_stream(
+                self.iter_session_content(session), session.original_filename
+            )
+        except BaseException:
+            UploadSession.objects.filter(pk=session.pk, status=UploadSession.STATUS_COMMITTING).update(
+                status=UploadSession.STATUS_OPEN
+            )
+            session.status = UploadSession.STATUS_OPEN
+            raise
+        session.file = file_obj
+        session.status = UploadSession.STATUS_COMMITTED
+        session.save(update_fields=['file', 'status'])
+        self.discard_chunks(session)
+        logger.info("Committed upload session %s", session.id)
+        return file_obj, is_duplicate
+
+    def discard_chunks(self, session):
+        """Remove the session's chunk directory from disk."""
+        shutil.rmtree(session.get_chunk_dir(), ignore_errors=True)
+
+    def purge_expired(self, max_age):
+        """Delete open sessions older than max_age and their chunks.
+
+        Sessions left committing by a worker that died mid-commit expire too.
+        """
+        cutoff = timezone.now() - max_age
+        expired = UploadSession.objects.filter(
+            status__in=[UploadSession.STATUS_OPEN, UploadSession.STATUS_COMMITTING], created_at__lt=cutoff
+        )
+        count = 0
+        for session in expired.iterator():
+            self.discard_chunks(session)
+            session.delete()
+            count += 1
+        return count
+
+
+class BatchIngestService:
+    """Ingests many files per request.
+
+    Items are hashed into temp files in parallel on the hash pool, looked up
+    with one file_hash__in query per batch of hashes, and the new ones are
+    inserted with a single bulk_create; duplicates become reference rows,
+    inserted the same way. bulk_create skips signals, so the hash index and
+    storage counters are updated here.
+    """
+    TAR_TYPES = ('application/x-tar', 'application/x-gtar', 'application/gzip', 'application/x-gzip')
+    ZIP_TYPES = ('application/zip', 'application/x-zip-compressed')
+
+    def __init__(self):
+        self.file_service = FileService()
+        self.repository = FileRepository()
+
+    @classmethod
+    def get_archive_format(cls, content_type, filename=''):
+        """'zip', 'tar' or None for a request content type or archive filename."""
+        if content_type in cls.ZIP_TYPES or filename.lower().endswith('.zip'):
+            return 'zip'
+        if content_type in cls.TAR_TYPES or filename.lower().endswith(('.tar', '.tar.gz', '.tgz')):
+            return 'tar'
+        return None
+
+    def iter_upload_sources(self, uploads):
+        for upload in uploads:
+            yield upload.name, lambda upload=upload: upload, False
+
+    def iter_zip_sources(self, fileobj):
+        """Members of a zip archive; fileobj must be seekable."""
+        archive = zipfile.ZipFile(fileobj)
+        for info in archive.infolist():
+            if not info.is_dir():
+                yield info.filename, lambda info=info: archive.open(info), False
+
+    def iter_tar_sources(self, fileobj):
+        """Members of a (possibly compressed) tar stream, read strictly in order.
+
+        Small members are read into memory so the pool can hash them while
+        the stream moves on; larger ones are spooled before advancing.
+        """
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                source = archive.extractfile(member)
+                if member.size <= settings.FILE_UPLOAD_CHUNK_SIZE:
+                    data = source.read()
+                    yield member.name, lambda data=data: io.BytesIO(data), False
+                else:
+                    yield member.name, lambda source=source: source, True
+
+    def spool_stream(self, stream):
+        """Copy a non-seekable request body to a temp file (zip needs to seek)."""
+        spooled = tempfile.TemporaryFile(dir=os.path.join(settings.MEDIA_ROOT, 'tmp'))
+        shutil.copyfileobj(stream, spooled, settings.FILE_UPLOAD_CHUNK_SIZE)
+        spooled.seek(0)
+        return spooled
+
+    def spool_item(self, opener, filename):
+        source = opener()
+        try:
+            return self.file_service.write_stream(self.file_service.iter_chunks(source), filename)
+        finally:
+            source.close()
+
+    def ingest(self, sources):
+        """Ingest (filename, opener, sequential) sources.
+
+        Returns one result per item, in order, as a dict with 'filename',
+        'status' ('created', 'duplicate' or 'error') and 'file' or 'error';
+        duplicates also carry the canonical row as 'duplicate_of'.
+        """
+        executor = get_hash_executor()
+        in_flight = threading.BoundedSemaphore(settings.BATCH_UPLOAD_WORKERS * 2)
+        results = []
+        futures = []
+        try:
+            for filename, opener, sequential in sources:
+                filename = os.path.basename(filename or '')
+                if len(results) >= settings.BATCH_UPLOAD_MAX_FILES:
+                    raise BatchIngestError(f'A batch may hold at most {settings.BATCH_UPLOAD_MAX_FILES} files')
+                results.append({'filename': filename, 'status': 'error', 'error': None})
+                if not filename:
+                    results[-1]['error'] = 'Missing filename'
+                    futures.append(None)
+                    continue
+                in_flight.acquire()
+                future = executor.submit(self.spool_item, opener, filename)
+                future.add_done_callback(lambda _: in_flight.release())
+                if sequential:
+                    concurrent.futures.wait([future])
+                futures.append(future)
+
+            spooled = {}
+            for index, future in enumerate(futures):
+                if future is None:
+                    continue
+                try:
+                    spooled[index] = future.result()
+                except Exception as e:
+                    logger.exception("Error reading batch item %s: %s", results[index]['filename'], e)
+                    results[index]['error'] = f'Error reading file: {str(e)}'
+            futures = []
+            self.store_spooled(spooled, results)
+        finally:
+            for future in futures:
+                if future is not None and not future.cancel():
+                    try:
+                        temp_path = future.result()[0]
+                    except Exception:
+                        continue
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+        return results
+
+    def store_spooled(self, spooled, results):
+        """Deduplicate the hashed temp files and record the new ones."""
+        try:
+            existing = self.repository.get_files_by_hashes({item.file_hash for item in spooled.values()})
+            if settings.FILE_STORE_MODE == File.STORAGE_CHUNKED:
+                self.store_chunked(spooled, existing, results)
+                return
+
+            candidates = {item.file_hash for item in spooled.values()} - set(existing)
+            # Single flight as in FileService.store_new_file: the blobs are moved
+            # in and inserted under the locks of their hashes, after a re-check
+            # that sees other workers' inserts the hash index may not have yet.
+            with HashLock(candidates):
+                existing.update(self.file_service.find_existing_by_hashes(candidates))
+                new_files, references = self.commit_new_files(spooled, results, existing)
+                try:
+                    inserted = self.insert_files(list(new_files.values()))
+                except Exception:
+                    for file_obj in new_files.values():
+                        content_store.delete(file_obj.file_path)
+                    raise
+
+            # Rows that lost a race with a concurrent upload become duplicates
+            canonicals = dict(existing)
+            for result in results:
+                if result['status'] == 'created':
+                    file_obj, is_duplicate = inserted[result['file'].file_hash]
+                    result['file'] = file_obj
+                    if is_duplicate:
+                        result.update(status='duplicate', duplicate_of=file_obj.original_file)
+                    canonicals[file_obj.file_hash] = file_obj.original_file if is_duplicate else file_obj
+            self.insert_references(
+                [(index, canonicals[spooled[index].file_hash]) for index in references], results
+            )
+        finally:
+            for item in spooled.values():
+                if os.path.exists(item.temp_path):
+                    os.remove(item.temp_path)
+
+    def commit_new_files(self, spooled, results, existing):
+        """Move the temp files of unseen hashes into place and build their rows.
+
+        Returns ({file_hash: unsaved File}, [indexes of duplicate items]).
+        """
+        new_files = {}
+        references = []
+        committed = []
+        try:
+            for index, item in spooled.items():
+                file_hash = item.file_hash
+                if file_hash in existing or file_hash in new_files:
+                    os.remove(item.temp_path)
+                    references.append(index)
+                    continue
+                filename = results[index]['filename']
+                file_extension = self.file_service.get_file_extension(filename)
+                file_path = self.file_service.get_blob_path(file_hash, file_extension, item.content_encoding)
+                with INGEST_SECONDS.time('commit'):
+                    content_store.commit(item.temp_path, file_path)
+                committed.append(file_path)
+                new_files[file_hash] = File(
+                    original_filename=filename,
+                    file_path=file_path,
+                    file_type=file_extension[1:],  # Remove the dot
+                    size=item.size,
+                    file_hash=file_hash,
+                    is_duplicate=False,
+                    content_encoding=item.content_encoding,
+                    stored_size=item.stored_size
+                )
+                results[index].update(status='created', file=new_files[file_hash], error=None)
+        except Exception:
+            for file_path in committed:
+                content_store.delete(file_path)
+            raise
+        return new_files, references
+
+    def insert_files(self, file_objs):
+        """bulk_create the new rows; returns {file_hash: (file_obj, is_duplicate)}."""
+        try:
+            with DB_SECONDS.time('insert'), transaction.atomic():
+                File.objects.bulk_create(file_objs)
+                StatsRepository.record_files(file_objs)
+                invalidate_files(file_objs)
+                enqueue_post_upload(file_objs)
+        except IntegrityError:
+            # Some hash was stored by another worker since the lookup
+            INGEST_RACES.inc()
+            logger.info("Batch insert conflicted, falling back to per-row inserts")
+            return {file_obj.file_hash: self.insert_file(file_obj) for file_obj in file_objs}
+        for file_obj in file_objs:
+            hash_index.add(file_obj.file_hash)
+        return {file_obj.file_hash: (file_obj, False) for file_obj in file_objs}
+
+    def insert_file(self, file_obj):
+        try:
+            with transaction.atomic():
+                file_obj.save(force_insert=True)
+                StatsRepository.record_file(file_obj)
+                invalidate_files([file_obj])
+                enqueue_post_upload([file_obj])
+            return file_obj, False
+        except IntegrityError:
+            existing_file = self.file_service.find_existing(file_obj.file_hash)
+            if existing_file is None:
+                raise
+            if existing_file.file_path != file_obj.file_path:
+                content_store.delete(file_obj.file_path)
+            reference = self.file_service.add_reference(existing_file, file_obj.original_filename)
+            if reference is None:
+                raise
+            return reference, True
+
+    def insert_references(self, references, results):
+        """Record (index, canonical) duplicates with one bulk_create.
+
+        reference_count is bumped with one F() update per distinct count, as
+        ChunkStore does for chunks. If a canonical row went away since the
+        lookup the batch is rolled back and the references are added one by one.
+        """
+        if not references:
+            return
+        file_objs = [
+            self.file_service.build_reference(canonical, results[index]['filename'])
+            for index, canonical in references
+        ]
+        counts = Counter(canonical.pk for _, canonical in references)
+        by_count = defaultdict(list)
+        for pk, count in counts.items():
+            by_count[count].append(pk)
+        with DB_SECONDS.time('reference'), transaction.atomic():
+            updated = 0
+            for count, pks in by_count.items():
+                for start in range(0, len(pks), 500):
+                    updated += File.objects.filter(pk__in=pks[start:start + 500], is_duplicate=False).update(
+                        reference_count=F('reference_count') + count
+                    )
+            if updated == len(counts):
+                File.objects.bulk_create(file_objs)
+                StatsRepository.record_files(file_objs)
+                invalidate_files(file_objs + [canonical for _, canonical in references])
+                DEDUP_HITS.inc(amount=len(file_objs))
+            else:
+                transaction.set_rollback(True)
+                file_objs = None
+        if file_objs is None:
+            logger.info("Canonical rows changed during the batch, adding references one by one")
+            file_objs = [
+                self.file_service.add_reference(canonical, results[index]['filename'])
+                for index, canonical in references
+            ]
+        for (index, _), file_obj in zip(references, file_objs):
+            if file_obj is None:
+                results[index]['error'] = 'File was deleted while the batch was stored'
+                continue
+            results[index].update(
+                status='duplicate', file=file_obj, duplicate_of=file_obj.original_file, error=None
+            )
+
+    def store_chunked(self, spooled, existing, results):
+        """The chunk store has its own manifest bookkeeping; new items go through save_stream."""
+        for index, (temp_path, file_hash, *_) in spooled.items():
+            filename = results[index]['filename']
+            try:
+                file_obj = None
+                if file_hash in existing:
+                    file_obj = self.file_service.add_reference(existing[file_hash], filename)
+                is_duplicate = file_obj is not None
+                if not is_duplicate:
+                    with open(temp_path, 'rb') as f:
+                        file_obj, is_duplicate = self.file_service.save_stream(
+                            self.file_service.iter_chunks(f), filename
+                        )
+            except Exception as e:
+                logger.exception("Error storing batch item %s: %s", filename, e)
+                results[index]['error'] = f'Error processing file: {str(e)}'
+                continue
+            if is_duplicate:
+                existing[file_hash] = file_obj.original_file
+                results[index].update(status='duplicate', file=file_obj, duplicate_of=file_obj.original_file, error=None)
+            else:
+                existing[file_hash] = file_obj
+                results[index].update(status='created', file=file_obj, error=None)
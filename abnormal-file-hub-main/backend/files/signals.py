@@ -0,0 +1,26 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from .hash_index import hash_index
+from .models import File
+from .search import install_search_index
+
+
+@receiver(post_save, sender=File)
+def index_file_hash(sender, instance, created, **kwargs):
+    if created:
+        hash_index.add(instance.file_hash)
+
+
+@receiver(post_delete, sender=File)
+def unindex_file_hash(sender, instance, **kwargs):
+    # Removing a duplicate leaves the canonical row, so the hash is still stored
+    if not instance.is_duplicate:
+        hash_index.remove(instance.file_hash)
+
+
+def repair_search_index(sender, using, **kwargs):
+    """Reinstall search triggers that a table-rebuilding migration dropped."""
+    connection = connections[using]
+    if File._meta.db_table in connection.introspection.table_names():
+        install_search_index(connection)
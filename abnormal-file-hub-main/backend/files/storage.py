@@ -0,0 +1,96 @@
+import os
+import logging
+from django.conf import settings
+from .blobstores import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+
+def parse_fanout(value):
+    """Parse a fan-out spec such as "2,2" into (2, 2); an empty spec means flat."""
+    if isinstance(value, (list, tuple)):
+        return tuple(int(width) for width in value)
+    return tuple(int(width) for width in str(value).split(',') if width.strip())
+
+
+class ContentStore:
+    """Single place that maps content hashes to blob keys.
+
+    Blobs are spread over nested directories named after leading hash
+    characters, e.g. uploads/ab/cd/<hash>.pdf for fan-out (2, 2), so no
+    directory grows to millions of entries. File.file_path stores the
+    relative path, so blobs written under an older layout keep resolving
+    until `manage.py migrate_layout` moves them.
+
+    The bytes live in the blob store selected by FILE_STORAGE_BACKEND
+    (see blobstores.py); the relative path is the blob's key there.
+    """
+
+    def __init__(self, area='uploads', fanout=None):
+        self.area = area
+        self.configured_fanout = fanout
+
+    @property
+    def fanout(self):
+        fanout = settings.FILE_STORE_FANOUT if self.configured_fanout is None else self.configured_fanout
+        return parse_fanout(fanout)
+
+    @property
+    def blobs(self):
+        return get_blob_store()
+
+    def relative_path(self, key, extension=''):
+        """Relative path of the blob for key under the configured fan-out."""
+        parts = [self.area]
+        position = 0
+        for width in self.fanout:
+            parts.append(key[position:position + width])
+            position += width
+        parts.append(f"{key}{extension}")
+        return os.path.join(*parts)
+
+    def local_path(self, relative_path):
+        """Filesystem path of the blob if the store keeps it on a local disk, else None."""
+        return self.blobs.local_path(relative_path)
+
+    def exists(self, relative_path):
+        return self.blobs.exists(relative_path)
+
+    def stat(self, relative_path):
+        return self.blobs.stat(relative_path)
+
+    def open(self, relative_path):
+        return self.blobs.open(relative_path)
+
+    def iter_range(self, relative_path, start, end, chunk_size=None):
+        return self.blobs.iter_range(relative_path, start, end, chunk_size or settings.FILE_UPLOAD_CHUNK_SIZE)
+
+    def commit(self, temp_path, relative_path):
+        """Store a finished temp file (on the MEDIA_ROOT filesystem) under relative_path."""
+        self.blobs.put_file(temp_path, relative_path)
+
+    def put(self, relative_path, chunks):
+        self.blobs.put_stream(relative_path, chunks)
+
+    def link(self, source_path, relative_path):
+        """Give an existing blob a second name at relative_path."""
+        self.blobs.copy(source_path, relative_path)
+
+    def delete(self, relative_path):
+        """Remove a blob; returns False if it was already gone."""
+        return self.blobs.delete(relative_path)
+
+    def list(self, after=None):
+        """Yield (relative_path, BlobStat) of the area's blobs in key order."""
+        return self.blobs.list(self.area, after)
+
+
+content_store = ContentStore()
+
+# Chunk paths are derived from the digest alone (nothing stores them), so
+# their layout is fixed rather than following FILE_STORE_FANOUT.
+chunk_store_paths = ContentStore(area='chunks', fanout=(2,))
+
+# Previews are keyed by content hash and spec (see previews.py) and, like
+# chunks, are never recorded anywhere, so their layout is fixed too.
+preview_store = ContentStore(area='previews', fanout=(2, 2))
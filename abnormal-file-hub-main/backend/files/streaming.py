@@ -0,0 +1,316 @@
+import os
+import json
+import asyncio
+import time
+import logging
+import functools
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signals
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from .admission import AdmissionRejected, admission, get_client_id, needs_admission, parse_content_length
+from .downloads import DownloadBuilder
+from .executors import run_ingest_io, run_io
+from .metrics import finish_request, format_server_timing, observe_request, start_request
+from .models import File
+from .repositories import FileRepository
+from .serializers import FileSerializer
+from .services import FileService, IngestWriter
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_PATH = '/api/stream/files/'
+FILENAME_HEADER = 'X-Filename'
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the request body was complete."""
+
+
+def get_upload_filename(query_string, header_value):
+    """The target filename comes from ?filename= or the X-Filename header."""
+    filename = parse_qs(query_string).get('filename', [None])[0] or header_value
+    if not filename:
+        return None
+    return os.path.basename(filename.strip())
+
+
+def record_response(request, action, response, started, timings):
+    elapsed = time.perf_counter() - started
+    response_bytes = response.get('Content-Length')
+    observe_request(
+        'stream', action, request.method, response.status_code, elapsed,
+        request_bytes=int(request.META.get('CONTENT_LENGTH') or 0),
+        response_bytes=int(response_bytes) if response_bytes else None,
+    )
+    if settings.METRICS_TIMING_HEADERS:
+        response['Server-Timing'] = format_server_timing(timings, elapsed)
+    return response
+
+
+def instrumented(action):
+    """Record a streaming view in files.metrics, like InstrumentedViewSetMixin does for the API."""
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                started = time.perf_counter()
+                token = start_request()
+                try:
+                    response = await view(request, *args, **kwargs)
+                finally:
+                    timings = finish_request(token)
+                return record_response(request, action, response, started, timings)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                started = time.perf_counter()
+                token = start_request()
+                try:
+                    response = view(request, *args, **kwargs)
+                finally:
+                    timings = finish_request(token)
+                return record_response(request, action, response, started, timings)
+        return wrapper
+    return decorator
+
+
+def render_result(file_obj):
+    """(status, payload) for an ingest result, matching POST /api/files/."""
+    return 201, FileSerializer(file_obj).data
+
+
+class StreamingIngest:
+    """Async front end to FileService for request bodies arriving over ASGI.
+
+    The body is hashed and written by IngestWriter in the ingest thread pool,
+    the duplicate lookup uses the async ORM, and the final move and insert
+    reuse FileService.store_new_file in Django's sync thread because it
+    needs a transaction.
+    """
+
+    def __init__(self):
+        self.file_service = FileService()
+
+    async def save(self, body_chunks, original_filename):
+        """Ingest an async iterable of byte chunks; returns (file_obj, is_duplicate)."""
+        logger.info("Starting streaming file save for: %s", original_filename)
+        writer = await run_ingest_io(IngestWriter, original_filename)
+        try:
+            # Coalesce small ASGI messages so each pool hop writes a full block
+            buffer = bytearray()
+            async for chunk in body_chunks:
+                buffer += chunk
+                if len(buffer) >= settings.FILE_UPLOAD_CHUNK_SIZE:
+                    await run_ingest_io(writer.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await run_ingest_io(writer.write, bytes(buffer))
+            spooled = await run_ingest_io(writer.finish)
+        except BaseException:
+            await run_ingest_io(writer.abort)
+            raise
+
+        try:
+            if settings.FILE_STORE_MODE == File.STORAGE_CHUNKED:
+                return await sync_to_async(self.save_spooled)(spooled.temp_path, original_filename)
+
+            existing_file = await FileRepository.aget_file_by_hash(spooled.file_hash)
+            if existing_file:
+                logger.info("Duplicate file found: %s", existing_file.original_filename)
+                file_obj = await sync_to_async(self.file_service.add_reference)(existing_file, original_filename)
+                if file_obj is not None:
+                    await run_ingest_io(os.remove, spooled.temp_path)
+                    return file_obj, True
+            return await sync_to_async(self.file_service.store_new_file)(spooled, original_filename)
+        except BaseException:
+            if os.path.exists(spooled.temp_path):
+                os.remove(spooled.temp_path)
+            raise
+
+    def save_spooled(self, temp_path, original_filename):
+        """Feed a spooled body through save_stream (used by the chunk store)."""
+        try:
+            with open(temp_path, 'rb') as f:
+                return self.file_service.save_stream(self.file_service.iter_chunks(f), original_filename)
+        finally:
+            os.remove(temp_path)
+
+
+class StreamingUploadApp:
+    """ASGI wrapper that serves POST/PUT UPLOAD_PATH before Django sees it.
+
+    Django's ASGI handler reads the whole request body before calling a
+    view, so streaming uploads are taken here, straight from the ASGI
+    receive channel; every other request goes to the wrapped application.
+    For the same reason upload admission (admission.py) happens here: a
+    rejected upload is answered before any of its body is read.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.ingest = StreamingIngest()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        ticket = None
+        if needs_admission(scope['method'], scope['path']):
+            ticket = await self.admit(scope, send)
+            if ticket is None:
+                return
+        try:
+            if scope['path'] == UPLOAD_PATH and scope['method'] in ('POST', 'PUT'):
+                await self.handle_instrumented_upload(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            if ticket is not None:
+                ticket.release()
+
+    async def admit(self, scope, send):
+        """An admission Ticket for the upload, or None once a rejection has been sent."""
+        headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        forwarded = headers.get(settings.ADMISSION_CLIENT_HEADER.lower()) if settings.ADMISSION_CLIENT_HEADER else None
+        client = get_client_id((scope.get('client') or [None])[0], forwarded)
+        try:
+            return await run_ingest_io(admission.admit, client, parse_content_length(headers.get('content-length')))
+        except AdmissionRejected as e:
+            await self.send_json(
+                send, headers, e.status, e.get_payload(),
+                extra_headers=[(b'retry-after', str(e.retry_after).encode())],
+            )
+            return None
+
+    async def handle_instrumented_upload(self, scope, receive, send):
+        started = time.perf_counter()
+        response = {}
+
+        async def send_recording(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            await send(message)
+
+        try:
+            await self.handle_upload(scope, receive, send_recording)
+        finally:
+            request_bytes = dict(scope.get('headers', [])).get(b'content-length', b'0')
+            # 499: the client went away before a response was sent
+            observe_request(
+                'stream', 'upload', scope['method'], response.get('status', 499), time.perf_counter() - started,
+                request_bytes=int(request_bytes) if request_bytes.isdigit() else None,
+            )
+
+    async def handle_upload(self, scope, receive, send):
+        headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        filename = get_upload_filename(
+            scope.get('query_string', b'').decode('latin-1'), headers.get(FILENAME_HEADER.lower())
+        )
+        if not filename:
+            await self.send_json(send, headers, 400, {'error': 'No filename provided'})
+            return
+
+        async def body_chunks():
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    raise ClientDisconnected()
+                if message.get('body'):
+                    yield message['body']
+                if not message.get('more_body', False):
+                    return
+
+        # Mirror Django's handler so DB connections are recycled per request
+        await sync_to_async(signals.request_started.send, thread_sensitive=True)(sender=self.__class__)
+        try:
+            try:
+                file_obj, _ = await self.ingest.save(body_chunks(), filename)
+            except ClientDisconnected:
+                logger.info("Client disconnected during streaming upload of %s", filename)
+                return
+            except Exception as e:
+                logger.exception("Error processing streaming upload: %s", e)
+                await self.send_json(send, headers, 500, {'error': f'Error processing file: {str(e)}'})
+                return
+            status, payload = await sync_to_async(render_result)(file_obj)
+            await self.send_json(send, headers, status, payload)
+        finally:
+            await sync_to_async(signals.request_finished.send, thread_sensitive=True)(sender=self.__class__)
+
+    def get_cors_headers(self, headers):
+        """The CORS headers django-cors-headers would add; this path bypasses middleware."""
+        origin = headers.get('origin')
+        if not origin:
+            return []
+        allowed = getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False) or origin in getattr(
+            settings, 'CORS_ALLOWED_ORIGINS', []
+        )
+        if not allowed:
+            return []
+        cors_headers = [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'origin')]
+        if getattr(settings, 'CORS_ALLOW_CREDENTIALS', False):
+            cors_headers.append((b'access-control-allow-credentials', b'true'))
+        return cors_headers
+
+    async def send_json(self, send, headers, status, payload, extra_headers=()):
+        body = json.dumps(payload, cls=DjangoJSONEncoder).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ] + list(extra_headers) + self.get_cors_headers(headers),
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+@csrf_exempt
+@instrumented('upload')
+def stream_upload(request):
+    """WSGI counterpart of StreamingUploadApp: reads the raw body incrementally.
+
+    Under ASGI the wrapper answers this path first; this view only runs
+    when the project is served over WSGI.
+    """
+    if request.method not in ('POST', 'PUT'):
+        return HttpResponseNotAllowed(['POST', 'PUT'])
+    filename = get_upload_filename(request.META.get('QUERY_STRING', ''), request.headers.get(FILENAME_HEADER))
+    if not filename:
+        return JsonResponse({'error': 'No filename provided'}, status=400)
+
+    file_service = FileService()
+    chunk_size = settings.FILE_UPLOAD_CHUNK_SIZE
+    try:
+        file_obj, _ = file_service.save_stream(iter(lambda: request.read(chunk_size), b''), filename)
+    except Exception as e:
+        logger.exception("Error processing streaming upload: %s", e)
+        return JsonResponse({'error': f'Error processing file: {str(e)}'}, status=500)
+    status, payload = render_result(file_obj)
+    return JsonResponse(payload, status=status)
+
+
+@instrumented('download')
+async def stream_download(request, pk):
+    """Async download view: Range/ETag handling from DownloadBuilder, reads off the event loop."""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    file_obj = await sync_to_async(FileService().get_file)(pk)
+    if file_obj is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+    builder = DownloadBuilder(file_obj, asynchronous=True)
+    if not await run_io(builder.exists):
+        logger.error("File not found at path: %s", builder.blob_path)
+        return JsonResponse({'error': 'File not found in storage'}, status=404)
+    return builder.build(request)
@@ -1,10 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FileViewSet
+from .streaming import stream_download, stream_upload
+from .views import FileViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'files', FileViewSet)
+router.register(r'uploads', UploadSessionViewSet)
 
 urlpatterns = [
+    path('stream/files/', stream_upload, name='stream-upload'),
+    path('stream/files/<uuid:pk>/', stream_download, name='stream-download'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
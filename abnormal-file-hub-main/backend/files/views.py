@@ -3,24 +3,91 @@ from rest_framework import viewsets, status, filters
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.db.models import Q, Sum
+from django.http import Http404, HttpResponse, QueryDict, StreamingHttpResponse
 from django.utils import timezone
 from datetime import timedelta
-from .models import File
-from .serializers import FileSerializer
-from .services import FileService
-from rest_framework.parsers import MultiPartParser, FormParser
-from django.http import FileResponse
-from django.core.files.storage import default_storage
+from .admission import admission
+from .archives import ARCHIVE_FORMATS, FORMAT_ZIP, ArchiveStreamer
+from .cache import NAMESPACE_SEARCH, make_key, metadata_cache
+from .downloads import DownloadBuilder, is_asgi_request, parse_etags
+from .hash_index import hash_index
+from .jobs import get_job_queue
+from .metrics import finish_request, format_server_timing, log_event, observe_request, registry, start_request
+from .models import File, UploadSession
+from .pagination import KeysetCursorPagination
+from .previews import PreviewBusy, PreviewService, PreviewUnavailable
+from .repositories import FileRepository
+from .search import SEARCH_MODES
+from .serializers import FileSerializer, UploadSessionSerializer
+from .services import BatchIngestError, BatchIngestService, FileService, UploadSessionService, UploadSessionError
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 import logging
-import traceback
+import time
 import os
+import re
+import uuid
+import tarfile
+import zipfile
 from django.conf import settings
 
 # Create your views here.
 
 logger = logging.getLogger(__name__)
 
-class FileViewSet(viewsets.ModelViewSet):
+SHA256_RE = re.compile(r'[0-9a-fA-F]{64}')
+
+
+def get_search_filters(params):
+    """The search_files filters from query params or a saved-search dict."""
+    return {
+        'filename': params.get('filename', ''),
+        'match': params.get('match', ''),
+        'file_type': params.get('file_type', ''),
+        'min_size': params.get('min_size'),
+        'max_size': params.get('max_size'),
+        'date_range': params.get('date_range', '')
+    }
+
+
+def metrics(request):
+    """Prometheus scrape endpoint for this worker's metrics."""
+    if not settings.METRICS_ENABLED:
+        raise Http404()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class InstrumentedViewSetMixin:
+    """Records latency, sizes and status of every request in files.metrics,
+    adds a Server-Timing header when METRICS_TIMING_HEADERS is on, and logs
+    a sampled `request` event."""
+    metrics_view = None
+
+    def dispatch(self, request, *args, **kwargs):
+        started = time.perf_counter()
+        token = start_request()
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        finally:
+            timings = finish_request(token)
+        elapsed = time.perf_counter() - started
+        action = getattr(self, 'action', None) or request.method.lower()
+        response_bytes = response.get('Content-Length')
+        observe_request(
+            self.metrics_view, action, request.method, response.status_code, elapsed,
+            request_bytes=int(request.META.get('CONTENT_LENGTH') or 0),
+            response_bytes=int(response_bytes) if response_bytes else None,
+        )
+        if settings.METRICS_TIMING_HEADERS:
+            response['Server-Timing'] = format_server_timing(timings, elapsed)
+        log_event(
+            logger, 'request', sample_rate=settings.REQUEST_LOG_SAMPLE_RATE,
+            view=self.metrics_view, action=action, method=request.method,
+            status=response.status_code, duration_ms=round(elapsed * 1000, 2),
+        )
+        return response
+
+
+class FileViewSet(InstrumentedViewSetMixin, viewsets.ModelViewSet):
     queryset = File.objects.all()
     serializer_class = FileSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -28,11 +95,37 @@ class FileViewSet(viewsets.ModelViewSet):
     ordering_fields = ['uploaded_at', 'size', 'file_type']
     ordering = ['-uploaded_at']
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = KeysetCursorPagination
+    metrics_view = 'files'
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.file_service = FileService()
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'search'):
+            queryset = FileRepository.with_list_annotations(queryset)
+        return queryset
+
+    def get_object(self):
+        if self.action not in ('retrieve', 'preview'):
+            return super().get_object()
+        # Downloads and previews only need the row's immutable storage
+        # fields, so they can come from the metadata cache
+        file_obj = self.file_service.get_file(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if file_obj is None:
+            raise File.DoesNotExist()
+        self.check_object_permissions(self.request, file_obj)
+        return file_obj
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        fields = self.request.query_params.get('fields') if self.request else None
+        if fields:
+            context['fields'] = [name.strip() for name in fields.split(',') if name.strip()]
+        return context
+
     def create(self, request, *args, **kwargs):
         logger.info("Starting file upload process")
         try:
@@ -45,34 +138,19 @@ class FileViewSet(viewsets.ModelViewSet):
 
             file_obj = request.FILES['file']
             original_filename = file_obj.name
-            logger.info(f"Processing file: {original_filename}")
+            logger.info("Processing file: %s", original_filename)
 
             try:
                 file_obj, is_duplicate = self.file_service.save_file(file_obj, original_filename)
-                logger.info(f"File processed successfully. Duplicate: {is_duplicate}")
-                
-                if is_duplicate:
-                    logger.info(f"Duplicate file detected: {original_filename}")
-                    return Response(
-                        {
-                            'error': 'Duplicate file detected',
-                            'existing_file': {
-                                'id': file_obj.id,
-                                'filename': file_obj.original_filename,
-                                'uploaded_at': file_obj.uploaded_at,
-                                'size': file_obj.size
-                            }
-                        },
-                        status=status.HTTP_409_CONFLICT
-                    )
+                logger.info("File processed successfully. Duplicate: %s", is_duplicate)
                 
+                # Duplicates get their own row (and name) sharing the stored content
                 serializer = self.get_serializer(file_obj)
-                logger.info(f"File uploaded successfully: {original_filename}")
+                logger.info("File uploaded successfully: %s", original_filename)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
                 
             except Exception as e:
-                logger.error(f"Error processing file: {str(e)}")
-                logger.error(f"Traceback: {traceback.format_exc()}")
+                logger.exception("Error processing file: %s", e)
                 return Response(
                     {
                         'error': 'Error processing file',
@@ -82,8 +160,7 @@ class FileViewSet(viewsets.ModelViewSet):
                 )
                 
         except Exception as e:
-            logger.error(f"Unexpected error in file upload: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Unexpected error in file upload: %s", e)
             return Response(
                 {
                     'error': 'Unexpected error during file upload',
@@ -96,27 +173,23 @@ class FileViewSet(viewsets.ModelViewSet):
         try:
             logger.info("Starting file download process")
             file_obj = self.get_object()
-            file_path = file_obj.file_path
-            full_path = os.path.join(settings.MEDIA_ROOT, file_path)
+            builder = DownloadBuilder(file_obj, asynchronous=is_asgi_request(request))
             
-            logger.debug(f"Attempting to download file: {file_path}")
+            logger.debug("Attempting to download file: %s", file_obj.file_path)
             
-            if not os.path.exists(full_path):
-                logger.error(f"File not found at path: {full_path}")
+            if not builder.exists():
+                logger.error("File not found at path: %s", builder.blob_path)
                 return Response(
                     {'error': 'File not found in storage'},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
             try:
-                file = open(full_path, 'rb')
-                response = FileResponse(file)
-                response['Content-Disposition'] = f'attachment; filename="{file_obj.original_filename}"'
-                response['Content-Type'] = 'application/octet-stream'
-                logger.info(f"File download successful: {file_obj.original_filename}")
+                response = builder.build(request)
+                logger.info("File download successful: %s", file_obj.original_filename)
                 return response
             except Exception as e:
-                logger.error(f"Error opening file: {str(e)}")
+                logger.error("Error opening file: %s", e)
                 return Response(
                     {'error': 'Error reading file'},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -129,8 +202,7 @@ class FileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         except Exception as e:
-            logger.error(f"Unexpected error in file download: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Unexpected error in file download: %s", e)
             return Response(
                 {
                     'error': 'Failed to download file',
@@ -142,17 +214,21 @@ class FileViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def search(self, request):
         try:
-            filters = {
-                'filename': request.query_params.get('filename', ''),
-                'file_type': request.query_params.get('file_type', ''),
-                'min_size': request.query_params.get('min_size'),
-                'max_size': request.query_params.get('max_size'),
-                'date_range': request.query_params.get('date_range', '')
-            }
+            filters = get_search_filters(request.query_params)
             
-            files = self.file_service.search_files(filters)
-            serializer = self.get_serializer(files, many=True)
-            return Response(serializer.data)
+            if filters['match'] and filters['match'] not in SEARCH_MODES:
+                return Response(
+                    {'error': f"match must be one of: {', '.join(SEARCH_MODES)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            def load():
+                files = FileRepository.with_list_annotations(self.file_service.search_files(filters))
+                return self.get_serializer(files, many=True).data
+
+            return Response(metadata_cache.get_or_load(
+                NAMESPACE_SEARCH, make_key(filters, self.get_serializer_context().get('fields')), load
+            ))
             
         except Exception as e:
             return Response(
@@ -160,15 +236,268 @@ class FileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get', 'post'], parser_classes=[JSONParser])
+    def archive(self, request):
+        """Stream a ZIP or tar of several files, built on the fly.
+
+        GET takes `ids` (comma-separated) or the same filters as search/;
+        POST takes {"ids": [...]} or {"search": {...filters}}. `archive_format`
+        is `zip` (default) or `tar`; DRF reserves `format` for content
+        negotiation.
+        """
+        if request.method == 'POST':
+            params = request.data if isinstance(request.data, dict) else {}
+            ids = params.get('ids')
+            search = params.get('search')
+            archive_format = params.get('archive_format') or FORMAT_ZIP
+        else:
+            params = request.query_params
+            ids = [i.strip() for i in params['ids'].split(',') if i.strip()] if params.get('ids') else None
+            search = params if ids is None else None
+            archive_format = params.get('archive_format') or FORMAT_ZIP
+
+        if archive_format not in ARCHIVE_FORMATS:
+            return Response(
+                {'error': f"archive_format must be one of: {', '.join(ARCHIVE_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if ids is not None:
+            if not isinstance(ids, list) or not ids:
+                return Response({'error': '"ids" must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                ids = [uuid.UUID(str(i)) for i in ids]
+            except ValueError:
+                return Response({'error': 'Invalid file id'}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = File.objects.filter(pk__in=ids)
+        elif isinstance(search, (dict, QueryDict)):
+            filters = get_search_filters(search)
+            if filters['match'] and filters['match'] not in SEARCH_MODES:
+                return Response(
+                    {'error': f"match must be one of: {', '.join(SEARCH_MODES)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = self.file_service.search_files(filters)
+        else:
+            return Response({'error': 'Provide "ids" or a search'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not queryset.query.order_by:
+            queryset = queryset.order_by('-uploaded_at', '-id')
+        files = list(queryset[:settings.ARCHIVE_MAX_FILES + 1])
+        if len(files) > settings.ARCHIVE_MAX_FILES:
+            return Response(
+                {'error': f'An archive may hold at most {settings.ARCHIVE_MAX_FILES} files'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not files:
+            return Response({'error': 'No matching files'}, status=status.HTTP_404_NOT_FOUND)
+
+        streamer = ArchiveStreamer(files, archive_format)
+        content_type = 'application/zip' if archive_format == FORMAT_ZIP else 'application/x-tar'
+        response = StreamingHttpResponse(
+            streamer.aiter_blocks() if is_asgi_request(request) else streamer, content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="{streamer.get_filename()}"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Ingest many files at once.
+
+        Accepts multipart `files` fields, a multipart `archive` field holding a
+        zip or tar, or a raw zip/tar(.gz) request body.
+        """
+        batch_service = BatchIngestService()
+        content_type = request.content_type.split(';')[0].strip().lower()
+        archive_format = batch_service.get_archive_format(content_type)
+        spooled = None
+        try:
+            if archive_format == 'tar':
+                sources = batch_service.iter_tar_sources(request.stream)
+            elif archive_format == 'zip':
+                spooled = batch_service.spool_stream(request.stream)
+                sources = batch_service.iter_zip_sources(spooled)
+            elif 'archive' in request.FILES:
+                archive = request.FILES['archive']
+                if batch_service.get_archive_format(archive.content_type, archive.name) == 'zip':
+                    sources = batch_service.iter_zip_sources(archive)
+                else:
+                    sources = batch_service.iter_tar_sources(archive)
+            else:
+                uploads = request.FILES.getlist('files') + request.FILES.getlist('file')
+                if not uploads:
+                    return Response(
+                        {'error': 'No files provided'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                sources = batch_service.iter_upload_sources(uploads)
+            results = batch_service.ingest(sources)
+        except (BatchIngestError, tarfile.TarError, zipfile.BadZipFile) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception("Error processing batch upload: %s", e)
+            return Response(
+                {'error': f'Error processing batch: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        finally:
+            if spooled is not None:
+                spooled.close()
+
+        items = []
+        for index, result in enumerate(results):
+            item = {'index': index, 'filename': result['filename'], 'status': result['status']}
+            file_obj = result.get('file')
+            if result['status'] == 'created':
+                # Nothing can reference a row inserted by this request yet
+                file_obj.annotated_duplicates_count = 0
+                item['file'] = self.get_serializer(file_obj).data
+            elif result['status'] == 'duplicate':
+                original_file = result['duplicate_of']
+                item['file'] = self.get_serializer(file_obj).data
+                item['duplicate_of'] = {
+                    'id': original_file.id,
+                    'filename': original_file.original_filename,
+                    'uploaded_at': original_file.uploaded_at,
+                    'size': original_file.size
+                }
+            else:
+                item['error'] = result['error']
+            items.append(item)
+        return Response({
+            'created': sum(1 for item in items if item['status'] == 'created'),
+            'duplicates': sum(1 for item in items if item['status'] == 'duplicate'),
+            'errors': sum(1 for item in items if item['status'] == 'error'),
+            'results': items,
+        })
+
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        """Thumbnail (JPEG) or head snippet (text) of a file, rendered once per content.
+
+        The bytes depend only on the content hash and the size, so the
+        response can be cached for good by browsers and proxies.
+        """
+        try:
+            file_obj = self.get_object()
+        except File.DoesNotExist:
+            return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+        size = request.query_params.get('size')
+        try:
+            size = int(size) if size else None
+        except ValueError:
+            return Response({'error': 'size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        preview_service = PreviewService()
+        try:
+            spec = preview_service.get_spec(file_obj, size)
+            etag = f'"{file_obj.file_hash}-{spec.name}"'
+            headers = {'ETag': etag, 'Cache-Control': 'public, max-age=31536000, immutable'}
+            if_none_match = request.headers.get('If-None-Match')
+            if if_none_match and etag in parse_etags(if_none_match):
+                return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            spec, path = preview_service.get_preview(file_obj, size)
+            data = preview_service.read(path)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except PreviewUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except PreviewBusy as e:
+            return Response(
+                {'error': str(e), 'retry_after': settings.PREVIEW_RETRY_AFTER},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(settings.PREVIEW_RETRY_AFTER)},
+            )
+        except Exception as e:
+            logger.exception("Error rendering preview of file %s: %s", pk, e)
+            return Response({'error': 'Error rendering preview'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        response = HttpResponse(data, content_type=spec.content_type, headers=headers)
+        response['Content-Length'] = len(data)
+        return response
+
+    @action(detail=False, methods=['get', 'head'], url_path=r'by-hash/(?P<file_hash>[0-9a-fA-F]{64})')
+    def by_hash(self, request, file_hash=None):
+        """Let clients check whether the vault already holds some content."""
+        file_obj = self.file_service.find_by_hash(file_hash)
+        if not file_obj:
+            return Response(
+                {'error': 'File not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        response = Response(self.get_serializer(file_obj).data)
+        response['ETag'] = f'"{file_obj.file_hash}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='by-hash', parser_classes=[JSONParser])
+    def by_hashes(self, request):
+        """Batch form of by_hash: POST {"hashes": [...]} and get back which exist."""
+        hashes = request.data.get('hashes') if isinstance(request.data, dict) else None
+        if not isinstance(hashes, list):
+            return Response(
+                {'error': 'Expected a JSON body with a "hashes" list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(hashes) > settings.HASH_LOOKUP_MAX_BATCH:
+            return Response(
+                {'error': f'At most {settings.HASH_LOOKUP_MAX_BATCH} hashes per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        invalid = [h for h in hashes if not isinstance(h, str) or not SHA256_RE.fullmatch(h)]
+        if invalid:
+            return Response(
+                {'error': 'Invalid SHA-256 hashes', 'invalid': invalid[:20]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        found = self.file_service.find_by_hashes(hashes)
+        return Response({
+            'found': {
+                file_hash: {
+                    'id': file_obj.id,
+                    'filename': file_obj.original_filename,
+                    'size': file_obj.size
+                }
+                for file_hash, file_obj in found.items()
+            },
+            'missing': sorted({h.lower() for h in hashes} - found.keys())
+        })
+
+    @action(detail=False, methods=['get'], url_path='hash-index')
+    def hash_index(self, request):
+        """Counters for this worker's negative-lookup hash index."""
+        return Response(hash_index.get_stats())
+
+    @action(detail=False, methods=['get'], url_path='metadata-cache')
+    def metadata_cache(self, request):
+        """Hit rates of this worker's metadata cache."""
+        return Response(metadata_cache.get_stats())
+
+    @action(detail=False, methods=['get'])
+    def admission(self, request):
+        """Upload slots and bytes in flight across the host, with this worker's disk state and rejections."""
+        return Response(admission.get_state())
+
+    @action(detail=False, methods=['get'])
+    def jobs(self, request):
+        """Job counts per kind and status in the post-upload job queue."""
+        return Response(get_job_queue().get_stats())
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
         try:
             logger.debug("Processing stats request")
+            group_by = request.query_params.get('group_by')
+            if group_by:
+                if group_by not in ('file_type', 'day'):
+                    return Response(
+                        {'error': "group_by must be 'file_type' or 'day'"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                return Response(self.file_service.get_storage_stats_breakdown(group_by))
             stats = self.file_service.get_storage_stats()
-            logger.debug(f"Successfully retrieved stats: {stats}")
+            logger.debug("Successfully retrieved stats: %s", stats)
             return Response(stats)
         except Exception as e:
-            logger.error(f"Error in stats view: {str(e)}")
+            logger.error("Error in stats view: %s", e)
             return Response(
                 {
                     'error': 'Failed to retrieve storage statistics',
@@ -191,3 +520,81 @@ class FileViewSet(viewsets.ModelViewSet):
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class UploadSessionViewSet(InstrumentedViewSetMixin, viewsets.GenericViewSet):
+    """Resumable uploads: open a session, PUT chunks in any order, then commit."""
+    queryset = UploadSession.objects.prefetch_related('chunks')
+    serializer_class = UploadSessionSerializer
+    parser_classes = (JSONParser, FormParser, MultiPartParser)
+    metrics_view = 'uploads'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_service = UploadSessionService()
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            session = self.upload_service.open_session(
+                serializer.validated_data['original_filename'],
+                serializer.validated_data['total_size'],
+                serializer.validated_data.get('chunk_size'),
+            )
+        except UploadSessionError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def destroy(self, request, *args, **kwargs):
+        session = self.get_object()
+        if session.status == UploadSession.STATUS_COMMITTING:
+            return Response({'error': 'Upload session is being committed'}, status=status.HTTP_409_CONFLICT)
+        self.upload_service.discard_chunks(session)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<index>\d+)')
+    def chunk(self, request, pk=None, index=None):
+        session = self.get_object()
+        try:
+            chunk = self.upload_service.write_chunk(
+                session,
+                int(index),
+                request.stream,
+                checksum=request.headers.get('X-Chunk-Sha256'),
+            )
+        except UploadSessionError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception("Error storing chunk %s of session %s: %s", index, pk, e)
+            return Response(
+                {
+                    'error': 'Error storing chunk',
+                    'detail': str(e)
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response({'index': chunk.index, 'size': chunk.size})
+
+    @action(detail=True, methods=['post'])
+    def commit(self, request, pk=None):
+        session = self.get_object()
+        try:
+            file_obj, _ = self.upload_service.commit_session(session)
+        except UploadSessionError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception("Error committing upload session %s: %s", pk, e)
+            return Response(
+                {
+                    'error': 'Error processing file',
+                    'detail': str(e)
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return Response(FileSerializer(file_obj, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED)
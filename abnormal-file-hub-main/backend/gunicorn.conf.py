@@ -0,0 +1,16 @@
+"""Gunicorn settings read from the working directory (see Dockerfile and start.sh)."""
+import os
+
+# Proxies whose X-Forwarded-For/-Proto uvicorn trusts for the ASGI scope's
+# client address; docker-compose sets "*" because only nginx reaches the backend
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+
+def post_worker_init(worker):
+    """Warm per-worker state before the worker takes its first request."""
+    from django.db import connections
+    from files.hash_index import hash_index
+
+    hash_index.start()
+    # The event loop thread must not keep a sync connection open
+    connections.close_all()
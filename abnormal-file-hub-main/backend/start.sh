@@ -11,4 +11,4 @@ python manage.py migrate
 
 # Start server
 echo "Starting server..."
-gunicorn --bind 0.0.0.0:8000 core.wsgi:application 
\ No newline at end of file
+gunicorn --bind 0.0.0.0:8000 -k uvicorn.workers.UvicornWorker core.asgi:application 
\ No newline at end of file
@@ -6,15 +6,23 @@ import { StorageStats } from './components/StorageStats';
 
 function App() {
   const [files, setFiles] = useState<File[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | undefined>(undefined);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [storageStats, setStorageStats] = useState<StorageStatsType | null>(null);
 
   const loadFiles = async (filters?: SearchFilters) => {
     try {
       setLoading(true);
-      const data = filters ? await fileService.searchFiles(filters) : await fileService.getFiles();
-      setFiles(data);
+      if (filters) {
+        setFiles(await fileService.searchFiles(filters));
+        setNextCursor(undefined);
+      } else {
+        const page = await fileService.getFilesPage();
+        setFiles(page.results);
+        setNextCursor(fileService.getNextCursor(page));
+      }
       setError(null);
     } catch (err) {
       setError('Failed to load files');
@@ -24,6 +32,21 @@ function App() {
     }
   };
 
+  const loadMoreFiles = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const page = await fileService.getFilesPage(nextCursor);
+      setFiles((current) => [...current, ...page.results]);
+      setNextCursor(fileService.getNextCursor(page));
+    } catch (err) {
+      setError('Failed to load more files');
+      console.error('Error loading more files:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const loadStorageStats = async () => {
     try {
       const stats = await fileService.getStorageStats();
@@ -39,21 +62,24 @@ function App() {
   }, []);
 
   const handleFileUpload = async (event: React.ChangeEvent<HTMLInputElement>) => {
-    const file = event.target.files?.[0];
-    if (!file) return;
+    const selected = Array.from(event.target.files ?? []);
+    event.target.value = '';
+    if (selected.length === 0) return;
 
     try {
       setLoading(true);
-      await fileService.uploadFile(file);
+      // Several files go in one batch request instead of one request each
+      let failed = 0;
+      if (selected.length === 1) {
+        await fileService.uploadFile(selected[0]);
+      } else {
+        failed = (await fileService.uploadFiles(selected)).errors;
+      }
       await loadFiles();
       await loadStorageStats();
-      setError(null);
+      setError(failed > 0 ? `${failed} of ${selected.length} files failed to upload` : null);
     } catch (err: any) {
-      if (err.response?.status === 409) {
-        setError(err.response.data.message || 'Duplicate file detected');
-      } else {
-        setError('Failed to upload file');
-      }
+      setError('Failed to upload file');
       console.error('Error uploading file:', err);
     } finally {
       setLoading(false);
@@ -102,15 +128,28 @@ function App() {
             <div className="bg-white shadow sm:rounded-lg">
               <div className="px-4 py-5 sm:px-6 flex justify-between items-center">
                 <h2 className="text-lg leading-6 font-medium text-gray-900">Files</h2>
-                <label className="cursor-pointer bg-indigo-600 text-white px-4 py-2 rounded-md hover:bg-indigo-700">
-                  Upload File
-                  <input
-                    type="file"
-                    className="hidden"
-                    onChange={handleFileUpload}
-                    disabled={loading}
-                  />
-                </label>
+                <div className="flex space-x-2">
+                  {files.length > 1 && (
+                    // One streamed archive of the listed files instead of a download each
+                    <button
+                      onClick={() => fileService.downloadArchive(files.map((file) => file.id))}
+                      disabled={loading}
+                      className="bg-white text-indigo-600 border border-indigo-600 px-4 py-2 rounded-md hover:bg-indigo-50 disabled:opacity-50"
+                    >
+                      Download all as ZIP
+                    </button>
+                  )}
+                  <label className="cursor-pointer bg-indigo-600 text-white px-4 py-2 rounded-md hover:bg-indigo-700">
+                    Upload Files
+                    <input
+                      type="file"
+                      multiple
+                      className="hidden"
+                      onChange={handleFileUpload}
+                      disabled={loading}
+                    />
+                  </label>
+                </div>
               </div>
 
               {error && (
@@ -123,11 +162,6 @@ function App() {
                     </div>
                     <div className="ml-3">
                       <p className="text-sm font-medium text-red-800">{error}</p>
-                      {error.includes('Duplicate file detected.') && (
-                        <p className="mt-1 text-sm text-red-700">
-                          Please choose a different file.
-                        </p>
-                      )}
                     </div>
                   </div>
                 </div>
@@ -195,6 +229,17 @@ function App() {
                       ))}
                     </tbody>
                   </table>
+                  {nextCursor && (
+                    <div className="flex justify-center py-4">
+                      <button
+                        onClick={loadMoreFiles}
+                        disabled={loadingMore}
+                        className="px-4 py-2 text-sm font-medium text-indigo-600 hover:text-indigo-900 disabled:opacity-50"
+                      >
+                        {loadingMore ? 'Loading...' : 'Load more'}
+                      </button>
+                    </div>
+                  )}
                 </div>
               )}
             </div>
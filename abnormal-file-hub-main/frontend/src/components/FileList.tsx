@@ -1,18 +1,45 @@
 import React, { useState } from 'react';
 import { fileService } from '../services/fileService';
 import { File as FileType } from '../types/file';
-import { DocumentIcon, TrashIcon, ArrowDownTrayIcon } from '@heroicons/react/24/outline';
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
+import { DocumentIcon, TrashIcon, ArrowDownTrayIcon, ArchiveBoxArrowDownIcon } from '@heroicons/react/24/outline';
+import { useInfiniteQuery, useMutation, useQueryClient } from '@tanstack/react-query';
+
+const FileThumbnail: React.FC<{ file: FileType }> = ({ file }) => {
+  const [failed, setFailed] = useState(false);
+
+  if (file.preview_type !== 'image' || failed) {
+    return <DocumentIcon className="h-8 w-8 text-gray-400" />;
+  }
+  return (
+    <img
+      src={fileService.getPreviewUrl(file.id, 128)}
+      alt=""
+      loading="lazy"
+      onError={() => setFailed(true)}
+      className="h-12 w-12 rounded object-cover bg-gray-100"
+    />
+  );
+};
 
 export const FileList: React.FC = () => {
   const queryClient = useQueryClient();
   const [error, setError] = useState<string | null>(null);
 
-  // Query for fetching files
-  const { data: files, isLoading, error: fetchError } = useQuery({
+  // Query for fetching files, one cursor page at a time
+  const {
+    data,
+    isLoading,
+    error: fetchError,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery({
     queryKey: ['files'],
-    queryFn: fileService.getFiles,
+    queryFn: ({ pageParam }) => fileService.getFilesPage(pageParam),
+    initialPageParam: undefined as string | undefined,
+    getNextPageParam: (lastPage) => fileService.getNextCursor(lastPage),
   });
+  const files = data?.pages.flatMap((page) => page.results);
 
   // Mutation for deleting files
   const deleteMutation = useMutation({
@@ -103,7 +130,19 @@ export const FileList: React.FC = () => {
 
   return (
     <div className="p-6">
-      <h2 className="text-xl font-semibold text-gray-900 mb-4">Uploaded Files</h2>
+      <div className="flex justify-between items-center mb-4">
+        <h2 className="text-xl font-semibold text-gray-900">Uploaded Files</h2>
+        {files && files.length > 1 && (
+          // One streamed archive of the loaded files instead of a download each
+          <button
+            onClick={() => fileService.downloadArchive(files.map((file) => file.id))}
+            className="inline-flex items-center px-3 py-2 border border-transparent shadow-sm text-sm leading-4 font-medium rounded-md text-white bg-primary-600 hover:bg-primary-700 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-primary-500"
+          >
+            <ArchiveBoxArrowDownIcon className="h-4 w-4 mr-1" />
+            Download all as ZIP
+          </button>
+        )}
+      </div>
       
       {error && (
         <div className="mb-4 bg-red-50 border-l-4 border-red-400 p-4">
@@ -143,7 +182,7 @@ export const FileList: React.FC = () => {
               <li key={file.id} className="py-4">
                 <div className="flex items-center space-x-4">
                   <div className="flex-shrink-0">
-                    <DocumentIcon className="h-8 w-8 text-gray-400" />
+                    <FileThumbnail file={file} />
                   </div>
                   <div className="flex-1 min-w-0">
                     <p className="text-sm font-medium text-gray-900 truncate">
@@ -178,6 +217,17 @@ export const FileList: React.FC = () => {
               </li>
             ))}
           </ul>
+          {hasNextPage && (
+            <div className="flex justify-center mt-6">
+              <button
+                onClick={() => fetchNextPage()}
+                disabled={isFetchingNextPage}
+                className="px-4 py-2 text-sm font-medium text-primary-600 hover:text-primary-700 disabled:opacity-50"
+              >
+                {isFetchingNextPage ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
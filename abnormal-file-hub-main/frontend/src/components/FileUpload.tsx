@@ -1,4 +1,5 @@
 import React, { useState } from 'react';
+import axios from 'axios';
 import { fileService } from '../services/fileService';
 import { CloudArrowUpIcon } from '@heroicons/react/24/outline';
 import { useMutation, useQueryClient } from '@tanstack/react-query';
@@ -8,44 +9,52 @@ interface FileUploadProps {
 }
 
 export const FileUpload: React.FC<FileUploadProps> = ({ onUploadSuccess }) => {
-  const [selectedFile, setSelectedFile] = useState<File | null>(null);
+  const [selectedFiles, setSelectedFiles] = useState<File[]>([]);
   const [error, setError] = useState<string | null>(null);
   const queryClient = useQueryClient();
 
   const uploadMutation = useMutation({
-    mutationFn: fileService.uploadFile,
+    // Several files go in one batch request instead of one request each
+    mutationFn: async (files: File[]) => {
+      if (files.length === 1) {
+        await fileService.uploadFile(files[0]);
+        return;
+      }
+      const result = await fileService.uploadFiles(files);
+      if (result.errors > 0) {
+        throw new Error(`${result.errors} of ${files.length} files failed to upload`);
+      }
+    },
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ['files'] });
-      setSelectedFile(null);
+      setSelectedFiles([]);
       setError(null);
       onUploadSuccess();
     },
     onError: (error: any) => {
-      if (error.response?.status === 409) {
-        setError(error.response.data.message || 'Duplicate file detected');
-      } else {
-        setError('Failed to upload file. Please try again.');
-      }
+      // Partly failed batches still stored the other files
+      queryClient.invalidateQueries({ queryKey: ['files'] });
+      setError(axios.isAxiosError(error) ? 'Failed to upload file. Please try again.' : error.message);
       console.error('Upload error:', error);
     },
   });
 
   const handleFileSelect = (event: React.ChangeEvent<HTMLInputElement>) => {
-    if (event.target.files && event.target.files[0]) {
-      setSelectedFile(event.target.files[0]);
+    if (event.target.files && event.target.files.length > 0) {
+      setSelectedFiles(Array.from(event.target.files));
       setError(null);
     }
   };
 
   const handleUpload = async () => {
-    if (!selectedFile) {
+    if (selectedFiles.length === 0) {
       setError('Please select a file');
       return;
     }
 
     try {
       setError(null);
-      await uploadMutation.mutateAsync(selectedFile);
+      await uploadMutation.mutateAsync(selectedFiles);
     } catch (err) {
       // Error handling is done in onError callback
     }
@@ -65,11 +74,12 @@ export const FileUpload: React.FC<FileUploadProps> = ({ onUploadSuccess }) => {
                 htmlFor="file-upload"
                 className="relative cursor-pointer bg-white rounded-md font-medium text-primary-600 hover:text-primary-500 focus-within:outline-none focus-within:ring-2 focus-within:ring-offset-2 focus-within:ring-primary-500"
               >
-                <span>Upload a file</span>
+                <span>Upload files</span>
                 <input
                   id="file-upload"
                   name="file-upload"
                   type="file"
+                  multiple
                   className="sr-only"
                   onChange={handleFileSelect}
                   disabled={uploadMutation.isPending}
@@ -80,9 +90,9 @@ export const FileUpload: React.FC<FileUploadProps> = ({ onUploadSuccess }) => {
             <p className="text-xs text-gray-500">Any file up to 10MB</p>
           </div>
         </div>
-        {selectedFile && (
+        {selectedFiles.length > 0 && (
           <div className="text-sm text-gray-600">
-            Selected: {selectedFile.name}
+            Selected: {selectedFiles.map((file) => file.name).join(', ')}
           </div>
         )}
         {error && (
@@ -92,9 +102,9 @@ export const FileUpload: React.FC<FileUploadProps> = ({ onUploadSuccess }) => {
         )}
         <button
           onClick={handleUpload}
-          disabled={!selectedFile || uploadMutation.isPending}
+          disabled={selectedFiles.length === 0 || uploadMutation.isPending}
           className={`w-full flex justify-center py-2 px-4 border border-transparent rounded-md shadow-sm text-sm font-medium text-white ${
-            !selectedFile || uploadMutation.isPending
+            selectedFiles.length === 0 || uploadMutation.isPending
               ? 'bg-gray-300 cursor-not-allowed'
               : 'bg-primary-600 hover:bg-primary-700 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-primary-500'
           }`}
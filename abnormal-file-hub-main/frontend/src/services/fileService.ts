@@ -19,6 +19,41 @@ export interface StorageStats {
   unique_size_bytes: number;
   storage_savings_bytes: number;
   storage_savings_percentage: number;
+  chunk_count: number;
+  chunk_logical_size_bytes: number;
+  chunk_stored_size_bytes: number;
+  chunk_savings_bytes: number;
+  chunk_savings_percentage: number;
+  compression_logical_size_bytes: number;
+  compression_stored_size_bytes: number;
+  compression_savings_bytes: number;
+  compression_savings_percentage: number;
+}
+
+export interface FilePage {
+  next: string | null;
+  results: FileType[];
+}
+
+export interface BatchUploadItem {
+  index: number;
+  filename: string;
+  status: 'created' | 'duplicate' | 'error';
+  file?: FileType;
+  duplicate_of?: {
+    id: string;
+    filename: string;
+    uploaded_at: string;
+    size: number;
+  };
+  error?: string;
+}
+
+export interface BatchUploadResult {
+  created: number;
+  duplicates: number;
+  errors: number;
+  results: BatchUploadItem[];
 }
 
 export const fileService = {
@@ -26,27 +61,54 @@ export const fileService = {
     const formData = new FormData();
     formData.append('file', file);
 
-    try {
-      const response = await axios.post(`${API_URL}/files/`, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
-      });
-      return response.data;
-    } catch (error: any) {
-      if (error.response?.status === 409) {
-        // Pass through the error response from the backend
-        throw error;
-      }
-      throw error;
-    }
+    // Duplicates are accepted too: the response is a new row with is_duplicate set
+    const response = await axios.post(`${API_URL}/files/`, formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    });
+    return response.data;
+  },
+
+  async uploadFiles(files: File[]): Promise<BatchUploadResult> {
+    const formData = new FormData();
+    files.forEach((file) => formData.append('files', file));
+
+    const response = await axios.post(`${API_URL}/files/batch/`, formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    });
+    return response.data;
   },
 
   async getFiles(): Promise<FileType[]> {
-    const response = await axios.get(`${API_URL}/files/`);
+    // Every file, following the cursor through all pages; lists shown to
+    // users should page with getFilesPage instead
+    const files: FileType[] = [];
+    let cursor: string | undefined;
+    do {
+      const page = await fileService.getFilesPage(cursor);
+      files.push(...page.results);
+      cursor = fileService.getNextCursor(page);
+    } while (cursor);
+    return files;
+  },
+
+  async getFilesPage(cursor?: string): Promise<FilePage> {
+    const params = new URLSearchParams();
+    if (cursor) params.append('cursor', cursor);
+
+    const response = await axios.get(`${API_URL}/files/`, { params });
     return response.data;
   },
 
+  getNextCursor(page: FilePage): string | undefined {
+    // `next` is a full URL; only its cursor is needed for the next request
+    if (!page.next) return undefined;
+    return new URL(page.next).searchParams.get('cursor') ?? undefined;
+  },
+
   async searchFiles(filters: SearchFilters): Promise<FileType[]> {
     const params = new URLSearchParams();
     
@@ -65,10 +127,31 @@ export const fileService = {
     return response.data;
   },
 
+  getPreviewUrl(id: string, size?: number): string {
+    // Previews are served with immutable cache headers, so <img> tags can
+    // point straight at the endpoint and let the browser cache them.
+    const query = size ? `?size=${size}` : '';
+    return `${API_URL}/files/${id}/preview/${query}`;
+  },
+
   async deleteFile(id: string): Promise<void> {
     await axios.delete(`${API_URL}/files/${id}/`);
   },
 
+  downloadArchive(ids: string[], archiveFormat: 'zip' | 'tar' = 'zip'): void {
+    // Navigate to the archive URL so the browser streams it to disk
+    // instead of buffering the whole archive in a Blob.
+    const params = new URLSearchParams();
+    params.append('ids', ids.join(','));
+    params.append('archive_format', archiveFormat);
+
+    const link = document.createElement('a');
+    link.href = `${API_URL}/files/archive/?${params.toString()}`;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+  },
+
   async downloadFile(id: string, filename: string): Promise<void> {
     if (!id) {
       throw new Error('Invalid file ID');
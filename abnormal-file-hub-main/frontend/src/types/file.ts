@@ -17,4 +17,7 @@ export interface File {
   };
   reference_count: number;
   duplicates_count: number;
+  content_encoding: string;
+  stored_size: number | null;
+  preview_type: 'image' | 'text' | null;
 } 
\ No newline at end of file